@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""文档处理端到端基准测试
+
+生成合成语料(嵌套目录、GBK文件名的ZIP档案包和多页扫描PDF)，
+用内存数据库或本地MySQL/MariaDB运行 DocumentProcessor.process_file，
+输出吞吐量、各阶段耗时分位数和内存峰值。
+
+    python -m benchmarks.bench_process --zip-pages 500 --pdf-pages 100
+    python -m benchmarks.bench_process --json result.json
+    python -m benchmarks.bench_process --baseline result.json --tolerance 0.1
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class StageStats:
+    """记录各阶段耗时"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage, func):
+        """包装函数，记录每次调用的耗时"""
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return wrapper
+
+    @staticmethod
+    def percentile(values, fraction):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+        return ordered[index]
+
+    def summary(self):
+        return {
+            stage: {
+                'count': len(values),
+                'total': sum(values),
+                'p50': self.percentile(values, 0.50),
+                'p90': self.percentile(values, 0.90),
+                'p99': self.percentile(values, 0.99),
+                'max': max(values),
+            }
+            for stage, values in sorted(self.samples.items())
+        }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='文档处理端到端基准测试')
+    parser.add_argument('--workdir', help='工作目录，语料在多次运行之间复用(默认使用临时目录)')
+    parser.add_argument('--zip-pages', type=int, default=200, help='ZIP档案包页数')
+    parser.add_argument('--pdf-pages', type=int, default=50, help='PDF页数')
+    parser.add_argument('--formats', default='jpg,png', help='ZIP中图片格式，逗号分隔: jpg,png,tif')
+    parser.add_argument('--width', type=int, default=1240, help='页面宽度(像素)')
+    parser.add_argument('--height', type=int, default=1754, help='页面高度(像素)')
+    parser.add_argument('--repeat', type=int, default=1, help='每个文件处理的次数')
+    parser.add_argument('--concurrency', type=int, default=1, help='同时处理的任务数')
+    parser.add_argument('--db-latency', type=float, default=0.0, help='内存数据库每次查询模拟的延迟(毫秒)')
+    parser.add_argument('--mysql', action='store_true', help='使用配置文件中的MySQL/MariaDB代替内存数据库')
+    parser.add_argument('--document-id', type=int, default=900000,
+                        help='MySQL模式下基准任务使用的起始文档ID，每个任务一个文档，这些文档不能已有页面')
+    parser.add_argument('--cache', action='store_true', help='启用页面转换缓存')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    parser.add_argument('--baseline', help='与之前保存的JSON结果比较吞吐量')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='吞吐量允许下降的比例')
+    return parser.parse_args(argv)
+
+def setup_environment(args, workdir):
+    """在导入处理器之前设置配置，所有输出写入工作目录"""
+    config_path = os.path.join(workdir, 'config.yaml')
+    if not os.path.exists(config_path):
+        shutil.copyfile(os.path.join(ROOT_DIR, 'config.example.yaml'), config_path)
+
+    storage_dir = os.path.join(workdir, 'storage')
+    shutil.rmtree(storage_dir, ignore_errors=True)
+
+    os.environ.setdefault('CONFIG_PATH', config_path)
+    os.environ['FILE_PATH_PREFIX'] = workdir
+    os.environ['TEMP_DIR_PREFIX'] = os.path.join(storage_dir, 'temp')
+    os.environ['CHECKPOINT_DIR'] = os.path.join(storage_dir, 'checkpoints')
+    os.environ['DOCUMENT_PAGE_PATH'] = '/storage/uploads/documents/{document_id}/pages/{random_string}-{title}_{page_number}.jpg'
+    os.environ['PAGE_CACHE_DIR'] = os.path.join(storage_dir, 'cache') if args.cache else ''
+    # 基准直接调用 process_file，不经过调度器领取分片任务，PDF按整本处理
+    os.environ['PDF_SHARD_PAGES'] = '0'
+    # 不占用指标服务端口，可以与正在运行的服务同时运行
+    os.environ['METRICS_PORT'] = '0'
+
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+def instrument(stats, processor):
+    """为处理器的各阶段添加计时"""
+    from services.file_service import FileService
+
+    for name in ('scan_zip', 'scan_directory', 'extract_zip'):
+        setattr(FileService, name, staticmethod(stats.wrap(f"file.{name}", getattr(FileService, name))))
+
+    processor.convert_service.convert_page = stats.wrap('page.convert', processor.convert_service.convert_page)
+
+    db_service = processor.db_service
+    for name in ('insert_directories', 'insert_pages', 'get_page_numbers', 'commit', 'update_task_status'):
+        setattr(db_service, name, stats.wrap(f"db.{name}", getattr(db_service, name)))
+
+    processor.process_file = stats.wrap('task', processor.process_file)
+
+def peak_rss_mb():
+    """当前进程及已结束子进程(转换进程池、poppler)的内存峰值(MB)"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return round(own, 1), round(children, 1)
+
+async def create_mysql_tasks(db_service, corpus, repeat, first_document_id):
+    """在数据库中插入基准任务并通过 claim_tasks 领取，提交时的任务归属检查与正式运行相同"""
+    document_ids = [first_document_id + index for index in range(len(corpus) * repeat)]
+    placeholders = ','.join(['%s'] * len(document_ids))
+    task_ids = []
+
+    async with db_service.pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"SELECT COUNT(*) FROM ww_document_pages WHERE document_id IN ({placeholders})", document_ids
+            )
+            if (await cur.fetchone())[0]:
+                raise RuntimeError(f"文档ID {document_ids[0]}-{document_ids[-1]} 已有页面，请用 --document-id 指定其他范围")
+
+            for index, document_id in enumerate(document_ids):
+                file_name, _ = corpus[index % len(corpus)]
+                file_path = f"/corpus/{file_name}"
+                await cur.execute("""
+                    INSERT INTO ww_document_files (document_id, file_path, file_size) VALUES (%s, %s, %s)
+                """, (document_id, file_path, os.path.getsize(os.environ['FILE_PATH_PREFIX'] + file_path)))
+                await cur.execute("""
+                    INSERT INTO ww_document_file_tasks
+                    (document_id, document_file_id, document_directory_id, file_type, status, retry_count,
+                     created_at, updated_at)
+                    VALUES (%s, %s, 0, %s, '未处理', 0, NOW(), NOW())
+                """, (document_id, cur.lastrowid, 'PDF' if file_name.lower().endswith('.pdf') else '档案包'))
+                task_ids.append(cur.lastrowid)
+
+        await conn.commit()
+
+    tasks = await db_service.claim_tasks(task_ids, len(task_ids))
+    if len(tasks) != len(task_ids):
+        raise RuntimeError(f"基准任务被其他节点领取，仅领取到 {len(tasks)}/{len(task_ids)} 个")
+    return tasks
+
+async def finish_mysql_tasks(db_service, tasks):
+    """读取基准任务的最终状态，返回未完成的任务ID，并删除基准写入的数据"""
+    task_ids = [task['id'] for task in tasks]
+    document_ids = [task['document_id'] for task in tasks]
+    file_ids = [task['document_file_id'] for task in tasks]
+
+    async with db_service.pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"SELECT id, status FROM ww_document_file_tasks WHERE id IN ({','.join(['%s'] * len(task_ids))})",
+                task_ids
+            )
+            failed = [task_id for task_id, status in await cur.fetchall() if status != '已完成']
+
+            for table, column, ids in (
+                ('ww_document_pages', 'document_id', document_ids),
+                ('ww_document_directories', 'document_id', document_ids),
+                ('ww_document_file_tasks', 'id', task_ids),
+                ('ww_document_files', 'id', file_ids),
+            ):
+                await cur.execute(f"DELETE FROM {table} WHERE {column} IN ({','.join(['%s'] * len(ids))})", ids)
+
+        await conn.commit()
+
+    return sorted(failed)
+
+async def run_benchmark(args, workdir):
+    from benchmarks.corpus import make_corpus
+    from benchmarks.fake_db import FakeDatabaseService
+    from main import DocumentProcessor
+    from services.convert_service import ConvertService
+
+    formats = tuple(fmt.strip() for fmt in args.formats.split(',') if fmt.strip())
+    corpus = make_corpus(
+        os.path.join(workdir, 'corpus'), args.zip_pages, args.pdf_pages, formats, args.width, args.height
+    )
+
+    processor = DocumentProcessor()
+    if args.mysql:
+        await processor.init()
+    else:
+        processor.db_service = FakeDatabaseService(args.db_latency / 1000)
+        processor.convert_service = ConvertService()
+        await processor.convert_service.init()
+
+    stats = StageStats()
+    instrument(stats, processor)
+
+    if args.mysql:
+        tasks = await create_mysql_tasks(processor.db_service, corpus, args.repeat, args.document_id)
+    else:
+        tasks = []
+        for round_index in range(args.repeat):
+            for file_index, (file_name, _) in enumerate(corpus):
+                task_id = round_index * len(corpus) + file_index + 1
+                tasks.append({
+                    'id': task_id,
+                    'document_id': 900000 + task_id,
+                    'document_directory_id': 0,
+                    'file_path': f"/corpus/{file_name}",
+                    'retry_count': 0,
+                })
+    total_pages = sum(pages for _, pages in corpus) * args.repeat
+
+    semaphore = asyncio.Semaphore(max(args.concurrency, 1))
+
+    async def run_task(task):
+        async with semaphore:
+            await processor.process_file(task)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_task(task) for task in tasks))
+    finally:
+        elapsed = time.perf_counter() - start
+        processor.convert_service.shutdown()
+
+    if args.mysql:
+        failed = await finish_mysql_tasks(processor.db_service, tasks)
+        processor.pool.close()
+        await processor.pool.wait_closed()
+    else:
+        failed = [
+            task_id for task_id, (status, _) in processor.db_service.task_status.items()
+            if status != '已完成'
+        ]
+
+    rss_self, rss_children = peak_rss_mb()
+    result = {
+        'pages': total_pages,
+        'tasks': len(tasks),
+        'failed_tasks': failed,
+        'elapsed': elapsed,
+        'pages_per_sec': total_pages / elapsed if elapsed else 0.0,
+        'peak_rss_mb': rss_self,
+        'peak_rss_children_mb': rss_children,
+        'stages': stats.summary(),
+    }
+    if processor.convert_service.cache:
+        result['cache'] = processor.convert_service.cache.stats()
+    return result
+
+def print_report(result):
+    print(f"页数: {result['pages']}  任务数: {result['tasks']}  耗时: {result['elapsed']:.2f}s")
+    print(f"吞吐量: {result['pages_per_sec']:.1f} 页/秒")
+    print(f"内存峰值: 主进程 {result['peak_rss_mb']} MB, 子进程 {result['peak_rss_children_mb']} MB")
+    if result.get('cache'):
+        print(f"页面缓存: {result['cache']}")
+    if result['failed_tasks']:
+        print(f"失败的任务: {result['failed_tasks']}")
+
+    print(f"{'阶段':<28}{'次数':>8}{'合计(s)':>10}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for stage, item in result['stages'].items():
+        print(
+            f"{stage:<28}{item['count']:>8}{item['total']:>10.2f}"
+            f"{item['p50'] * 1000:>10.1f}{item['p90'] * 1000:>10.1f}{item['p99'] * 1000:>10.1f}{item['max'] * 1000:>10.1f}"
+        )
+
+def compare_baseline(result, baseline_path, tolerance):
+    """吞吐量低于基线超过允许比例时返回 False"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    ratio = result['pages_per_sec'] / baseline['pages_per_sec'] if baseline['pages_per_sec'] else 1.0
+    print(f"与基线相比吞吐量: {ratio:.2%} (基线 {baseline['pages_per_sec']:.1f} 页/秒)")
+    return ratio >= 1 - tolerance
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='edoc-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    setup_environment(args, workdir)
+
+    result = asyncio.run(run_benchmark(args, workdir))
+    print_report(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if result['failed_tasks']:
+        return 1
+    if args.baseline and not compare_baseline(result, args.baseline, args.tolerance):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import random
+import zipfile
+from PIL import Image, ImageDraw
+
+class GbkZipInfo(zipfile.ZipInfo):
+    """以GBK编码写入文件名的ZIP成员，模拟Windows压缩软件生成的档案包"""
+
+    def _encodeFilenameFlags(self):
+        return self.filename.encode('gbk'), self.flag_bits
+
+def make_page_image(page_number, width, height, seed=0):
+    """生成一张带文字线条和噪点的模拟扫描页"""
+    rng = random.Random(seed * 100003 + page_number)
+    img = Image.new('RGB', (width, height), (245, 243, 235))
+    draw = ImageDraw.Draw(img)
+
+    for y in range(height // 20, height - height // 20, max(height // 40, 4)):
+        x_end = rng.randint(width // 2, width - width // 20)
+        draw.line((width // 20, y, x_end, y), fill=(40, 40, 40), width=max(height // 400, 1))
+
+    for _ in range(width * height // 400):
+        x, y = rng.randrange(width), rng.randrange(height)
+        img.putpixel((x, y), (rng.randint(150, 255),) * 3)
+
+    draw.text((width // 20, height // 60), f"page {page_number}", fill=(0, 0, 0))
+    return img
+
+def encode_image(img, fmt):
+    """按格式编码图片"""
+    buffer = io.BytesIO()
+    if fmt == 'png':
+        img.save(buffer, 'PNG')
+    elif fmt == 'tif':
+        img.save(buffer, 'TIFF')
+    else:
+        img.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+def make_zip(path, pages=200, depth=2, fanout=3, formats=('jpg',), width=1240, height=1754, seed=0):
+    """生成带嵌套 起始页-名称-编号 目录和GBK文件名的档案包，返回页数"""
+    directories = ['']
+    for level in range(depth):
+        directories = [
+            f"{parent}{index * 10 + 1}-第{level + 1}级目录{index + 1}-A{level}{index:02d}/"
+            for parent in directories for index in range(fanout)
+        ]
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        for directory in directories:
+            if directory:
+                zip_ref.writestr(GbkZipInfo(directory), b'')
+
+        for page_number in range(1, pages + 1):
+            directory = directories[(page_number - 1) * len(directories) // pages]
+            fmt = formats[page_number % len(formats)]
+            name = f"{directory}档案页面_{page_number:04d}.{fmt}"
+            data = encode_image(make_page_image(page_number, width, height, seed), fmt)
+            zip_ref.writestr(GbkZipInfo(name, date_time=(2024, 1, 1, 0, 0, 0)), data)
+
+    return pages
+
+def make_pdf(path, pages=50, width=1240, height=1754, seed=0):
+    """生成每页为一张JPEG的多页PDF(扫描件)，返回页数"""
+    images = [make_page_image(page_number, width, height, seed) for page_number in range(1, pages + 1)]
+    images[0].save(path, 'PDF', save_all=True, append_images=images[1:], resolution=150)
+    return pages
+
+def make_corpus(corpus_dir, zip_pages=200, pdf_pages=50, formats=('jpg',), width=1240, height=1754, seed=0):
+    """生成基准测试语料，返回 [(相对路径, 页数)]"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    files = []
+
+    if zip_pages:
+        zip_path = os.path.join(corpus_dir, f"archive-{zip_pages}.zip")
+        if not os.path.exists(zip_path):
+            make_zip(zip_path, zip_pages, formats=formats, width=width, height=height, seed=seed)
+        files.append((os.path.basename(zip_path), zip_pages))
+
+    if pdf_pages:
+        pdf_path = os.path.join(corpus_dir, f"scan-{pdf_pages}.pdf")
+        if not os.path.exists(pdf_path):
+            make_pdf(pdf_path, pdf_pages, width=width, height=height, seed=seed)
+        files.append((os.path.basename(pdf_path), pdf_pages))
+
+    return files
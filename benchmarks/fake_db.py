@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import itertools
+from services.db_service import TaskSession
+
+class FakeConnection:
+    """内存数据库的事务连接，提交前的写入暂存在连接上"""
+
+    def __init__(self):
+        self.directories = []
+        self.pages = []
+
+    async def begin(self):
+        pass
+
+    async def commit(self):
+        pass
+
+class FakeDatabaseService:
+    """DatabaseService 的内存实现，可模拟每次查询的往返延迟"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.ids = itertools.count(1)
+        self.directories = []
+        self.pages = []
+        self.task_status = {}
+        self.queries = 0
+
+    async def _round_trip(self):
+        self.queries += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def fetch_tasks(self, max_workers):
+        await self._round_trip()
+        return []
+
+    async def fetch_candidates(self, limit):
+        await self._round_trip()
+        return []
+
+    async def claim_tasks(self, candidate_ids, max_workers, **kwargs):
+        await self._round_trip()
+        return []
+
+    async def renew_leases(self, task_ids, **kwargs):
+        await self._round_trip()
+        return set(task_ids)
+
+    async def flush_task_updates(self, updates, **kwargs):
+        await self._round_trip()
+        return len(updates)
+
+    async def reclaim_expired_tasks(self, **kwargs):
+        await self._round_trip()
+        return 0, []
+
+    async def lock_owned_task(self, task_id, conn, **kwargs):
+        await self._round_trip()
+
+    async def update_task_status(self, task_id, status, conn=None, **kwargs):
+        await self._round_trip()
+        self.task_status[task_id] = (status, kwargs)
+
+    def session(self, status_writer=None):
+        return TaskSession(self, status_writer)
+
+    async def acquire(self):
+        return FakeConnection()
+
+    def release(self, conn):
+        pass
+
+    async def begin(self, conn):
+        await self._round_trip()
+        conn.directories, conn.pages = [], []
+
+    async def commit(self, conn):
+        await self._round_trip()
+        self.directories.extend(conn.directories)
+        self.pages.extend(conn.pages)
+        conn.directories, conn.pages = [], []
+
+    async def rollback(self, conn):
+        await self._round_trip()
+        conn.directories, conn.pages = [], []
+
+    async def start_transaction(self):
+        conn = await self.acquire()
+        await self.begin(conn)
+        return conn
+
+    async def commit_transaction(self, conn):
+        await self.commit(conn)
+        self.release(conn)
+
+    async def rollback_transaction(self, conn):
+        await self.rollback(conn)
+        self.release(conn)
+
+    async def lock_document(self, document_id, conn, timeout=None):
+        await self._round_trip()
+
+    async def insert_directories(self, document_id, directories, conn=None, batch_size=None):
+        await self._round_trip()
+        directory_ids = []
+        for parent_id, name, start_page, number in directories:
+            directory_id = next(self.ids)
+            conn.directories.append((directory_id, document_id, parent_id, name, start_page, number))
+            directory_ids.append(directory_id)
+        return directory_ids
+
+    async def insert_pages(self, pages, conn=None):
+        await self._round_trip()
+        conn.pages.extend(pages)
+
+    async def get_page_numbers(self, document_id, conn=None):
+        await self._round_trip()
+        return {page[3] for page in self.pages if page[1] == document_id}
+
+    async def get_referenced_image_paths(self, image_paths, batch_size=None, conn=None):
+        await self._round_trip()
+        image_paths = set(image_paths)
+        return {page[4] for page in self.pages if page[4] in image_paths}
@@ -9,7 +9,8 @@ class Database:
         
     def _load_config(self) -> Dict:
         # 加载YAML配置文件
-        with open('config.yaml', 'r', encoding='utf-8') as f:
+        config_path = os.environ.get('CONFIG_PATH', 'config.yaml')
+        with open(config_path, 'r', encoding='utf-8') as f:
             config = yaml.safe_load(f)
             
         # 获取对应环境的配置
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import os
+import socket
 import yaml
 from typing import Dict, List, Any
 
@@ -15,6 +16,13 @@ class Settings:
         with open(config_path, 'r', encoding='utf-8') as f:
             return yaml.safe_load(f)[self.env]
 
+    def _option(self, env_name: str, section: str, key: str, default: Any) -> Any:
+        """读取可选配置项，环境变量优先，缺省时使用默认值"""
+        value = os.environ.get(env_name)
+        if value is not None:
+            return value
+        return (self._config.get(section) or {}).get(key, default)
+
     def _init_settings(self):
         """初始化所有设置"""
         # 文件路径配置
@@ -44,12 +52,247 @@ class Settings:
             self._config['task']['max_workers']
         ))
 
+        # 当前工作节点标识，记录在领取的任务上
+        self.WORKER_ID = self._option(
+            'WORKER_ID', 'task', 'worker_id', None
+        ) or f"{socket.gethostname()}-{os.getpid()}"
+
+        self.CLAIM_OVERSAMPLE = int(self._option(
+            'CLAIM_OVERSAMPLE', 'task', 'claim_oversample', 4
+        ))
+
+        # 任务租约时长(秒)，超过该时间没有心跳的处理中任务会被重新排队
+        self.LEASE_DURATION = int(self._option(
+            'LEASE_DURATION', 'task', 'lease_duration', 120
+        ))
+
+        # 心跳间隔(秒)，应明显小于租约时长
+        self.HEARTBEAT_INTERVAL = float(self._option(
+            'HEARTBEAT_INTERVAL', 'task', 'heartbeat_interval', 30
+        ))
+
+        # 处理中任务的状态和进度合并后批量写入的间隔(秒)，终态总是立即写入
+        self.STATUS_FLUSH_INTERVAL = float(self._option(
+            'STATUS_FLUSH_INTERVAL', 'task', 'status_flush_interval', 5
+        ))
+
+        # 任务准入预算(MB)：按估算的内存和临时目录磁盘占用领取任务，0 表示不限制
+        self.TASK_MEMORY_BUDGET = int(self._option(
+            'TASK_MEMORY_BUDGET', 'task', 'memory_budget', 2048
+        )) * 1024 * 1024
+
+        self.SCRATCH_DISK_BUDGET = int(self._option(
+            'SCRATCH_DISK_BUDGET', 'task', 'scratch_disk_budget', 10240
+        )) * 1024 * 1024
+
+        # 调度策略: fifo(先重试后新任务，按创建时间) / sjf(文件小的优先) / fair(各文档轮流)
+        self.SCHEDULE_POLICY = str(self._option(
+            'SCHEDULE_POLICY', 'task', 'schedule_policy', 'fifo'
+        )).lower()
+
+        # 等待超过该时间(秒)的任务不论策略优先领取，0 表示不启用
+        self.STARVATION_AGE = int(self._option(
+            'STARVATION_AGE', 'task', 'starvation_age', 3600
+        ))
+
+        # 快速通道：保留给小文件的任务槽位数，以及小文件的大小上限(MB)
+        self.FAST_LANE_SLOTS = int(self._option(
+            'FAST_LANE_SLOTS', 'task', 'fast_lane_slots', 1
+        ))
+
+        self.FAST_LANE_MAX_SIZE = int(self._option(
+            'FAST_LANE_MAX_SIZE', 'task', 'fast_lane_max_size', 50
+        )) * 1024 * 1024
+
+        self.TASK_PREFETCH = int(self._option(
+            'TASK_PREFETCH', 'task', 'prefetch', 2
+        ))
+
+        # 没有任务时的轮询间隔从最小值开始按倍数增长，最大为 IDLE_INTERVAL
+        self.IDLE_INTERVAL = float(self._option(
+            'IDLE_INTERVAL', 'task', 'idle_interval', 5
+        ))
+
+        self.IDLE_MIN_INTERVAL = float(self._option(
+            'IDLE_MIN_INTERVAL', 'task', 'idle_min_interval', 0.2
+        ))
+
+        self.IDLE_BACKOFF = float(self._option(
+            'IDLE_BACKOFF', 'task', 'idle_backoff', 2
+        ))
+
+        # 唤醒通知监听地址，收到任意UDP报文时立即领取任务，端口为 0 时不启动
+        self.WAKE_HOST = self._option(
+            'WAKE_HOST', 'wake', 'host', '127.0.0.1'
+        )
+
+        self.WAKE_PORT = int(self._option(
+            'WAKE_PORT', 'wake', 'port', 0
+        ))
+
+        # 指标服务配置，端口为 0 时不启动
+        self.METRICS_HOST = self._option(
+            'METRICS_HOST', 'metrics', 'host', '0.0.0.0'
+        )
+
+        self.METRICS_PORT = int(self._option(
+            'METRICS_PORT', 'metrics', 'port', 8001
+        ))
+
+        # 日志配置：日志在后台线程中格式化和输出，格式为 json 或 text
+        self.LOG_LEVEL = str(self._option(
+            'LOG_LEVEL', 'log', 'level', 'INFO'
+        )).upper()
+
+        self.LOG_FORMAT = str(self._option(
+            'LOG_FORMAT', 'log', 'format', 'json'
+        )).lower()
+
+        # DEBUG 级别下单个页面事件的采样比例，0 表示不记录
+        self.LOG_PAGE_SAMPLE = float(self._option(
+            'LOG_PAGE_SAMPLE', 'log', 'page_sample', 0.01
+        ))
+
+        # 数据库写入配置
+        self.DB_BATCH_SIZE = int(self._option(
+            'DB_BATCH_SIZE', 'db', 'batch_size', 500
+        ))
+
+        # 文档锁只在分配页码到提交之间持有，超时后任务重新排队，不计入重试次数
+        self.DOCUMENT_LOCK_TIMEOUT = int(self._option(
+            'DOCUMENT_LOCK_TIMEOUT', 'db', 'document_lock_timeout', 60
+        ))
+
+        # 连接池大小，0 表示按并发数推算：每个处理中的任务占用一个连接，另留出调度、心跳等后台查询的连接
+        self.DB_POOL_MAXSIZE = int(self._option(
+            'DB_POOL_MAXSIZE', 'db', 'pool_maxsize', 0
+        )) or self.MAX_WORKERS + 3
+
+        self.DB_POOL_MINSIZE = min(int(self._option(
+            'DB_POOL_MINSIZE', 'db', 'pool_minsize', 0
+        )) or self.MAX_WORKERS, self.DB_POOL_MAXSIZE)
+
+        # PDF渲染配置
+        self.PDF_DPI = int(self._option(
+            'PDF_DPI', 'pdf', 'dpi', 200
+        ))
+
+        self.PDF_CHUNK_SIZE = int(self._option(
+            'PDF_CHUNK_SIZE', 'pdf', 'chunk_size', 10
+        ))
+
+        self.PDF_THREAD_COUNT = int(self._option(
+            'PDF_THREAD_COUNT', 'pdf', 'thread_count', 4
+        ))
+
+        self.PDF_PASSTHROUGH = str(self._option(
+            'PDF_PASSTHROUGH', 'pdf', 'passthrough', True
+        )).lower() in ('1', 'true', 'yes', 'on')
+
+        self.PDF_SHARD_PAGES = int(self._option(
+            'PDF_SHARD_PAGES', 'pdf', 'shard_pages', 100
+        ))
+
+        self.PDF_SHARD_DIR = self._option(
+            'PDF_SHARD_DIR', 'pdf', 'shard_dir', '/uploads/documents/shards'
+        )
+
+        # 页面缓存配置，目录为空时不启用
+        self.PAGE_CACHE_DIR = self._option(
+            'PAGE_CACHE_DIR', 'cache', 'dir', 'cache/pages'
+        )
+
+        self.PAGE_CACHE_MAX_SIZE = int(self._option(
+            'PAGE_CACHE_MAX_SIZE', 'cache', 'max_size_mb', 2048
+        )) * 1024 * 1024
+
+        # 断点续传配置
+        self.CHECKPOINT_DIR = self._option(
+            'CHECKPOINT_DIR', 'checkpoint', 'dir', 'checkpoints'
+        )
+
+        self.CHECKPOINT_INTERVAL = int(self._option(
+            'CHECKPOINT_INTERVAL', 'checkpoint', 'interval', 50
+        ))
+
+        self.CHECKPOINT_RETENTION = int(self._option(
+            'CHECKPOINT_RETENTION_HOURS', 'checkpoint', 'retention_hours', 168
+        )) * 3600
+
+        # 运行期间检查过期进度日志的间隔(秒)，0 表示只在启动时回收
+        self.CHECKPOINT_RECLAIM_INTERVAL = int(self._option(
+            'CHECKPOINT_RECLAIM_INTERVAL', 'checkpoint', 'reclaim_interval', 3600
+        ))
+
         # 支持的格式配置
         self.SUPPORTED_IMAGE_FORMATS = tuple(os.environ.get(
             'SUPPORTED_IMAGE_FORMATS',
             self._config['formats']['supported_images']
         ))
 
+        # ZIP处理方式: stream(直接读取成员) / extract(解压到临时目录)
+        self.ZIP_MODE = str(self._option(
+            'ZIP_MODE', 'zip', 'mode', 'stream'
+        )).lower()
+
+        self.ZIP_EXTRACT_THREADS = int(self._option(
+            'ZIP_EXTRACT_THREADS', 'zip', 'extract_threads', 4
+        ))
+
+        # 图片转换配置
+        self.JPEG_PASSTHROUGH = str(self._option(
+            'JPEG_PASSTHROUGH', 'convert', 'jpeg_passthrough', True
+        )).lower() in ('1', 'true', 'yes', 'on')
+
+        self.JPEG_STRIP_METADATA = str(self._option(
+            'JPEG_STRIP_METADATA', 'convert', 'jpeg_strip_metadata', True
+        )).lower() in ('1', 'true', 'yes', 'on')
+
+        self.CONVERT_EXECUTOR = str(self._option(
+            'CONVERT_EXECUTOR', 'convert', 'executor', 'process'
+        )).lower()
+
+        self.CONVERT_WORKERS = int(self._option(
+            'CONVERT_WORKERS', 'convert', 'workers', 0
+        )) or os.cpu_count() or 1
+
+        self.CONVERT_MAX_INFLIGHT = int(self._option(
+            'CONVERT_MAX_INFLIGHT', 'convert', 'max_inflight', 16
+        ))
+
+        # 派生图(缩略图/预览图)名称 -> 最长边像素，环境变量格式为 thumb:240,preview:1024
+        derivatives = self._option('PAGE_DERIVATIVES', 'convert', 'derivatives', None) or {}
+        if isinstance(derivatives, str):
+            derivatives = dict(item.split(':', 1) for item in derivatives.split(',') if item.strip())
+        self.PAGE_DERIVATIVES = {str(name).strip(): int(size) for name, size in derivatives.items()}
+        for name in self.PAGE_DERIVATIVES:
+            # 名称同时用作 ww_document_pages 的 {name}_path 列名
+            if not name.isidentifier():
+                raise ValueError(f"派生图名称无效: {name}")
+
+        self.DERIVATIVE_QUALITY = int(self._option(
+            'DERIVATIVE_QUALITY', 'convert', 'derivative_quality', 80
+        ))
+
+        # 大图处理：超过 LARGE_IMAGE_PIXELS 的未压缩TIFF按条带解码，输出超过 MAX_OUTPUT_PIXELS 时按整数倍缩小(0 表示不限制)
+        self.LARGE_IMAGE_PIXELS = int(self._option(
+            'LARGE_IMAGE_PIXELS', 'convert', 'large_image_pixels', 40000000
+        ))
+
+        self.MAX_OUTPUT_PIXELS = int(self._option(
+            'MAX_OUTPUT_PIXELS', 'convert', 'max_output_pixels', 0
+        ))
+
+        # 可处理的最大输入像素数，防止异常文件耗尽内存
+        self.MAX_INPUT_PIXELS = int(self._option(
+            'MAX_INPUT_PIXELS', 'convert', 'max_input_pixels', 1000000000
+        ))
+
+        # 同时解码的图片按文件头估算的内存总量上限(MB)，0 表示不限制
+        self.DECODE_MEMORY_BUDGET = int(self._option(
+            'DECODE_MEMORY_BUDGET', 'convert', 'decode_memory_budget', 1024
+        )) * 1024 * 1024
+
     def get_document_page_path(self, document_id: int, page_number: int, title: str) -> str:
         """获取文档页面路径"""
         return self.DOCUMENT_PAGE_PATH.format(
@@ -67,4 +310,55 @@ MAX_RETRY_COUNT = settings.MAX_RETRY_COUNT
 MAX_WORKERS = settings.MAX_WORKERS
 TEMP_DIR_PREFIX = settings.TEMP_DIR_PREFIX
 DOCUMENT_PAGE_PATH = settings.DOCUMENT_PAGE_PATH
-SUPPORTED_IMAGE_FORMATS = settings.SUPPORTED_IMAGE_FORMATS
\ No newline at end of file
+SUPPORTED_IMAGE_FORMATS = settings.SUPPORTED_IMAGE_FORMATS
+CHECKPOINT_DIR = settings.CHECKPOINT_DIR
+CHECKPOINT_INTERVAL = settings.CHECKPOINT_INTERVAL
+CHECKPOINT_RETENTION = settings.CHECKPOINT_RETENTION
+CHECKPOINT_RECLAIM_INTERVAL = settings.CHECKPOINT_RECLAIM_INTERVAL
+PAGE_CACHE_DIR = settings.PAGE_CACHE_DIR
+PAGE_CACHE_MAX_SIZE = settings.PAGE_CACHE_MAX_SIZE
+WORKER_ID = settings.WORKER_ID
+CLAIM_OVERSAMPLE = settings.CLAIM_OVERSAMPLE
+LEASE_DURATION = settings.LEASE_DURATION
+HEARTBEAT_INTERVAL = settings.HEARTBEAT_INTERVAL
+STATUS_FLUSH_INTERVAL = settings.STATUS_FLUSH_INTERVAL
+TASK_MEMORY_BUDGET = settings.TASK_MEMORY_BUDGET
+SCRATCH_DISK_BUDGET = settings.SCRATCH_DISK_BUDGET
+SCHEDULE_POLICY = settings.SCHEDULE_POLICY
+STARVATION_AGE = settings.STARVATION_AGE
+FAST_LANE_SLOTS = settings.FAST_LANE_SLOTS
+FAST_LANE_MAX_SIZE = settings.FAST_LANE_MAX_SIZE
+TASK_PREFETCH = settings.TASK_PREFETCH
+IDLE_INTERVAL = settings.IDLE_INTERVAL
+IDLE_MIN_INTERVAL = settings.IDLE_MIN_INTERVAL
+IDLE_BACKOFF = settings.IDLE_BACKOFF
+WAKE_HOST = settings.WAKE_HOST
+WAKE_PORT = settings.WAKE_PORT
+METRICS_HOST = settings.METRICS_HOST
+METRICS_PORT = settings.METRICS_PORT
+LOG_LEVEL = settings.LOG_LEVEL
+LOG_FORMAT = settings.LOG_FORMAT
+LOG_PAGE_SAMPLE = settings.LOG_PAGE_SAMPLE
+DB_BATCH_SIZE = settings.DB_BATCH_SIZE
+DB_POOL_MINSIZE = settings.DB_POOL_MINSIZE
+DB_POOL_MAXSIZE = settings.DB_POOL_MAXSIZE
+DOCUMENT_LOCK_TIMEOUT = settings.DOCUMENT_LOCK_TIMEOUT
+PDF_DPI = settings.PDF_DPI
+PDF_CHUNK_SIZE = settings.PDF_CHUNK_SIZE
+PDF_THREAD_COUNT = settings.PDF_THREAD_COUNT
+PDF_PASSTHROUGH = settings.PDF_PASSTHROUGH
+PDF_SHARD_PAGES = settings.PDF_SHARD_PAGES
+PDF_SHARD_DIR = settings.PDF_SHARD_DIR
+ZIP_MODE = settings.ZIP_MODE
+ZIP_EXTRACT_THREADS = settings.ZIP_EXTRACT_THREADS
+JPEG_PASSTHROUGH = settings.JPEG_PASSTHROUGH
+JPEG_STRIP_METADATA = settings.JPEG_STRIP_METADATA
+PAGE_DERIVATIVES = settings.PAGE_DERIVATIVES
+DERIVATIVE_QUALITY = settings.DERIVATIVE_QUALITY
+LARGE_IMAGE_PIXELS = settings.LARGE_IMAGE_PIXELS
+MAX_OUTPUT_PIXELS = settings.MAX_OUTPUT_PIXELS
+MAX_INPUT_PIXELS = settings.MAX_INPUT_PIXELS
+DECODE_MEMORY_BUDGET = settings.DECODE_MEMORY_BUDGET
+CONVERT_EXECUTOR = settings.CONVERT_EXECUTOR
+CONVERT_WORKERS = settings.CONVERT_WORKERS
+CONVERT_MAX_INFLIGHT = settings.CONVERT_MAX_INFLIGHT
\ No newline at end of file
@@ -2,173 +2,596 @@
 import uuid
 import aiomysql
 import asyncio
+import functools
 import os
-from datetime import datetime
+import time
+from collections import deque
 from config.database import DB_CONFIG
 from config.settings import (
-    FILE_PATH_PREFIX, MAX_WORKERS,
-    TEMP_DIR_PREFIX, DOCUMENT_PAGE_PATH
+    FILE_PATH_PREFIX, TEMP_DIR_PREFIX, DOCUMENT_PAGE_PATH, CONVERT_MAX_INFLIGHT, ZIP_MODE,
+    CHECKPOINT_RETENTION, CHECKPOINT_RECLAIM_INTERVAL, METRICS_HOST, METRICS_PORT, WAKE_HOST, WAKE_PORT, PDF_SHARD_PAGES,
+    PDF_SHARD_DIR, DB_POOL_MINSIZE, DB_POOL_MAXSIZE
 )
-from services.db_service import DatabaseService
+from services.admission_service import AdmissionController
+from services.checkpoint_service import TaskJournal
+from services.convert_service import ConvertService
+from services.db_service import DatabaseService, PageWriteBuffer, LeaseLostError, DocumentLockTimeout
 from services.file_service import FileService
+from services.lease_service import LeaseKeeper
+from services.status_service import StatusWriter
 from services.image_service import ImageService
-from utils.logger import logger
-from utils.helpers import parse_directory_name, extract_page_number, parse_file_name
+from services.scheduler_service import TaskScheduler, WakeListener
+from utils.logger import logger, log_page
+from utils.metrics import (
+    registry, MetricsServer, TASK_SECONDS, TASKS_TOTAL, EXTRACT_SECONDS, DB_COMMIT_SECONDS, PAGES_TOTAL
+)
+from utils.helpers import (
+    parse_directory_name, extract_page_number, parse_file_name, PageNumberAllocator, as_async_iterable
+)
 
 class DocumentProcessor:
     def __init__(self):
         self.running = True
         self.pool = None
         self.db_service = None
+        self.convert_service = None
+        self.scheduler = None
+        self.leases = None
+        self.status_writer = None
+        self.admission = None
+        self.wake_listener = None
+        self.metrics_server = None
 
     async def init(self):
         """初始化数据库连接池和服务"""
-        self.pool = await aiomysql.create_pool(**DB_CONFIG)
+        # 每个处理中的任务通过任务会话占用一个连接
+        self.pool = await aiomysql.create_pool(minsize=DB_POOL_MINSIZE, maxsize=DB_POOL_MAXSIZE, **DB_CONFIG)
         self.db_service = DatabaseService(self.pool)
+        self.convert_service = ConvertService()
+        await self.convert_service.init()
+        await self.reclaim_stale_journals()
+        # 后台删除上次退出时未删除完的临时目录和分片目录
+        FileService.sweep_deleting_dirs(TEMP_DIR_PREFIX)
+        FileService.sweep_deleting_dirs(FILE_PATH_PREFIX + PDF_SHARD_DIR)
+        self.leases = LeaseKeeper(self.db_service)
+        self.status_writer = StatusWriter(self.db_service)
+        self.admission = AdmissionController(self.db_service)
+
+        if METRICS_PORT:
+            self.metrics_server = MetricsServer(registry, METRICS_HOST, METRICS_PORT)
+            await self.metrics_server.start()
+
+    async def fetch_tasks(self, limit):
+        """按调度策略和准入预算领取任务，并立即开始续约"""
+        if self.admission:
+            tasks = await self.admission.fetch_tasks(limit)
+        else:
+            tasks = await self.db_service.fetch_tasks(limit)
+        if self.leases:
+            for task in tasks:
+                self.leases.acquire(task['id'])
+        return tasks
+
+    async def reclaim_outputs(self, targets, session=None):
+        """删除未被页面记录引用的输出文件，提供任务会话时复用其连接查询"""
+        if not targets:
+            return
+
+        conn = await session.connection() if session else None
+        referenced = await self.db_service.get_referenced_image_paths(targets, conn=conn)
+        removed = await asyncio.to_thread(TaskJournal.remove_outputs, set(targets) - referenced)
+        logger.info("回收未提交的输出文件 %s 个", removed)
+
+    async def reclaim_stale_journals(self):
+        """回收长时间未继续的任务进度日志及其输出文件"""
+        for path in await asyncio.to_thread(TaskJournal.stale_journals, CHECKPOINT_RETENTION):
+            targets = await asyncio.to_thread(TaskJournal.read_targets, path)
+            await self.reclaim_outputs(targets)
+            os.remove(path)
+
+    async def run_journal_reclaim(self, interval=CHECKPOINT_RECLAIM_INTERVAL):
+        """运行期间定时回收过期的进度日志，直到任务被取消"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reclaim_stale_journals()
+            except Exception as e:
+                logger.error("回收进度日志失败: %s", e)
+
+    async def insert_directories(self, document_id, directories, initial_parent_id=0, conn=None):
+        """按层级批量插入目录，并把自增ID回填给子目录"""
+        levels = {}
+        for directory in directories:
+            levels.setdefault(directory.level, []).append(directory)
+
+        for level in sorted(levels):
+            batch = levels[level]
+            rows = []
+            for directory in batch:
+                number, name, start_page = parse_directory_name(directory.name)
+                parent_id = directory.parent.id if directory.parent else initial_parent_id
+                rows.append((parent_id, name, start_page, number))
+
+            directory_ids = await self.db_service.insert_directories(document_id, rows, conn=conn)
+            for directory, directory_id in zip(batch, directory_ids):
+                directory.id = directory_id
 
     async def process_directory_structure(self, document_id, base_dir, initial_parent_id=0, conn=None):
         """处理目录结构"""
-        total_pages = 0
-        # 在开始处理前，获取当前文档的最大页码
-        max_page_number = await self.db_service.get_max_page(document_id=document_id)
-        page_number_mapping = {}  # 用于跟踪页码映射
+        directories, pages = FileService.scan_directory(base_dir)
+        logger.info("扫描到 %s 个目录, %s 个图片文件: %s", len(directories), len(pages), base_dir)
+        return await self.process_source_tree(document_id, directories, pages, initial_parent_id, conn)
+
+    async def stream_pdf_pages(self, pdf_path, output_dir, done_keys=(), first_page=1, last_page=None):
+        """在线程中逐页渲染PDF，每渲染出一页就交给调用方，等待渲染的总耗时计入 EXTRACT_SECONDS"""
+        pages = iter(FileService.render_pdf_pages(pdf_path, output_dir, done_keys, first_page, last_page))
+        waited = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                page = await asyncio.to_thread(next, pages, None)
+                waited += time.perf_counter() - start
+                if page is None:
+                    return
+                yield page
+        finally:
+            EXTRACT_SECONDS.observe(waited, kind='pdf')
+
+    async def process_source_tree(self, document_id, directories, pages, initial_parent_id=0, conn=None, journal=None,
+                                  progress=None, total=None):
+        """转换全部图片，再插入目录和页面，提供进度日志时复用上次已转换的页面
+
+        转换期间不持有文档锁，页码按开始时已提交的页码暂定；
+        写入前获取文档锁重新分配页码，文档锁只在分配页码到提交之间持有。
+        pages 可以是异步迭代器(如逐页渲染的PDF)，此时由 total 给出总页数。
+        progress 为可选的回调，每转换一个页面后以(已完成页数, 总页数)调用
+        """
+        total = len(pages) if total is None else total
+
+        # 暂定页码用单独的连接读取，页面事务的快照在获取文档锁之后才建立
+        allocator = PageNumberAllocator(await self.db_service.get_page_numbers(document_id))
+        pending = deque()  # 在途的页面转换，按提交顺序完成
+        converted = []  # 已转换的页面 (页面标识, 原始页码, 标题, 所在目录, 暂定页码, 输出路径)
+        completed = 0
+
+        async def drain(limit):
+            """等待最早提交的转换完成，直到在途数量不超过 limit"""
+            nonlocal completed
+            while len(pending) > limit:
+                future, item = pending.popleft()
+                await future
+                converted.append(item)
+                completed += 1
+                log_page("页面已转换 %s", item[0], document_id=document_id, page_number=item[4], target=item[5])
+
+                if progress:
+                    progress(completed, total)
+
+                if journal and journal.done(item[0]):
+                    journal.flush()
+                    await asyncio.to_thread(journal.sync)
 
-        async def process_dir(dir_path, parent_id=initial_parent_id, level=0):
-            nonlocal total_pages, max_page_number
+        try:
+            async for page in as_async_iterable(pages):
+                original_page_number, title = parse_file_name(page.file_name)
+                original_page_number = int(original_page_number)
 
-            try:
-                entries = sorted(os.listdir(dir_path))
-                for entry in entries:
-                    full_path = os.path.join(dir_path, entry)
-
-                    if os.path.isdir(full_path):
-                        logger.info(f"处理目录: {full_path} at level {level}")
-                        dir_name = os.path.basename(full_path)
-                        number, name, start_page = parse_directory_name(dir_name)
-                        dir_id = await self.db_service.insert_directory(document_id, parent_id, name, start_page, number, conn=conn)
-                        sub_pages = await process_dir(full_path, dir_id, level + 1)
-                        total_pages += sub_pages
-
-                    elif os.path.isfile(full_path) and ImageService.is_supported_image(full_path):
-                        logger.info(f"处理图片文件: {full_path}")
-                        file_name = os.path.basename(full_path)
-                        original_page_number, title = parse_file_name(file_name)
-                        original_page_number = int(original_page_number)
-
-                        if original_page_number:
-                            # 使用映射表检查是否已经处理过这个页码
-                            if original_page_number in page_number_mapping:
-                                actual_page_number = page_number_mapping[original_page_number]
-                            else:
-                                # 检查页码是否存在
-                                if await self.db_service.check_page_exists(document_id=document_id, page_number=original_page_number):
-                                    max_page_number += 1
-                                    actual_page_number = max_page_number
-                                else:
-                                    actual_page_number = original_page_number
-                                    if actual_page_number > max_page_number:
-                                        max_page_number = actual_page_number
-                                
-                                # 保存页码映射
-                                page_number_mapping[original_page_number] = actual_page_number
-
-                            random_string = str(uuid.uuid4().hex)[:8]
-                            target_path = DOCUMENT_PAGE_PATH.format(
-                                random_string=random_string,
-                                document_id=document_id,
-                                page_number=actual_page_number,
-                                title=title
-                            )
-
-                            ImageService.convert_to_jpg(full_path, target_path)
-
-                            await self.db_service.insert_page(
-                                title, document_id, parent_id, actual_page_number, target_path, conn=conn
-                            )
-
-                            total_pages += 1
-
-                return total_pages
+                if not original_page_number:
+                    continue
 
-            except Exception as e:
-                logger.error(f"处理目录失败 {dir_path}: {str(e)}")
-                raise
+                page_number = allocator.allocate(original_page_number)
+                entry = journal.entries.get(page.key) if journal else None
+
+                reuse = entry and entry['page_number'] == page_number
+                if reuse:
+                    # 上次已转换且页码不变的页面直接复用输出文件
+                    target_path = entry['target']
+                else:
+                    target_path = self.page_target_path(document_id, page_number, title)
+
+                if journal:
+                    # 开始写入输出之前记录，进程中断后可以回收本页的输出
+                    journal.start(page.key, page_number, target_path)
+
+                if reuse:
+                    future = asyncio.get_running_loop().create_future()
+                    future.set_result(True)
+                elif entry:
+                    # 页码变化时把上次的输出文件移动到新位置
+                    future = asyncio.ensure_future(self.convert_service.run(
+                        ImageService.move_jpg, FILE_PATH_PREFIX + entry['target'], target_path
+                    ))
+                else:
+                    # 转换在执行器中并行进行，超过在途上限时先等待最早的转换完成
+                    future = asyncio.ensure_future(
+                        self.convert_service.convert_page(page, target_path)
+                    )
+
+                item = (page.key, original_page_number, title, page.directory, page_number, target_path)
+                pending.append((future, item))
+                await drain(max(CONVERT_MAX_INFLIGHT, 1) - 1)
+
+            await drain(0)
+
+        except BaseException as e:
+            logger.error("处理目录失败 document_id=%s: %s", document_id, e)
+            # 取消尚未开始的转换，并等待已开始的转换结束
+            for future, _ in pending:
+                future.cancel()
+            await asyncio.gather(*(future for future, _ in pending), return_exceptions=True)
+            raise
+
+        return await self.write_source_tree(document_id, directories, converted, initial_parent_id, conn, journal)
+
+    async def write_source_tree(self, document_id, directories, converted, initial_parent_id=0, conn=None, journal=None):
+        """在文档锁内分配最终页码并插入目录和页面，页码与暂定页码不同的页面移动输出文件
+
+        文档锁持有到页面事务结束，同一文档的任务只在这一步互斥
+        """
+        if conn is not None:
+            # 在事务中的第一次读取之前获取文档锁，保证读到其他任务已提交的页码
+            await self.db_service.lock_document(document_id, conn)
+
+        # 按与暂定时相同的顺序重新分配，其他任务没有占用暂定页码时结果不变
+        allocator = PageNumberAllocator(await self.db_service.get_page_numbers(document_id, conn=conn))
+        pages = []
+        moves = []
+        for key, original_page_number, title, directory, page_number, target_path in converted:
+            actual_page_number = allocator.allocate(original_page_number)
+            if actual_page_number != page_number:
+                moved_path = self.page_target_path(document_id, actual_page_number, title)
+                if journal:
+                    journal.start(key, actual_page_number, moved_path)
+                moves.append((key, target_path, moved_path))
+                target_path = moved_path
+            pages.append((title, directory, actual_page_number, target_path))
+
+        if moves:
+            logger.info("文档 %s 的页码已被其他任务占用，移动 %s 个页面", document_id, len(moves))
+            await asyncio.gather(*(
+                self.convert_service.run(ImageService.move_jpg, FILE_PATH_PREFIX + source_path, target_path)
+                for _, source_path, target_path in moves
+            ))
+            if journal:
+                for key, _, _ in moves:
+                    journal.done(key)
+                journal.flush()
+                await asyncio.to_thread(journal.sync)
+
+        await self.insert_directories(document_id, directories, initial_parent_id, conn)
+
+        writer = PageWriteBuffer(self.db_service, conn)
+        for title, directory, page_number, target_path in pages:
+            parent_id = directory.id if directory else initial_parent_id
+            await writer.add(
+                title, document_id, parent_id, page_number, target_path, *ImageService.derivative_paths(target_path)
+            )
+        await writer.flush()
+        return writer.count
+
+    @staticmethod
+    def page_target_path(document_id, page_number, title):
+        """生成页面图片的输出路径，文件名带随机前缀避免覆盖"""
+        random_string = str(uuid.uuid4().hex)[:8]  # 取前8个字符作为随机字符串
+        return DOCUMENT_PAGE_PATH.format(
+            random_string=random_string,
+            document_id=document_id,
+            page_number=page_number,
+            title=title
+        )
+
+    def finish_task(self, task, status, started, **fields):
+        """记录任务结果指标，并输出一条任务汇总日志代替逐页日志"""
+        elapsed = time.perf_counter() - started
+        TASKS_TOTAL.inc(status=status)
+        TASK_SECONDS.observe(elapsed, status=status)
+        logger.info(
+            "任务 %s %s, 耗时 %.1f 秒", task['id'], status, elapsed,
+            extra={
+                'task_id': task['id'], 'document_id': task['document_id'], 'status': status,
+                'elapsed': round(elapsed, 3), **fields
+            }
+        )
+
+    async def split_pdf(self, task, session):
+        """页数超过 PDF_SHARD_PAGES 的PDF拆分为分片任务，返回是否已拆分"""
+        page_count = await asyncio.to_thread(FileService.pdf_page_count, task['file_path'])
+        if page_count <= PDF_SHARD_PAGES:
+            return False
+
+        ranges = FileService.shard_ranges(page_count, PDF_SHARD_PAGES)
+        await self.db_service.create_shards(task, page_count, ranges, conn=await session.connection())
+        if self.scheduler:
+            # 本节点的空闲槽位立即领取分片
+            self.scheduler.wake()
+        return True
+
+    async def process_shard(self, task, session):
+        """渲染PDF分片的页码区间到共享的分片目录，页码在父任务合并时分配"""
+        started = time.perf_counter()
+        temp_dir = f"{TEMP_DIR_PREFIX}/{task['id']}"
+        shard_dir = FileService.shard_dir(task['parent_task_id'])
+        pending = deque()
+        try:
+            logger.info("处理PDF分片 %s: 第 %s-%s 页", task['id'], task['first_page'], task['last_page'])
+            await session.update_task_status(task['id'], '处理中')
+            os.makedirs(temp_dir, exist_ok=True)
+
+            # 逐页渲染，渲染结果连同派生图放入分片目录，重试时覆盖上次的输出
+            total = task['last_page'] - task['first_page'] + 1
+            count = 0
+            async for page in self.stream_pdf_pages(
+                task['file_path'], temp_dir, (), task['first_page'], task['last_page']
+            ):
+                count += 1
+                pending.append(asyncio.ensure_future(
+                    self.convert_service.convert_page(page, f"{shard_dir}/{page.file_name}")
+                ))
+                if len(pending) >= max(CONVERT_MAX_INFLIGHT, 1):
+                    await pending.popleft()
+                    if self.status_writer:
+                        self.status_writer.progress(task['id'], count - len(pending), total)
+            while pending:
+                await pending.popleft()
+
+            if self.leases and self.leases.is_lost(task['id']):
+                raise LeaseLostError(f"任务 {task['id']} 的租约已失效，放弃提交")
+
+            FileService.cleanup_temp_dir_later(temp_dir)
+
+            parent_status = await self.db_service.complete_shard(
+                task['id'], task['parent_task_id'], conn=await session.connection(), details=str(count),
+                **session.take_pending(task['id'])
+            )
+            if parent_status == '待合并' and self.scheduler:
+                self.scheduler.wake()
+            elif parent_status == '已失败':
+                # 其他分片已失败，父任务不会再合并
+                FileService.cleanup_temp_dir_later(FILE_PATH_PREFIX + shard_dir)
+
+            PAGES_TOTAL.inc(count)
+            self.finish_task(task, '已完成', started, pages=count)
+
+        except Exception as e:
+            logger.error("Error processing shard %s: %s", task['id'], e)
+
+            for future in pending:
+                future.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            FileService.cleanup_temp_dir_later(temp_dir)
+
+            if isinstance(e, LeaseLostError) and self.leases:
+                self.leases.mark_lost(task['id'])
+            if isinstance(e, LeaseLostError) or (self.leases and self.leases.is_lost(task['id'])):
+                self.finish_task(task, '租约失效', started)
+                return
+
+            status = '待重试' if task['retry_count'] < 3 else '已失败'
+            await session.update_task_status(task['id'], status, failure_reason=str(e))
+
+            if status == '已失败':
+                await self.db_service.fail_shards(
+                    task['parent_task_id'], f"分片任务 {task['id']} 失败: {str(e)}", conn=await session.connection()
+                )
+                FileService.cleanup_temp_dir_later(FILE_PATH_PREFIX + shard_dir)
 
-        return await process_dir(base_dir)
+            self.finish_task(task, status, started, reason=str(e))
 
     async def process_file(self, task):
-        """处理单个任务"""
+        """处理单个任务，任务的全部数据库读写通过同一个任务会话进行"""
+        session = self.db_service.session(self.status_writer)
         conn = None
+        journal = None
+        shards = None
+        total = None
+        committed = False
+        started = time.perf_counter()
         try:
-            logger.info(f"处理任务 {task['id']}")
+            if self.leases and self.leases.is_lost(task['id']):
+                # 排队期间租约已被回收，任务可能已由其他节点处理
+                logger.warning("任务 %s 的租约已失效，跳过处理", task['id'])
+                return
+
+            if task.get('parent_task_id'):
+                await self.process_shard(task, session)
+                return
+
+            logger.info("处理任务 %s", task['id'])
 
             # 更新任务状态
-            await self.db_service.update_task_status(task['id'], '处理中')
+            await session.update_task_status(task['id'], '处理中')
+
+            is_pdf = task['file_path'].lower().endswith('.pdf')
+            if is_pdf and task.get('page_count'):
+                # 已拆分的PDF，全部分片已完成，合并分片的渲染结果
+                shards = await self.db_service.get_shards(task['id'], conn=await session.connection())
+            elif is_pdf and PDF_SHARD_PAGES and await self.split_pdf(task, session):
+                self.finish_task(task, '分片处理中', started)
+                return
+
+            # 读取进度日志，回收上次中断时未完成转换的输出。
+            # 在页面事务之外查询，事务中的第一次读取在获取文档锁之后，快照包含其他任务已提交的页码
+            journal = TaskJournal(task['id'])
+            await self.reclaim_outputs(await asyncio.to_thread(journal.load), session)
 
             # 开始事务
-            conn = await self.db_service.start_transaction()
+            conn = await session.begin()
 
             # 创建临时目录
             temp_dir = f"{TEMP_DIR_PREFIX}/{task['id']}"
             os.makedirs(temp_dir, exist_ok=True)
 
-            if task['file_path'].lower().endswith('.pdf'):
-                FileService.convert_pdf_to_images(task['file_path'], temp_dir)
+            if shards:
+                # 分片的渲染结果已在分片目录中，合并时按页码顺序分配页码并链接到最终位置
+                directories = []
+                with EXTRACT_SECONDS.time(kind='pdf_merge'):
+                    pages = FileService.shard_pages(task['id'], shards)
+            elif is_pdf:
+                # 分块渲染由 poppler 子进程完成，渲染出的页面逐页交给转换，不等待整本渲染完成
+                # 渲染结果已是JPG，之后直接移动到最终位置，不再解码重编码
+                directories = []
+                total = await asyncio.to_thread(FileService.pdf_page_count, task['file_path'])
+                pages = self.stream_pdf_pages(task['file_path'], temp_dir, set(journal.entries))
+            elif ZIP_MODE == 'stream':
+                # 直接从ZIP中央目录重建目录结构，图片数据由转换进程从ZIP中读取
+                with EXTRACT_SECONDS.time(kind='zip_scan'):
+                    directories, pages = await asyncio.to_thread(FileService.scan_zip, task['file_path'])
             else:
-                await FileService.extract_zip(task['file_path'], temp_dir)
+                with EXTRACT_SECONDS.time(kind='zip_extract'):
+                    await FileService.extract_zip(task['file_path'], temp_dir)
+                    directories, pages = FileService.scan_directory(temp_dir)
+
+            if total is None:
+                total = len(pages)
+            logger.debug("任务 %s 扫描到 %s 个目录, %s 个图片文件", task['id'], len(directories), total)
 
             # 处理目录
-            result = await self.process_directory_structure(
+            result = await self.process_source_tree(
                 task['document_id'],
-                temp_dir,
+                directories,
+                pages,
                 task['document_directory_id'],
-                conn
+                conn,
+                journal,
+                progress=functools.partial(self.status_writer.progress, task['id']) if self.status_writer else None,
+                total=total
             )
 
+            if self.leases and self.leases.is_lost(task['id']):
+                raise LeaseLostError(f"任务 {task['id']} 的租约已失效，放弃提交")
+
+            # 在提交事务中锁定任务行确认仍由本节点持有，页面和已完成状态一起提交
+            await self.db_service.lock_owned_task(task['id'], conn)
+            await session.complete(task['id'], details=str(result))
+
             # 提交事务
-            await self.db_service.commit_transaction(conn)
+            with DB_COMMIT_SECONDS.time():
+                await session.commit()
+            conn = None
+            committed = True
+            PAGES_TOTAL.inc(result)
+
+            # 页面已提交，删除进度日志及以前处理中产生但本次未使用的输出
+            await asyncio.to_thread(TaskJournal.remove_outputs, journal.targets - journal.used)
+            await asyncio.to_thread(journal.remove)
+            journal = None
 
             # 清理临时目录
-            FileService.cleanup_temp_dir(temp_dir)
+            FileService.cleanup_temp_dir_later(temp_dir)
+            if shards:
+                FileService.cleanup_temp_dir_later(FILE_PATH_PREFIX + FileService.shard_dir(task['id']))
 
-            # 更新任务状态
-            await self.db_service.update_task_status(task['id'], '已完成', details=str(result))
+            summary = {'pages': result, 'directories': len(directories)}
+            if self.convert_service.cache:
+                summary['cache'] = self.convert_service.cache.stats()
+            self.finish_task(task, '已完成', started, **summary)
 
         except Exception as e:
-            logger.error(f"Error processing task {task['id']}: {str(e)}")
+            logger.error("Error processing task %s: %s", task['id'], e)
 
             if conn:
-                await self.db_service.rollback_transaction(conn)
-
-            await self.db_service.update_task_status(task['id'], '待重试' if task['retry_count'] < 3 else '已失败', failure_reason=str(e))
+                await session.rollback()
+
+            if committed:
+                # 页面和已完成状态已提交，只是提交后的清理失败
+                self.finish_task(task, '已完成', started, reason=str(e))
+                return
+
+            if isinstance(e, LeaseLostError) and self.leases:
+                self.leases.mark_lost(task['id'])
+            if isinstance(e, LeaseLostError) or (self.leases and self.leases.is_lost(task['id'])):
+                # 任务已被重新排队，状态由回收方维护，保留进度日志以便本节点再次领取时复用
+                if journal:
+                    await asyncio.to_thread(journal.close)
+                self.finish_task(task, '租约失效', started)
+                return
+
+            if isinstance(e, DocumentLockTimeout):
+                # 同一文档的其他任务正在写入，保留进度日志，重新排队时复用已转换的页面，不计入重试次数
+                if journal:
+                    await asyncio.to_thread(journal.close)
+                await session.update_task_status(task['id'], '待重试', count_retry=False, failure_reason=str(e))
+                self.finish_task(task, '待重试', started, reason=str(e))
+                return
+
+            status = '待重试' if task['retry_count'] < 3 else '已失败'
+
+            if journal:
+                if status == '已失败':
+                    # 不再重试，回收全部未提交的输出
+                    await asyncio.to_thread(journal.remove)
+                    await self.reclaim_outputs(journal.targets, session)
+                    if shards:
+                        FileService.cleanup_temp_dir_later(FILE_PATH_PREFIX + FileService.shard_dir(task['id']))
+                else:
+                    # 保留进度日志，重试时从断点继续
+                    await asyncio.to_thread(journal.close)
+
+            await session.update_task_status(task['id'], status, failure_reason=str(e))
+
+            self.finish_task(task, status, started, reason=str(e))
+
+        finally:
+            await session.close()
+            # 读取文件头时打开的ZIP包不再使用，转换进程中的由空闲回收关闭
+            ImageService.close_archive(FILE_PATH_PREFIX + task['file_path'])
+            if self.leases:
+                self.leases.release(task['id'])
+            if self.admission:
+                self.admission.release(task['id'])
 
     async def run(self):
         """运行文档处理器"""
         await self.init()
 
-        while self.running:
-            logger.info(f"开始处理任务 - {datetime.now()}")
-            try:
-                logger.info(f"获取任务 - {datetime.now()}")
-                tasks = await self.db_service.fetch_tasks(MAX_WORKERS)
-                if not tasks:
-                    logger.info(f"没有可处理的任务 - {datetime.now()}")
-                    await asyncio.sleep(5)
-                    continue
+        self.scheduler = TaskScheduler(
+            self.fetch_tasks, self.process_file, priority=self.admission.priority if self.admission else None
+        )
+        if not self.running:
+            self.scheduler.stop()
 
-                logger.info(f"开始处理 {len(tasks)} 个任务 - {datetime.now()}")
-                await asyncio.gather(
-                    *(self.process_file(task) for task in tasks)
-                )
+        # 网页端上传文件后可通过UDP报文或 SIGUSR1 信号通知立即领取任务
+        self.wake_listener = WakeListener(self.scheduler.wake, WAKE_HOST, WAKE_PORT)
+        await self.wake_listener.start()
 
-            except Exception as e:
-                logger.error(f"处理任务失败 - {datetime.now()}: {str(e)}")
-                await asyncio.sleep(5)
+        heartbeat = asyncio.create_task(self.leases.run())
+        status_flush = asyncio.create_task(self.status_writer.run())
+        journal_reclaim = asyncio.create_task(self.run_journal_reclaim()) if CHECKPOINT_RECLAIM_INTERVAL else None
+        try:
+            await self.scheduler.run()
+        finally:
+            self.leases.stop()
+            self.status_writer.stop()
+            if journal_reclaim:
+                journal_reclaim.cancel()
+                await asyncio.gather(journal_reclaim, return_exceptions=True)
+            await heartbeat
+            await status_flush
 
     async def shutdown(self):
         """关闭文档处理器"""
         self.running = False
 
+        if self.scheduler:
+            self.scheduler.stop()
+
+        if self.leases:
+            self.leases.stop()
+
+        if self.status_writer:
+            self.status_writer.stop()
+
+        if self.wake_listener:
+            self.wake_listener.stop()
+
+        await FileService.wait_cleanups()
+
+        if self.convert_service:
+            self.convert_service.shutdown()
+
+        if self.metrics_server:
+            await self.metrics_server.stop()
+
         if self.pool:
             self.pool.close()
             await self.pool.wait_closed()
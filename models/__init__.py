@@ -1,2 +1,3 @@
 # -*- coding: utf-8 -*-
-from .document import DocumentTask, DocumentFile, DocumentDirectory, DocumentPage
\ No newline at end of file
+from .document import DocumentTask, DocumentFile, DocumentDirectory, DocumentPage
+from .source import SourceDirectory, SourcePage, ZipMember
\ No newline at end of file
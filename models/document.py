@@ -31,11 +31,24 @@ class DocumentTask:
     failed_at: Optional[datetime]
     created_at: datetime
     updated_at: datetime
+    worker_id: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+    progress_done: int = 0
+    progress_total: int = 0
+    parent_task_id: Optional[int] = None
+    first_page: Optional[int] = None
+    last_page: Optional[int] = None
+    page_count: Optional[int] = None
 
     @property
     def is_retryable(self) -> bool:
         return self.retry_count < 3
 
+    @property
+    def is_shard(self) -> bool:
+        return self.parent_task_id is not None
+
     @property
     def is_processing(self) -> bool:
         return self.status == '处理中'
@@ -97,6 +110,8 @@ class DocumentPage:
     image_path: str
     title: str
     content: str
+    thumb_path: Optional[str] = None
+    preview_path: Optional[str] = None
 
     @property
     def file_name(self) -> str:
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from dataclasses import dataclass
+from typing import Optional, Union
+
+@dataclass(frozen=True)
+class ZipMember:
+    """ZIP包中的成员文件"""
+    archive: str
+    name: str
+
+@dataclass
+class SourceDirectory:
+    """待导入的目录"""
+    path: str
+    name: str
+    level: int
+    parent: Optional['SourceDirectory'] = None
+    id: Optional[int] = None
+
+@dataclass
+class SourcePage:
+    """待导入的图片"""
+    path: str
+    file_name: str
+    directory: Optional[SourceDirectory] = None
+    member: Optional[ZipMember] = None
+    encoded: bool = False  # 来源已是最终JPEG，无需重新编码
+    keep_source: bool = False  # 来源文件需保留到提交之后(如PDF分片的渲染结果)，不移动
+
+    @property
+    def key(self) -> str:
+        """同一任务多次处理之间保持不变的页面标识"""
+        return self.file_name if self.encoded else self.path
+
+    @property
+    def source(self) -> Union[str, ZipMember]:
+        """图片数据来源：磁盘文件路径或ZIP成员"""
+        return self.member or self.path
@@ -1,4 +1,8 @@
 # -*- coding: utf-8 -*-
-from .db_service import DatabaseService
+from .db_service import DatabaseService, PageWriteBuffer
 from .file_service import FileService
-from .image_service import ImageService
\ No newline at end of file
+from .image_service import ImageService
+from .convert_service import ConvertService
+from .scheduler_service import TaskScheduler
+from .lease_service import LeaseKeeper
+from .admission_service import AdmissionController
\ No newline at end of file
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import re
+import zipfile
+from dataclasses import dataclass
+from functools import lru_cache
+from pdf2image import pdfinfo_from_path
+from config.settings import (
+    FILE_PATH_PREFIX, TASK_MEMORY_BUDGET, SCRATCH_DISK_BUDGET, CLAIM_OVERSAMPLE, ZIP_MODE, PDF_DPI, PDF_CHUNK_SIZE,
+    PDF_THREAD_COUNT, MAX_WORKERS, FAST_LANE_SLOTS, FAST_LANE_MAX_SIZE
+)
+from utils.logger import logger
+from utils.metrics import ADMITTED_MEMORY_BYTES, ADMITTED_DISK_BYTES
+
+# 每个任务的固定内存开销(目录结构、在途页面、数据库缓冲)
+_TASK_BASE_MEMORY = 32 * 1024 * 1024
+
+# 渲染得到的JPG平均每像素字节数
+_JPEG_BYTES_PER_PIXEL = 0.25
+
+# pdfinfo 输出的页面尺寸，例如 "595.276 x 841.89 pts (A4)"
+_PAGE_SIZE_PATTERN = re.compile(r'([\d.]+)\s*x\s*([\d.]+)\s*pts')
+
+@dataclass(frozen=True)
+class TaskCost:
+    """任务的估算资源占用(字节)"""
+    memory: int
+    disk: int
+
+@lru_cache(maxsize=1024)
+def _probe_cost(file_path, mtime_ns, size, first_page, last_page):
+    """读取源文件估算任务开销，按文件的修改时间和大小缓存，读取失败时抛出异常，失败不缓存"""
+    full_path = FILE_PATH_PREFIX + file_path
+
+    if file_path.lower().endswith('.pdf'):
+        # 每个渲染线程同时持有一页位图；逐块渲染，临时目录中只保留一块的渲染结果
+        info = pdfinfo_from_path(full_path)
+        match = _PAGE_SIZE_PATTERN.search(info.get('Page size', ''))
+        width, height = (float(match.group(1)), float(match.group(2))) if match else (595.0, 842.0)
+        page_pixels = (width / 72 * PDF_DPI) * (height / 72 * PDF_DPI)
+        pages = last_page - first_page + 1 if first_page else info['Pages']
+        return TaskCost(
+            memory=int(_TASK_BASE_MEMORY + PDF_THREAD_COUNT * page_pixels * 4),
+            disk=int(min(pages, max(PDF_CHUNK_SIZE, 1)) * page_pixels * _JPEG_BYTES_PER_PIXEL),
+        )
+
+    # 只读取中央目录，不解压
+    with zipfile.ZipFile(full_path, 'r') as archive:
+        sizes = [info.file_size for info in archive.infolist() if not info.is_dir()]
+    # 转换时成员数据读入内存并解码
+    return TaskCost(
+        memory=_TASK_BASE_MEMORY + 2 * max(sizes, default=0),
+        disk=sum(sizes) if ZIP_MODE != 'stream' else 0,
+    )
+
+def estimate_cost(file_path, file_size, first_page=None, last_page=None):
+    """根据源文件估算任务的内存和临时目录占用，无法读取文件时按 ww_document_files 中的文件大小估算
+
+    PDF分片只计入其页码区间的页数。同一文件在多次轮询中反复出现，读取成功的结果按路径、修改时间和大小缓存；
+    文件尚在上传或读取超时等失败时不缓存，下次轮询重新读取
+    """
+    file_size = file_size or 0
+    try:
+        stat = os.stat(FILE_PATH_PREFIX + file_path)
+        return _probe_cost(file_path, stat.st_mtime_ns, stat.st_size, first_page, last_page)
+
+    except Exception as e:
+        logger.warning("无法读取文件估算任务开销，按文件大小估算 %s: %s", file_path, e)
+        return TaskCost(
+            memory=_TASK_BASE_MEMORY + file_size,
+            disk=file_size * 2 if file_path.lower().endswith('.pdf') or ZIP_MODE != 'stream' else 0,
+        )
+
+class AdmissionController:
+    """按调度策略取出候选任务，在预算和快速通道限制内领取
+
+    已领取任务的估算内存和临时目录占用总和不超过预算。候选任务按优先级依次检查，
+    放不下的大任务不阻塞其后的小任务；等待过久的任务放不下时停止领取，等待预算释放。
+    没有已领取的任务时总是允许领取，超过整个预算的任务单独运行。
+    已领取(处理中和预取排队)的大文件不超过 workers - fast_lane_slots 个，至少有 fast_lane_slots 个
+    工作协程留给小文件；调度队列按 priority 把小文件排在大文件之前。
+    """
+
+    def __init__(self, db_service, memory_budget=TASK_MEMORY_BUDGET, disk_budget=SCRATCH_DISK_BUDGET,
+                 oversample=CLAIM_OVERSAMPLE, workers=MAX_WORKERS,
+                 fast_lane_slots=FAST_LANE_SLOTS, fast_lane_max_size=FAST_LANE_MAX_SIZE):
+        self.db_service = db_service
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.oversample = max(oversample, 1)
+        self.fast_lane_slots = max(fast_lane_slots, 0)
+        self.fast_lane_max_size = fast_lane_max_size
+        # 按工作协程数而不是预取容量计算，预取的大文件不会占满工作协程；至少保留一个大文件槽位
+        self.large_capacity = max(1, workers - self.fast_lane_slots)
+        self.costs = {}  # 已领取的任务ID -> TaskCost
+        self.large = set()  # 已领取的大文件任务ID
+        self.memory_used = 0
+        self.disk_used = 0
+
+    def is_large(self, candidate):
+        return bool(self.fast_lane_slots) and (candidate['file_size'] or 0) > self.fast_lane_max_size
+
+    def priority(self, task):
+        """调度队列中的排序键，小文件先于已领取的大文件开始处理"""
+        return 1 if task['id'] in self.large else 0
+
+    async def estimate(self, candidate):
+        if not (self.memory_budget or self.disk_budget):
+            return TaskCost(memory=0, disk=0)
+        if candidate['page_count'] and not candidate['parent_task_id']:
+            # 已拆分的PDF父任务只需合并分片的渲染结果
+            return TaskCost(memory=_TASK_BASE_MEMORY, disk=0)
+        return await asyncio.to_thread(
+            estimate_cost, candidate['file_path'], candidate['file_size'], candidate['first_page'], candidate['last_page']
+        )
+
+    def fits(self, cost, memory_used, disk_used):
+        return (
+            (not self.memory_budget or memory_used + cost.memory <= self.memory_budget)
+            and (not self.disk_budget or disk_used + cost.disk <= self.disk_budget)
+        )
+
+    async def fetch_tasks(self, limit):
+        """领取预算和快速通道限制内能容纳的任务"""
+        large_slots = self.large_capacity - len(self.large)
+        # 大文件槽位已满时只查询小文件，避免候选窗口被大文件占满
+        max_size = self.fast_lane_max_size if self.fast_lane_slots and large_slots <= 0 else None
+        candidates = await self.db_service.fetch_candidates(limit * self.oversample, max_size=max_size)
+
+        chosen = {}
+        memory_used, disk_used = self.memory_used, self.disk_used
+        for candidate in candidates:
+            large = self.is_large(candidate)
+            if large and large_slots <= 0:
+                continue
+
+            cost = await self.estimate(candidate)
+
+            if (self.costs or chosen) and not self.fits(cost, memory_used, disk_used):
+                if candidate['aged']:
+                    # 等待过久的任务放不下时不再让后面的任务插队
+                    break
+                continue
+
+            chosen[candidate['id']] = (cost, large)
+            memory_used += cost.memory
+            disk_used += cost.disk
+            if large:
+                large_slots -= 1
+            if len(chosen) >= limit:
+                break
+
+        if len(chosen) < min(limit, len(candidates)):
+            logger.debug("预算或槽位不足，暂不领取 %s 个候选任务", len(candidates) - len(chosen))
+
+        tasks = await self.db_service.claim_tasks(list(chosen), limit)
+        for task in tasks:
+            # 领取结果中的 file_size 为整个文件的大小，大文件按候选任务的估算大小判断
+            cost, large = chosen[task['id']]
+            self.reserve(task['id'], cost)
+            if large:
+                self.large.add(task['id'])
+        return tasks
+
+    def reserve(self, task_id, cost):
+        self.costs[task_id] = cost
+        self.memory_used += cost.memory
+        self.disk_used += cost.disk
+        self._update_gauges()
+
+    def release(self, task_id):
+        """任务结束后归还预算"""
+        self.large.discard(task_id)
+        cost = self.costs.pop(task_id, None)
+        if cost:
+            self.memory_used -= cost.memory
+            self.disk_used -= cost.disk
+            self._update_gauges()
+
+    def _update_gauges(self):
+        ADMITTED_MEMORY_BYTES.set(self.memory_used)
+        ADMITTED_DISK_BYTES.set(self.disk_used)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import shutil
+import uuid
+from config.settings import (
+    FILE_PATH_PREFIX, PAGE_CACHE_DIR, PAGE_CACHE_MAX_SIZE, JPEG_PASSTHROUGH, JPEG_STRIP_METADATA, PAGE_DERIVATIVES,
+    DERIVATIVE_QUALITY, LARGE_IMAGE_PIXELS, MAX_OUTPUT_PIXELS
+)
+from services.image_service import ImageService
+from utils.logger import logger
+
+# 计算缓存键时分块读取源数据的字节数
+_READ_CHUNK = 1024 * 1024
+
+# 转换逻辑或参数变化时修改版本号，使旧的缓存条目失效
+CACHE_VERSION = 3
+
+# 影响转换结果的配置，任一项变化时缓存键随之变化
+_OUTPUT_SETTINGS = (
+    JPEG_PASSTHROUGH, JPEG_STRIP_METADATA, MAX_OUTPUT_PIXELS, LARGE_IMAGE_PIXELS, DERIVATIVE_QUALITY
+)
+
+class PageCache:
+    """以源图片内容哈希为键的转换结果缓存，存放在本地磁盘，按最近使用时间淘汰"""
+
+    def __init__(self, cache_dir=PAGE_CACHE_DIR, max_size=PAGE_CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def scan(self):
+        """统计缓存目录当前占用的空间"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path, _ in self._entries())
+        logger.info("页面缓存: %s, 已用 %s / %s 字节", self.cache_dir, self.size, self.max_size)
+
+    def record(self, hit, stored_size):
+        """记录一次转换的缓存结果，返回是否需要淘汰"""
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.size += stored_size
+        return self.size > self.max_size
+
+    def evict(self):
+        """按最近使用时间淘汰缓存条目，直到占用降到上限的90%以下，返回释放的字节数"""
+        excess = self.size - self.max_size * 0.9
+        freed = 0
+        evicted = 0
+
+        for path, _ in sorted(self._entries(), key=lambda entry: entry[1]):
+            if freed >= excess:
+                break
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                continue
+            freed += size
+            evicted += 1
+
+        logger.info("页面缓存淘汰 %s 个条目, 释放 %s 字节", evicted, freed)
+        return freed
+
+    def stats(self):
+        """缓存命中统计"""
+        return {'hits': self.hits, 'misses': self.misses, 'size': self.size}
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    yield path, os.path.getmtime(path)
+                except OSError:
+                    continue
+
+    @staticmethod
+    def make_key(source_file, *params):
+        """根据源图片数据和转换参数计算缓存键，源数据分块读取"""
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: source_file.read(_READ_CHUNK), b''):
+            digest.update(chunk)
+        digest.update(repr((CACHE_VERSION,) + params).encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def entry_path(cache_dir, key):
+        return os.path.join(cache_dir, key[:2], key + '.jpg')
+
+    @staticmethod
+    def _place(source_path, target_path):
+        """通过硬链接或复制把文件原子地放到目标位置"""
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        temp_path = f"{target_path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            os.link(source_path, temp_path)
+        except OSError:
+            shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, target_path)
+
+    @staticmethod
+    def convert(cache_dir, source, target_path, derivatives=PAGE_DERIVATIVES):
+        """带缓存的图片转换，在转换进程中执行，返回 (是否命中, 新增缓存字节数)
+
+        缓存只保存主图，命中时派生图由缓存的JPG缩小解码生成
+        """
+        with ImageService.open_source(source) as source_file:
+            key = PageCache.make_key(source_file, *_OUTPUT_SETTINGS, sorted(derivatives.items()))
+            entry_path = PageCache.entry_path(cache_dir, key)
+            full_target_path = FILE_PATH_PREFIX + target_path
+
+            try:
+                PageCache._place(entry_path, full_target_path)
+                # 更新修改时间作为最近使用时间
+                os.utime(entry_path)
+            except FileNotFoundError:
+                pass
+            else:
+                if derivatives:
+                    ImageService.derive_from_jpg(full_target_path, target_path, derivatives)
+                return True, 0
+
+            source_file.seek(0)
+            ImageService.convert_to_jpg(source_file, target_path, derivatives=derivatives)
+
+        PageCache._place(full_target_path, entry_path)
+        return False, os.path.getsize(entry_path)
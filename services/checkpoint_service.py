@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+from config.settings import FILE_PATH_PREFIX, CHECKPOINT_DIR, CHECKPOINT_INTERVAL
+from services.image_service import ImageService
+from utils.logger import logger
+
+class TaskJournal:
+    """任务进度日志，记录已转换的页面，任务重试时从断点继续
+
+    每个页面在转换前写入 start 记录，转换完成后写入 done 记录。
+    只有 done 的页面可以复用；只有 start 的页面输出不完整，需要回收。
+    start 记录立即写入操作系统，进程被终止时已开始写入的输出都有记录；done 记录按检查点持久化。
+    """
+
+    def __init__(self, task_id, journal_dir=CHECKPOINT_DIR, interval=CHECKPOINT_INTERVAL):
+        self.task_id = task_id
+        self.path = os.path.join(journal_dir, f"{task_id}.jsonl")
+        self.interval = max(interval, 1)
+        self.entries = {}  # 页面标识 -> 已完成的 {'page_number', 'target'}
+        self.targets = set()  # 日志中出现过的全部输出路径
+        self.used = set()  # 本次处理使用的输出路径
+        self.file = None
+        self.unsynced = 0
+
+    def load(self):
+        """读取日志并打开以便追加，返回上次中断时未完成转换的输出路径"""
+        started = {}
+        truncated = False
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    truncated = not line.endswith('\n')
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 中断时可能留下不完整的最后一行
+                        continue
+
+                    if record['op'] == 'start':
+                        started[record['key']] = record
+                        self.targets.add(record['target'])
+                    elif record['op'] == 'done' and record['key'] in started:
+                        self.entries[record['key']] = started.pop(record['key'])
+
+        # 输出文件已不存在的页面需要重新转换
+        for key, entry in list(self.entries.items()):
+            if not os.path.exists(FILE_PATH_PREFIX + entry['target']):
+                del self.entries[key]
+
+        if self.entries:
+            logger.info("任务 %s 从断点继续, 已转换 %s 页", self.task_id, len(self.entries))
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        if truncated:
+            # 之后追加的记录另起一行，不与不完整的最后一行拼接
+            self.file.write('\n')
+
+        # 复用已完成页面时也会写入 start 记录，这些输出仍然有效
+        reusable = {entry['target'] for entry in self.entries.values()}
+        return [record['target'] for record in started.values() if record['target'] not in reusable]
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def start(self, key, page_number, target):
+        """记录开始转换页面，在提交转换之前调用"""
+        self.targets.add(target)
+        self.used.add(target)
+        self._write({'op': 'start', 'key': key, 'page_number': page_number, 'target': target})
+        self.file.flush()
+
+    def done(self, key):
+        """记录页面转换完成，返回是否到达检查点"""
+        self._write({'op': 'done', 'key': key})
+        self.unsynced += 1
+        return self.unsynced >= self.interval
+
+    def flush(self):
+        """将缓冲的日志写入操作系统"""
+        if self.file:
+            self.file.flush()
+        self.unsynced = 0
+
+    def sync(self):
+        """将日志持久化到磁盘，可在线程中执行"""
+        if self.file:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file:
+            self.flush()
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        """任务结束后删除日志"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @staticmethod
+    def read_targets(path):
+        """读取日志中出现过的全部输出路径"""
+        targets = set()
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record['op'] == 'start':
+                    targets.add(record['target'])
+        return targets
+
+    @staticmethod
+    def stale_journals(max_age, journal_dir=CHECKPOINT_DIR):
+        """返回超过保留时间未更新的日志路径"""
+        if not os.path.isdir(journal_dir):
+            return []
+
+        deadline = time.time() - max_age
+        paths = (os.path.join(journal_dir, name) for name in os.listdir(journal_dir) if name.endswith('.jsonl'))
+        return [path for path in paths if os.path.getmtime(path) < deadline]
+
+    @staticmethod
+    def remove_outputs(targets):
+        """删除输出文件及其派生图"""
+        removed = 0
+        for target in targets:
+            for path in ImageService.derivative_paths(target):
+                try:
+                    os.remove(FILE_PATH_PREFIX + path)
+                except OSError:
+                    pass
+
+            try:
+                os.remove(FILE_PATH_PREFIX + target)
+                removed += 1
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning("删除输出文件失败 %s: %s", target, e)
+        return removed
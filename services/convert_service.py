@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from PIL import Image
+from config.settings import CONVERT_EXECUTOR, CONVERT_WORKERS, PAGE_CACHE_DIR, DECODE_MEMORY_BUDGET
+from services.cache_service import PageCache
+from services.image_service import ImageService
+from utils.logger import logger
+from utils.metrics import PAGE_CONVERT_SECONDS, PAGE_ENCODE_SECONDS, PAGE_CACHE_REQUESTS, DECODE_MEMORY_BYTES
+
+def _timed_call(func, *args):
+    """在执行器中运行函数，同时返回实际执行耗时(不含排队等待)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+def _warm_up():
+    """在转换进程中导入本模块(连同图片处理模块)和图片格式插件"""
+    Image.init()
+
+class MemoryBudget:
+    """按文件头估算的内存限制同时进行的解码，超过总额度的单幅图片独占全部额度"""
+
+    def __init__(self, total):
+        self.total = total
+        self.used = 0
+        self.condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, amount):
+        amount = min(amount, self.total)
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.used + amount <= self.total)
+            self.used += amount
+            DECODE_MEMORY_BYTES.set(self.used)
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.used -= amount
+                DECODE_MEMORY_BYTES.set(self.used)
+                self.condition.notify_all()
+
+class ConvertService:
+    """图片转换阶段，将解码/编码放到进程池或线程池中执行，避免阻塞事件循环"""
+
+    def __init__(self, executor_type=CONVERT_EXECUTOR, max_workers=CONVERT_WORKERS, cache_dir=PAGE_CACHE_DIR,
+                 memory_budget=DECODE_MEMORY_BUDGET):
+        self.executor_type = executor_type
+        self.max_workers = max_workers
+        self.cache = PageCache(cache_dir) if cache_dir else None
+        self.memory = MemoryBudget(memory_budget) if memory_budget else None
+        self.evicting = False
+
+        if executor_type == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='convert')
+        elif executor_type == 'process':
+            # spawn 启动的子进程不继承父进程的线程状态，避免 fork 时其他线程持有的锁(导入锁、文件读取锁)在子进程中死锁
+            self.executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            raise ValueError(f"不支持的转换执行器: {executor_type}")
+
+        logger.info("图片转换执行器: %s, 并发数: %s", executor_type, max_workers)
+
+    async def init(self):
+        """启动转换进程，统计页面缓存占用"""
+        if self.executor_type == 'process':
+            # spawn 启动的转换进程需要重新导入模块，预先全部启动，不计入第一个任务的耗时
+            await asyncio.gather(*(self.run(_warm_up) for _ in range(self.max_workers)))
+        if self.cache:
+            await asyncio.to_thread(self.cache.scan)
+
+    async def run(self, func, *args):
+        """在转换执行器中运行函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def run_timed(self, func, *args):
+        """在转换执行器中运行函数，并记录实际解码/编码耗时"""
+        elapsed, result = await self.run(_timed_call, func, *args)
+        PAGE_ENCODE_SECONDS.observe(elapsed)
+        return result
+
+    async def convert_to_jpg(self, source_path, target_path):
+        """在转换执行器中将图片转换为JPG格式，限制同时解码的内存总量"""
+        if self.memory is None:
+            return await self._convert_to_jpg(source_path, target_path)
+
+        # 先读取文件头估算内存(只解析文件头，放在线程中以免排在转换任务之后)，额度不足时等待其他页面转换完成
+        estimate = await asyncio.to_thread(ImageService.measure, source_path)
+        async with self.memory.reserve(estimate):
+            return await self._convert_to_jpg(source_path, target_path)
+
+    async def _convert_to_jpg(self, source_path, target_path):
+        """启用缓存时相同内容的图片直接复用转换结果"""
+        if self.cache is None:
+            return await self.run_timed(ImageService.convert_to_jpg, source_path, target_path)
+
+        hit, stored_size = await self.run_timed(PageCache.convert, self.cache.cache_dir, source_path, target_path)
+        PAGE_CACHE_REQUESTS.inc(result='hit' if hit else 'miss')
+        if self.cache.record(hit, stored_size) and not self.evicting:
+            self.evicting = True
+            try:
+                self.cache.size -= await asyncio.to_thread(self.cache.evict)
+            finally:
+                self.evicting = False
+        return True
+
+    async def convert_page(self, page, target_path):
+        """转换待导入的图片，已编码的JPG直接移动到目标位置"""
+        if page.encoded:
+            with PAGE_CONVERT_SECONDS.time(kind='move'):
+                place = ImageService.link_jpg if page.keep_source else ImageService.move_jpg
+                return await self.run(place, page.path, target_path)
+        with PAGE_CONVERT_SECONDS.time(kind='convert'):
+            return await self.convert_to_jpg(page.source, target_path)
+
+    def shutdown(self):
+        """关闭转换执行器"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -1,52 +1,366 @@
 # -*- coding: utf-8 -*-
 import aiomysql
+import time
 from datetime import datetime
-from utils.logger import logger
+from config.settings import (
+    DB_BATCH_SIZE, DOCUMENT_LOCK_TIMEOUT, WORKER_ID, CLAIM_OVERSAMPLE, LEASE_DURATION, MAX_RETRY_COUNT,
+    PAGE_DERIVATIVES, SCHEDULE_POLICY, STARVATION_AGE
+)
+from utils.logger import logger, log_page
+from utils.metrics import DB_INSERT_SECONDS, DB_POOL_WAIT_SECONDS, DB_POOL_IN_USE, STATUS_WRITES
+
+# 可以在内存中合并、延迟批量写入的任务字段
+_DEFERRED_COLUMNS = ('started_at', 'progress_done', 'progress_total')
+
+# 可领取的任务状态，待合并为全部分片已完成、等待合并的PDF父任务
+_CLAIMABLE_STATUSES = "'待重试', '未处理', '待合并'"
+
+# 任务的估算大小：分片按页数占整本的比例折算，已拆分的父任务只需合并，按 0 计
+_TASK_SIZE = """CASE
+    WHEN t.parent_task_id IS NOT NULL THEN f.file_size * (t.last_page - t.first_page + 1) DIV t.page_count
+    WHEN t.page_count IS NOT NULL THEN 0
+    ELSE f.file_size
+END"""
+
+# 同一文档中处理中的、会写入页面的任务
+_RUNNING_ON_DOCUMENT = """SELECT 1 FROM ww_document_file_tasks running
+    WHERE running.document_id = t.document_id AND running.status = '处理中' AND running.parent_task_id IS NULL"""
+
+# 调度策略对应的排序：fifo 先合并、重试后新任务、按创建时间；sjf 任务小的优先；fair 各文档轮流
+_POLICY_ORDER = {
+    'fifo': "FIELD(t.status, '待合并', '待重试', '未处理'), t.created_at ASC",
+    'sjf': f"{_TASK_SIZE} ASC, t.created_at ASC",
+    'fair': "ROW_NUMBER() OVER (PARTITION BY t.document_id ORDER BY t.created_at) ASC, t.created_at ASC",
+}
+
+class LeaseLostError(Exception):
+    """任务租约已被回收，任务可能已由其他节点领取，本节点不再提交其结果"""
+
+class DocumentLockTimeout(TimeoutError):
+    """文档锁被同一文档的其他任务占用，任务稍后重新排队"""
+
+class TimedPool:
+    """连接池包装，记录获取连接的等待耗时和已借出的连接数，其余属性转发给连接池"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+    def acquire(self):
+        return _TimedAcquire(self)
+
+    async def timed_acquire(self):
+        started = time.perf_counter()
+        conn = await self.pool.acquire()
+        DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+        DB_POOL_IN_USE.inc()
+        return conn
+
+    def release(self, conn):
+        DB_POOL_IN_USE.dec()
+        return self.pool.release(conn)
+
+class _TimedAcquire:
+    """与 aiomysql 的 pool.acquire() 用法相同，既可以 await 也可以用于 async with"""
 
-class DatabaseService:
     def __init__(self, pool):
         self.pool = pool
+        self.conn = None
+
+    def __await__(self):
+        return self.pool.timed_acquire().__await__()
+
+    async def __aenter__(self):
+        self.conn = await self.pool.timed_acquire()
+        return self.conn
+
+    async def __aexit__(self, *exc_info):
+        conn, self.conn = self.conn, None
+        await self.pool.release(conn)
+
+class DatabaseService:
+    def __init__(self, pool):
+        self.pool = TimedPool(pool)
+        self.held_locks = {}  # 连接 -> 该连接持有的文档锁名称
+
+    def session(self, status_writer=None):
+        """创建任务级数据库会话"""
+        return TaskSession(self, status_writer)
 
     # 获取待处理任务
-    async def fetch_tasks(self, max_workers):
+    async def fetch_tasks(self, max_workers, worker_id=WORKER_ID, lease_duration=LEASE_DURATION):
+        # 多取一些候选任务，以便跳过其他副本正在领取的任务
+        candidates = await self.fetch_candidates(max_workers * CLAIM_OVERSAMPLE)
+        return await self.claim_tasks(
+            [candidate['id'] for candidate in candidates], max_workers, worker_id, lease_duration
+        )
+
+    # 查询候选任务
+    async def fetch_candidates(self, limit, policy=SCHEDULE_POLICY, starvation_age=STARVATION_AGE, max_size=None):
+        """用非锁定读按调度策略取出候选任务及其文件信息，不领取任务
+
+        等待超过 starvation_age 秒的任务(aged=1)不论策略按创建时间排在最前；
+        max_size 不为空时只返回估算大小不超过该值的任务，file_size 为按 _TASK_SIZE 估算的任务大小。
+        同一文档已有任务在处理中时不返回该文档的任务，每个文档最多返回一个写入页面的任务
+        """
+        if policy not in _POLICY_ORDER:
+            raise ValueError(f"不支持的调度策略: {policy}")
+
+        if starvation_age:
+            aged = f"(t.created_at <= NOW() - INTERVAL {int(starvation_age)} SECOND)"
+        else:
+            aged = "0"
+
+        conditions = [
+            f"t.status IN ({_CLAIMABLE_STATUSES})",
+            "t.file_type in ('档案包', 'PDF', 'PDF分片')",
+            # 同一文档已有任务在处理时暂不领取，分片只渲染不写入页面，不受限制
+            f"(t.parent_task_id IS NOT NULL OR NOT EXISTS ({_RUNNING_ON_DOCUMENT}))",
+        ]
+        values = []
+        if max_size is not None:
+            conditions.append(f"{_TASK_SIZE} <= %s")
+            values.append(max_size)
+        values.append(limit)
+
         async with self.pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cur:
-                query = """
-                    SELECT t.*, f.file_path
+                await cur.execute(f"""
+                    SELECT t.id, t.document_id, t.status, t.file_type, t.retry_count, t.created_at,
+                           t.parent_task_id, t.first_page, t.last_page, t.page_count,
+                           f.file_path, {_TASK_SIZE} AS file_size,
+                           {aged} AS aged
                     FROM ww_document_file_tasks t
                     JOIN ww_document_files f ON t.document_file_id = f.id
-                    WHERE t.status IN ('待重试', '未处理') AND t.file_type in ('档案包', 'PDF')
-                    ORDER BY FIELD(t.status, '待重试', '未处理'), t.created_at ASC
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY {aged} DESC, IF({aged}, t.created_at, NULL) ASC, {_POLICY_ORDER[policy]}
                     LIMIT %s
-                """
-                await cur.execute(query, (max_workers,))
-                tasks = await cur.fetchall()
-
-                if tasks:
-                    # 立即更新这些任务的状态为处理中
-                    task_ids = [task['id'] for task in tasks]
-                    placeholders = ','.join(['%s'] * len(task_ids))
-                    update_query = f"""
-                        UPDATE ww_document_file_tasks 
-                        SET status = '处理中', 
-                            updated_at = NOW()
-                        WHERE id IN ({placeholders})
-                    """
-
-                    await cur.execute(update_query, task_ids)
-                
+                """, values)
+                candidates = await cur.fetchall()
+
+            # 结束非锁定读的快照，下次查询能读到新提交的任务
+            await conn.commit()
+
+        # 同一文档一次只领取一个写入页面的任务
+        documents = set()
+        filtered = []
+        for candidate in candidates:
+            if candidate['parent_task_id'] is None:
+                if candidate['document_id'] in documents:
+                    continue
+                documents.add(candidate['document_id'])
+            filtered.append(candidate)
+        return filtered
+
+    # 领取任务
+    async def claim_tasks(self, candidate_ids, max_workers, worker_id=WORKER_ID, lease_duration=LEASE_DURATION):
+        """按候选顺序领取最多 max_workers 个任务，跳过已被其他副本领取的任务"""
+        tasks = []
+        if not candidate_ids:
+            return tasks
+
+        async with self.pool.acquire() as conn:
+            try:
+                async with conn.cursor(aiomysql.DictCursor) as cur:
+                    await conn.begin()
+
+                    # 按主键锁定候选任务，跳过已被其他副本锁定的行，并以最新提交的状态再次确认
+                    placeholders = ','.join(['%s'] * len(candidate_ids))
+                    await cur.execute(f"""
+                        SELECT id FROM ww_document_file_tasks
+                        WHERE id IN ({placeholders}) AND status IN ({_CLAIMABLE_STATUSES})
+                        FOR UPDATE SKIP LOCKED
+                    """, candidate_ids)
+                    locked_ids = {row['id'] for row in await cur.fetchall()}
+                    task_ids = [task_id for task_id in candidate_ids if task_id in locked_ids][:max_workers]
+
+                    if task_ids:
+                        # 立即更新这些任务的状态为处理中，记录领取任务的工作节点并开始租约
+                        placeholders = ','.join(['%s'] * len(task_ids))
+                        await cur.execute(f"""
+                            UPDATE ww_document_file_tasks
+                            SET status = '处理中',
+                                worker_id = %s,
+                                lease_expires_at = NOW() + INTERVAL %s SECOND,
+                                heartbeat_at = NOW(),
+                                progress_done = 0,
+                                progress_total = 0,
+                                updated_at = NOW()
+                            WHERE id IN ({placeholders})
+                        """, [worker_id, lease_duration] + task_ids)
+
+                        await cur.execute(f"""
+                            SELECT t.*, f.file_path, f.file_size
+                            FROM ww_document_file_tasks t
+                            JOIN ww_document_files f ON t.document_file_id = f.id
+                            WHERE t.id IN ({placeholders})
+                            ORDER BY FIELD(t.id, {placeholders})
+                        """, task_ids + task_ids)
+                        tasks = await cur.fetchall()
+
                 # 提交事务
                 await conn.commit()
 
-                # 打印日志
-                logger.info(f"获取到 {len(tasks)} 个任务")
+            except Exception:
+                await conn.rollback()
+                raise
+
+        # 打印日志
+        logger.info("%s 获取到 %s 个任务", worker_id, len(tasks))
+
+        return tasks
 
-                return tasks
+    # 续约任务租约
+    async def renew_leases(self, task_ids, worker_id=WORKER_ID, lease_duration=LEASE_DURATION):
+        """延长本节点持有的任务租约
+
+        返回仍由本节点持有的任务ID集合，不在其中的任务已被回收或改由其他节点处理
+        """
+        if not task_ids:
+            return set()
+
+        task_ids = list(task_ids)
+        placeholders = ','.join(['%s'] * len(task_ids))
+
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"""
+                    UPDATE ww_document_file_tasks
+                    SET lease_expires_at = NOW() + INTERVAL %s SECOND,
+                        heartbeat_at = NOW()
+                    WHERE id IN ({placeholders}) AND worker_id = %s AND status = '处理中'
+                """, [lease_duration] + task_ids + [worker_id])
+
+                await cur.execute(f"""
+                    SELECT id FROM ww_document_file_tasks
+                    WHERE id IN ({placeholders}) AND worker_id = %s AND status = '处理中'
+                """, task_ids + [worker_id])
+                renewed = {row[0] for row in await cur.fetchall()}
+
+            await conn.commit()
+
+        return renewed
+
+    # 确认任务仍由本节点持有
+    async def lock_owned_task(self, task_id, conn, worker_id=WORKER_ID):
+        """在提交事务中锁定任务行，租约已被回收或任务已由其他节点领取时抛出 LeaseLostError
+
+        任务行锁持有到事务结束，其间租约不会被回收，页面和状态一起提交或一起放弃
+        """
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                SELECT worker_id, status FROM ww_document_file_tasks WHERE id = %s FOR UPDATE
+            """, (task_id,))
+            row = await cur.fetchone()
+
+        if not row or row[0] != worker_id or row[1] != '处理中':
+            raise LeaseLostError(f"任务 {task_id} 的租约已失效，放弃提交")
+
+    # 批量写入处理中任务的状态字段
+    async def flush_task_updates(self, updates, worker_id=WORKER_ID):
+        """用一条 UPDATE 写入多个任务合并后的字段，updates 为 {task_id: {列名: 值}}
+
+        只更新仍由本节点处理中的任务，已结束或被回收的任务不受影响
+        """
+        if not updates:
+            return 0
+
+        task_ids = list(updates)
+        placeholders = ','.join(['%s'] * len(task_ids))
+        assignments = []
+        values = []
+        for column in sorted({column for fields in updates.values() for column in fields}):
+            if column not in _DEFERRED_COLUMNS:
+                raise ValueError(f"不支持合并写入的列: {column}")
+            rows = [(task_id, fields[column]) for task_id, fields in updates.items() if column in fields]
+            cases = ' '.join(['WHEN %s THEN %s'] * len(rows))
+            assignments.append(f"{column} = CASE id {cases} ELSE {column} END")
+            values.extend(value for row in rows for value in row)
+
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"""
+                    UPDATE ww_document_file_tasks
+                    SET {', '.join(assignments)}, updated_at = NOW()
+                    WHERE id IN ({placeholders}) AND worker_id = %s AND status = '处理中'
+                """, values + task_ids + [worker_id])
+                updated = cur.rowcount
+
+            await conn.commit()
+
+        return updated
+
+    # 回收租约过期的任务
+    async def reclaim_expired_tasks(self, lease_duration=LEASE_DURATION, max_retry=MAX_RETRY_COUNT):
+        """把租约过期的处理中任务重新排队，重试次数用尽的任务置为已失败，返回 (回收的任务数, 置为已失败的PDF父任务ID)
+
+        没有租约的处理中任务(升级前领取的任务)按最后更新时间判断。
+        与 complete_shard 相同，先锁定父任务行再更新分片，避免与完成分片的事务交叉加锁而死锁
+        """
+        expired = """status = '处理中'
+                      AND (lease_expires_at < NOW()
+                           OR (lease_expires_at IS NULL AND updated_at < NOW() - INTERVAL %s SECOND))"""
+
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"""
+                    SELECT DISTINCT parent_task_id FROM ww_document_file_tasks
+                    WHERE parent_task_id IS NOT NULL AND {expired}
+                """, (lease_duration,))
+                parent_ids = sorted(row[0] for row in await cur.fetchall())
+
+                # 按ID顺序锁定父任务，只回收父任务已锁定的分片，其余分片留到下一次回收
+                shard_condition = "parent_task_id IS NULL"
+                if parent_ids:
+                    placeholders = ','.join(['%s'] * len(parent_ids))
+                    await cur.execute(f"""
+                        SELECT id FROM ww_document_file_tasks WHERE id IN ({placeholders}) ORDER BY id FOR UPDATE
+                    """, parent_ids)
+                    shard_condition = f"(parent_task_id IS NULL OR parent_task_id IN ({placeholders}))"
+
+                # SET 按顺序求值，retry_count 和 failed_at 读取的是已更新的 status
+                await cur.execute(f"""
+                    UPDATE ww_document_file_tasks
+                    SET status = IF(retry_count < %s, '待重试', '已失败'),
+                        retry_count = IF(status = '待重试', retry_count + 1, retry_count),
+                        failed_at = IF(status = '已失败', NOW(), failed_at),
+                        failure_reason = CONCAT('任务租约过期: ', IFNULL(worker_id, '未知节点')),
+                        worker_id = NULL,
+                        lease_expires_at = NULL,
+                        updated_at = NOW()
+                    WHERE {expired} AND {shard_condition}
+                """, [max_retry, lease_duration] + parent_ids)
+                reclaimed = cur.rowcount
+
+                # 分片重试次数用尽后父任务不会再合并，与 fail_shards 一样把父任务及其余分片置为已失败
+                await cur.execute("""
+                    SELECT shard.parent_task_id, shard.id, shard.failure_reason
+                    FROM ww_document_file_tasks shard
+                    JOIN ww_document_file_tasks parent ON parent.id = shard.parent_task_id
+                    WHERE shard.status = '已失败' AND parent.status = '分片处理中'
+                """)
+                failed_shards = {}
+                for parent_task_id, shard_id, reason in await cur.fetchall():
+                    failed_shards.setdefault(parent_task_id, f"分片任务 {shard_id} 失败: {reason}")
+                for parent_task_id, reason in failed_shards.items():
+                    await self._fail_shards(cur, parent_task_id, reason)
+
+            await conn.commit()
+
+        if reclaimed:
+            logger.warning("回收租约过期的任务 %s 个", reclaimed)
+        if failed_shards:
+            logger.warning("分片任务已失败，父任务置为已失败: %s", list(failed_shards))
+
+        return reclaimed, list(failed_shards)
 
     # 更新任务状态
-    async def update_task_status(self, task_id, status, conn=None, **kwargs):
+    async def update_task_status(self, task_id, status, conn=None, count_retry=True, **kwargs):
+        """更新任务状态，count_retry 为假时重新排队不计入重试次数"""
         # 打印日志
-        logger.info(f"更新任务状态: task_id={task_id}, status={status}")
+        logger.debug("更新任务状态: task_id=%s, status=%s", task_id, status)
 
         new_connection = conn is None
 
@@ -62,7 +376,7 @@ class DatabaseService:
             updates.append("status = %s")
             values.append(status)
 
-            if status == '处理中':
+            if status == '处理中' and 'started_at' not in kwargs:
                 updates.append("started_at = %s")
                 values.append(datetime.now())
             elif status == '已完成':
@@ -71,16 +385,14 @@ class DatabaseService:
             elif status == '已失败':
                 updates.append("failed_at = %s")
                 values.append(datetime.now())
-            elif status == '待重试':
+            elif status == '待重试' and count_retry:
                 updates.append("retry_count = retry_count + 1")
 
-            if 'failure_reason' in kwargs:
-                updates.append("failure_reason = %s")
-                values.append(kwargs['failure_reason'])
-
-            if 'details' in kwargs:
-                updates.append("details = %s")
-                values.append(kwargs['details'])
+            # 终态可以同时写入合并中尚未写入的开始时间和进度
+            for column in ('failure_reason', 'details') + _DEFERRED_COLUMNS:
+                if column in kwargs:
+                    updates.append(f"{column} = %s")
+                    values.append(kwargs[column])
 
             updates.append("updated_at = %s")
             values.append(datetime.now())
@@ -97,11 +409,166 @@ class DatabaseService:
                 await conn.commit()
                 await self.pool.release(conn)
 
+    # 拆分PDF为分片任务
+    async def create_shards(self, task, page_count, ranges, conn=None):
+        """为PDF父任务插入按页码区间划分的分片任务，并把父任务置为分片处理中，在一个事务中完成
+
+        分片沿用父任务的创建时间参与调度，ranges 为 [(起始页, 结束页), ...]。
+        提供 conn 时在该连接上执行，事务仍在本方法内提交
+        """
+        new_connection = conn is None
+
+        if new_connection:
+            conn = await self.acquire()
+
+        try:
+            async with conn.cursor() as cur:
+                await self.begin(conn)
+
+                await cur.executemany("""
+                    INSERT INTO ww_document_file_tasks
+                    (document_id, document_file_id, document_directory_id, file_type, status, retry_count,
+                     parent_task_id, first_page, last_page, page_count, created_at, updated_at)
+                    VALUES (%s, %s, %s, 'PDF分片', '未处理', 0, %s, %s, %s, %s, %s, NOW())
+                """, [
+                    (task['document_id'], task['document_file_id'], task['document_directory_id'],
+                     task['id'], first_page, last_page, page_count, task['created_at'])
+                    for first_page, last_page in ranges
+                ])
+
+                # 父任务不再持有租约，由最后完成的分片置为待合并
+                await cur.execute("""
+                    UPDATE ww_document_file_tasks
+                    SET status = '分片处理中',
+                        page_count = %s,
+                        details = %s,
+                        worker_id = NULL,
+                        lease_expires_at = NULL,
+                        updated_at = NOW()
+                    WHERE id = %s
+                """, (page_count, f"{len(ranges)} 个分片", task['id']))
+
+            await self.commit(conn)
+
+        except BaseException:
+            await self.rollback(conn)
+            raise
+
+        finally:
+            if new_connection:
+                self.release(conn)
+
+        logger.info("任务 %s 共 %s 页，拆分为 %s 个分片", task['id'], page_count, len(ranges))
+
+    # 获取PDF父任务的分片
+    async def get_shards(self, parent_task_id, conn=None):
+        new_connection = conn is None
+
+        if new_connection:
+            conn = await self.acquire()
+
+        try:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute("""
+                    SELECT id, status, first_page, last_page FROM ww_document_file_tasks
+                    WHERE parent_task_id = %s
+                    ORDER BY first_page
+                """, (parent_task_id,))
+                return await cur.fetchall()
+
+        finally:
+            if new_connection:
+                await conn.commit()
+                self.release(conn)
+
+    # 完成分片
+    async def complete_shard(self, task_id, parent_task_id, conn=None, **kwargs):
+        """把分片置为已完成，全部分片都已完成时把父任务置为待合并，返回父任务更新后的状态
+
+        先锁定父任务行，同一PDF的分片依次完成，最后一个完成的分片能看到其他分片的最新状态；
+        分片已不由本节点持有时抛出 LeaseLostError。提供 conn 时在该连接上执行，事务仍在本方法内提交
+        """
+        new_connection = conn is None
+
+        if new_connection:
+            conn = await self.acquire()
+
+        try:
+            await self.begin(conn)
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    SELECT status FROM ww_document_file_tasks WHERE id = %s FOR UPDATE
+                """, (parent_task_id,))
+                row = await cur.fetchone()
+                parent_status = row[0] if row else None
+
+                await self.lock_owned_task(task_id, conn)
+                await self.update_task_status(task_id, '已完成', conn=conn, **kwargs)
+
+                await cur.execute("""
+                    SELECT COUNT(*) FROM ww_document_file_tasks
+                    WHERE parent_task_id = %s AND status != '已完成'
+                    FOR UPDATE
+                """, (parent_task_id,))
+                remaining = (await cur.fetchone())[0]
+
+                if not remaining and parent_status == '分片处理中':
+                    await self.update_task_status(parent_task_id, '待合并', conn=conn)
+                    parent_status = '待合并'
+
+            await self.commit(conn)
+
+        except BaseException:
+            await self.rollback(conn)
+            raise
+
+        finally:
+            if new_connection:
+                self.release(conn)
+
+        return parent_status
+
+    # 分片失败
+    async def fail_shards(self, parent_task_id, failure_reason, conn=None):
+        """分片不再重试时父任务置为已失败，尚未开始的其他分片一并置为已失败"""
+        new_connection = conn is None
+
+        if new_connection:
+            conn = await self.acquire()
+
+        try:
+            await self.begin(conn)
+            async with conn.cursor() as cur:
+                await self._fail_shards(cur, parent_task_id, failure_reason)
+
+            await self.commit(conn)
+
+        except BaseException:
+            await self.rollback(conn)
+            raise
+
+        finally:
+            if new_connection:
+                self.release(conn)
+
+    @staticmethod
+    async def _fail_shards(cur, parent_task_id, failure_reason):
+        await cur.execute("""
+            SELECT id FROM ww_document_file_tasks WHERE id = %s FOR UPDATE
+        """, (parent_task_id,))
+
+        await cur.execute("""
+            UPDATE ww_document_file_tasks
+            SET status = '已失败', failed_at = NOW(), failure_reason = %s, updated_at = NOW()
+            WHERE (id = %s AND status = '分片处理中')
+               OR (parent_task_id = %s AND status IN ('未处理', '待重试'))
+        """, (failure_reason, parent_task_id, parent_task_id))
+
     # 插入目录
     async def insert_directory(self, document_id, parent_id, name, start_page, number, conn=None):
         # 打印日志
-        logger.info(f"插入目录: document_id={document_id}, parent_id={parent_id}, "
-                    f"name={name}, start_page={start_page}, number={number}")
+        log_page("插入目录: document_id=%s, parent_id=%s, name=%s, start_page=%s, number=%s",
+                 document_id, parent_id, name, start_page, number)
 
         new_connection = conn is None
 
@@ -130,8 +597,8 @@ class DatabaseService:
     # 插入页面
     async def insert_page(self, title, document_id, directory_id, page_number, image_path, conn=None):
         # 打印日志
-        logger.info(f"插入页面: title={title}, document_id={document_id}, "
-                    f"directory_id={directory_id}, page_number={page_number}, image_path={image_path}")
+        log_page("插入页面: title=%s, document_id=%s, directory_id=%s, page_number=%s, image_path=%s",
+                 title, document_id, directory_id, page_number, image_path)
     
         new_connection = conn is None
 
@@ -154,9 +621,106 @@ class DatabaseService:
                 await conn.commit()
                 await self.pool.release(conn)
 
+    # 批量插入目录
+    async def insert_directories(self, document_id, directories, conn=None, batch_size=DB_BATCH_SIZE):
+        """批量插入目录，directories 为 (parent_id, name, start_page, number) 列表，返回顺序对应的目录ID"""
+        logger.debug("批量插入目录: document_id=%s, count=%s", document_id, len(directories))
+
+        new_connection = conn is None
+
+        if new_connection:
+            conn = await self.pool.acquire()
+
+        cur = await conn.cursor()
+        directory_ids = []
+
+        try:
+            await cur.execute("SELECT @@auto_increment_increment")
+            increment = (await cur.fetchone())[0]
+
+            for start in range(0, len(directories), batch_size):
+                batch = directories[start:start + batch_size]
+                placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))
+                values = []
+                for parent_id, name, start_page, number in batch:
+                    values.extend((document_id, parent_id, name, start_page, number))
+
+                with DB_INSERT_SECONDS.time(table='ww_document_directories'):
+                    await cur.execute(f"""
+                        INSERT INTO ww_document_directories
+                        (document_id, parent_directory_id, name, start_page, number)
+                        VALUES {placeholders}
+                    """, values)
+
+                # 单条多行INSERT分配连续的自增ID，lastrowid 为第一行的ID
+                batch_ids = [cur.lastrowid + i * increment for i in range(len(batch))]
+
+                # 校验推算的ID确实属于本批插入的行
+                id_placeholders = ','.join(['%s'] * len(batch_ids))
+                await cur.execute(f"""
+                    SELECT id, document_id, parent_directory_id FROM ww_document_directories
+                    WHERE id IN ({id_placeholders})
+                """, batch_ids)
+                inserted = {row[0]: (row[1], row[2]) for row in await cur.fetchall()}
+                for directory_id, (parent_id, *_) in zip(batch_ids, batch):
+                    if inserted.get(directory_id) != (document_id, parent_id):
+                        raise RuntimeError(f"目录自增ID不连续，无法映射批量插入结果: document_id={document_id}")
+
+                directory_ids.extend(batch_ids)
+
+            return directory_ids
+
+        finally:
+            await cur.close()
+
+            if new_connection:
+                await conn.commit()
+                await self.pool.release(conn)
+
+    # 批量插入页面
+    async def insert_pages(self, pages, conn=None, derivatives=PAGE_DERIVATIVES):
+        """批量插入页面，pages 为 (title, document_id, directory_id, page_number, image_path, *派生图路径) 列表
+
+        派生图路径按 derivatives 的顺序写入对应的 {名称}_path 列
+        """
+        if not pages:
+            return
+
+        logger.debug("批量插入页面: count=%s", len(pages))
+
+        new_connection = conn is None
+
+        if new_connection:
+            conn = await self.pool.acquire()
+
+        cur = await conn.cursor()
+
+        try:
+            columns = ['title', 'document_id', 'directory_id', 'page_number', 'image_path']
+            columns += [f"{name}_path" for name in derivatives]
+            placeholders = ', '.join(['%s'] * len(columns))
+
+            with DB_INSERT_SECONDS.time(table='ww_document_pages'):
+                await cur.executemany(f"""
+                    INSERT INTO ww_document_pages
+                    ({', '.join(columns)})
+                    VALUES ({placeholders})
+                """, pages)
+
+        finally:
+            await cur.close()
+
+            if new_connection:
+                await conn.commit()
+                await self.pool.release(conn)
+
     # 检查页面是否已存在
-    async def check_page_exists(self, document_id, page_number):
-        conn = await self.pool.acquire()
+    async def check_page_exists(self, document_id, page_number, conn=None):
+        new_connection = conn is None
+
+        if new_connection:
+            conn = await self.pool.acquire()
+
         cur = await conn.cursor()
         
         try:
@@ -168,11 +732,93 @@ class DatabaseService:
 
         finally:
             await cur.close()
-            await self.pool.release(conn)
+
+            if new_connection:
+                await self.pool.release(conn)
+
+    # 获取文档已有的全部页码
+    async def get_page_numbers(self, document_id, conn=None):
+        new_connection = conn is None
+
+        if new_connection:
+            conn = await self.pool.acquire()
+
+        cur = await conn.cursor()
+
+        try:
+            await cur.execute("""
+                SELECT page_number FROM ww_document_pages
+                WHERE document_id = %s
+            """, (document_id,))
+            return {row[0] for row in await cur.fetchall()}
+
+        finally:
+            await cur.close()
+
+            if new_connection:
+                # 结束非锁定读的快照
+                await conn.commit()
+                await self.pool.release(conn)
+
+    # 筛选已被页面记录引用的图片路径
+    async def get_referenced_image_paths(self, image_paths, batch_size=DB_BATCH_SIZE, conn=None):
+        image_paths = list(image_paths)
+        referenced = set()
+        if not image_paths:
+            return referenced
+
+        new_connection = conn is None
+
+        if new_connection:
+            conn = await self.acquire()
+
+        try:
+            async with conn.cursor() as cur:
+                for start in range(0, len(image_paths), batch_size):
+                    batch = image_paths[start:start + batch_size]
+                    placeholders = ','.join(['%s'] * len(batch))
+                    await cur.execute(f"""
+                        SELECT image_path FROM ww_document_pages
+                        WHERE image_path IN ({placeholders})
+                    """, batch)
+                    referenced.update(row[0] for row in await cur.fetchall())
+
+        finally:
+            if new_connection:
+                self.release(conn)
+
+        return referenced
+
+    # 获取文档锁，同一文档的任务在提交前互斥
+    async def lock_document(self, document_id, conn, timeout=DOCUMENT_LOCK_TIMEOUT):
+        lock_name = f"edoc:document:{document_id}"
+
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT GET_LOCK(%s, %s)", (lock_name, timeout))
+            result = await cur.fetchone()
+
+        if not result or result[0] != 1:
+            raise DocumentLockTimeout(f"获取文档锁超时: document_id={document_id}")
+
+        self.held_locks.setdefault(conn, []).append(lock_name)
+
+    # 释放连接持有的文档锁
+    async def release_locks(self, conn):
+        lock_names = self.held_locks.pop(conn, [])
+        if not lock_names:
+            return
+
+        async with conn.cursor() as cur:
+            for lock_name in lock_names:
+                await cur.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
 
     # 获取文档的最后一页号码
-    async def get_max_page(self, document_id):
-        conn = await self.pool.acquire()
+    async def get_max_page(self, document_id, conn=None):
+        new_connection = conn is None
+
+        if new_connection:
+            conn = await self.pool.acquire()
+
         cur = await conn.cursor()
 
         try:
@@ -188,17 +834,147 @@ class DatabaseService:
         
         finally:
             await cur.close()
-            await self.pool.release(conn)
+
+            if new_connection:
+                await self.pool.release(conn)
     
-    async def start_transaction(self):
-        conn = await self.pool.acquire()
+    async def acquire(self):
+        return await self.pool.acquire()
+
+    def release(self, conn):
+        self.pool.release(conn)
+
+    async def begin(self, conn):
         await conn.begin()
+
+    async def commit(self, conn):
+        await conn.commit()
+        await self.release_locks(conn)
+
+    async def rollback(self, conn):
+        await conn.rollback()
+        await self.release_locks(conn)
+
+    async def start_transaction(self):
+        conn = await self.acquire()
+        await self.begin(conn)
         return conn
 
     async def commit_transaction(self, conn):
-        await conn.commit()
-        self.pool.release(conn)
+        await self.commit(conn)
+        self.release(conn)
 
     async def rollback_transaction(self, conn):
-        await conn.rollback()
-        self.pool.release(conn)
\ No newline at end of file
+        await self.rollback(conn)
+        self.release(conn)
+
+
+class TaskSession:
+    """任务级数据库会话，一个任务的读写和页面事务复用同一个连接
+
+    连接在第一次使用时获取，任务结束时归还连接池。任务状态在页面事务之外更新并立即提交，
+    页面事务进行中更新状态时改用单独的连接，避免状态随页面一起回滚。
+    提供 status_writer 时，处理中状态交由其合并后批量写入，其他状态连同尚未写入的字段立即写入
+    """
+
+    def __init__(self, db_service, status_writer=None):
+        self.db_service = db_service
+        self.status_writer = status_writer
+        self.conn = None
+        self.in_transaction = False
+        self.deferred = set()  # 交由 status_writer 合并写入的任务ID
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connection(self):
+        if self.conn is None:
+            self.conn = await self.db_service.acquire()
+        return self.conn
+
+    async def begin(self):
+        """开始页面事务，返回事务所在的连接"""
+        conn = await self.connection()
+        await self.db_service.begin(conn)
+        self.in_transaction = True
+        return conn
+
+    async def commit(self):
+        self.in_transaction = False
+        await self.db_service.commit(self.conn)
+
+    async def rollback(self):
+        self.in_transaction = False
+        await self.db_service.rollback(self.conn)
+
+    async def update_task_status(self, task_id, status, **kwargs):
+        if self.status_writer and status == '处理中' and not kwargs:
+            # 领取时状态已是处理中，开始时间随下一次批量写入
+            self.status_writer.started(task_id)
+            self.deferred.add(task_id)
+            return
+
+        kwargs = {**self.take_pending(task_id), **kwargs}
+        STATUS_WRITES.inc(mode='immediate')
+        if self.in_transaction:
+            return await self.db_service.update_task_status(task_id, status, **kwargs)
+
+        conn = await self.connection()
+        await self.db_service.update_task_status(task_id, status, conn=conn, **kwargs)
+        await conn.commit()
+
+    async def complete(self, task_id, **kwargs):
+        """在页面事务中把任务置为已完成，随页面一起提交"""
+        kwargs = {**self.take_pending(task_id), **kwargs}
+        STATUS_WRITES.inc(mode='immediate')
+        await self.db_service.update_task_status(task_id, '已完成', conn=self.conn, **kwargs)
+
+    def take_pending(self, task_id):
+        """取出任务尚未批量写入的字段，随终态一起写入"""
+        self.deferred.discard(task_id)
+        return self.status_writer.take(task_id) if self.status_writer else {}
+
+    async def close(self):
+        """归还连接，未提交的页面事务回滚，未写入终态的任务不再批量写入"""
+        for task_id in list(self.deferred):
+            self.take_pending(task_id)
+
+        if self.conn is None:
+            return
+
+        conn, self.conn = self.conn, None
+        try:
+            if self.in_transaction:
+                self.in_transaction = False
+                await self.db_service.rollback(conn)
+        finally:
+            self.db_service.release(conn)
+
+
+class PageWriteBuffer:
+    """页面写入缓冲区，累积到批次大小后批量插入"""
+
+    def __init__(self, db_service, conn, batch_size=DB_BATCH_SIZE):
+        self.db_service = db_service
+        self.conn = conn
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+
+    async def add(self, title, document_id, directory_id, page_number, image_path, *derivative_paths):
+        """添加一个页面，缓冲区满时自动写入"""
+        self.rows.append((title, document_id, directory_id, page_number, image_path) + derivative_paths)
+        if len(self.rows) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """写入缓冲区中的全部页面"""
+        if not self.rows:
+            return
+
+        rows, self.rows = self.rows, []
+        await self.db_service.insert_pages(rows, conn=self.conn)
+        self.count += len(rows)
@@ -1,51 +1,205 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import os
+import re
 import uuid
 import zipfile
 import shutil
-from pdf2image import convert_from_path
-from utils.logger import logger
-from config.settings import FILE_PATH_PREFIX
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pdf2image import convert_from_path, pdfinfo_from_path
+from models.source import SourceDirectory, SourcePage, ZipMember
+from services.image_service import ImageService
+from utils.logger import logger, log_page
+from config.settings import (
+    FILE_PATH_PREFIX, PDF_DPI, PDF_CHUNK_SIZE, PDF_THREAD_COUNT, PDF_PASSTHROUGH, PDF_SHARD_DIR, ZIP_EXTRACT_THREADS
+)
+
+# 解压线程池，所有任务共用，zlib 解压时释放 GIL
+_extract_executor = ThreadPoolExecutor(max_workers=max(ZIP_EXTRACT_THREADS, 1), thread_name_prefix='zip-extract')
+
+# 正在后台删除的目录
+_background_cleanups = set()
+
+# 等待后台删除的目录名后缀
+_DELETING_SUFFIX = '.deleting-'
+
+# ZIP成员名称使用UTF-8编码的标志位
+_ZIP_UTF8_FLAG = 0x800
+
+# 未标记UTF-8的成员名称依次尝试的编码
+_ZIP_NAME_ENCODINGS = ('utf-8', 'gbk')
+
+# 判断页面能否直接提取JPEG需要的 pdfimages -list 列
+_PDFIMAGES_COLUMNS = {'page', 'type', 'width', 'height', 'color', 'comp', 'bpc', 'enc', 'x-ppi', 'y-ppi'}
 
 class FileService:
+    @staticmethod
+    def zip_name_encoding(infos):
+        """检测整个ZIP包中未标记UTF-8的成员名称的原始编码，全部名称都能解码时采用
+
+        UTF-8 的校验最严格，优先尝试；都无法解码时返回 None，由各成员分别检测
+        """
+        raw_names = [info.filename.encode('cp437') for info in infos if not info.flag_bits & _ZIP_UTF8_FLAG]
+        for encoding in _ZIP_NAME_ENCODINGS:
+            try:
+                for raw_name in raw_names:
+                    raw_name.decode(encoding)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        return None
+
+    @staticmethod
+    def decode_zip_name(info, encoding=None):
+        """还原成员名称的编码：标记UTF-8的名称已由 zipfile 正确解码；
+        其余名称优先按整个ZIP包检测的编码解码，失败时单独检测，都无法解码时保留按 cp437 解码的名称
+        """
+        if info.flag_bits & _ZIP_UTF8_FLAG:
+            return info.filename
+        raw_name = info.filename.encode('cp437')
+        for candidate in ((encoding,) if encoding else ()) + _ZIP_NAME_ENCODINGS:
+            try:
+                return raw_name.decode(candidate)
+            except UnicodeDecodeError:
+                continue
+        return info.filename
+
+    @staticmethod
+    def decode_zip_names(zip_ref):
+        """返回 [(成员名称, 还原编码后的名称)]，编码按整个ZIP包检测一次"""
+        infos = zip_ref.infolist()
+        encoding = FileService.zip_name_encoding(infos)
+        return [(info.filename, FileService.decode_zip_name(info, encoding)) for info in infos]
+
+    @staticmethod
+    def plan_zip_extraction(full_path, temp_dir, thread_count=ZIP_EXTRACT_THREADS):
+        """读取中央目录并创建全部目录，把待解压的文件按解压后大小均分给各线程
+
+        返回 [[(成员名称, 目标路径), ...], ...]，同名成员以后出现的为准
+        """
+        targets = {}  # 目标路径 -> (成员名称, 解压后大小)
+        with zipfile.ZipFile(full_path, 'r') as zip_ref:
+            sizes = {info.filename: info.file_size for info in zip_ref.infolist()}
+            for file, filename in FileService.decode_zip_names(zip_ref):
+                parts = [part for part in filename.split('/') if part not in ('', '.', '..')]
+                if not parts:
+                    continue
+
+                target_path = os.path.join(temp_dir, *parts)
+                if filename.endswith('/'):
+                    os.makedirs(target_path, exist_ok=True)
+                    continue
+
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                targets[target_path] = (file, sizes[file])
+
+        # 大文件优先分配给当前总量最小的线程
+        buckets = [[] for _ in range(max(1, min(thread_count, len(targets))))]
+        loads = [0] * len(buckets)
+        for target_path, (file, size) in sorted(targets.items(), key=lambda item: -item[1][1]):
+            index = loads.index(min(loads))
+            buckets[index].append((file, target_path))
+            loads[index] += size
+        return [bucket for bucket in buckets if bucket]
+
+    @staticmethod
+    def extract_members(full_path, members):
+        """用独立的文件句柄依次解压成员，先写入临时文件再改名，中断时不留下不完整的文件"""
+        with zipfile.ZipFile(full_path, 'r') as zip_ref:
+            for file, target_path in members:
+                temp_path = f"{target_path}.part"
+                with zip_ref.open(file) as source, open(temp_path, 'wb') as target:
+                    shutil.copyfileobj(source, target, 1024 * 1024)
+                os.replace(temp_path, target_path)
+
     @staticmethod
     async def extract_zip(file_path, temp_dir):
-        """解压ZIP文件到临时目录"""
+        """解压ZIP文件到临时目录，成员在解压线程池中并行解压，不阻塞事件循环"""
         try:
             full_path = FILE_PATH_PREFIX + file_path
+            buckets = await asyncio.to_thread(FileService.plan_zip_extraction, full_path, temp_dir)
 
-            with zipfile.ZipFile(full_path, 'r') as zip_ref:
-                for file in zip_ref.namelist():
-                    try:
-                        # 尝试使用gbk解码
-                        filename = file.encode('cp437').decode('gbk')
-                    except:
-                        try:
-                            # 如果gbk解码失败，尝试使用utf-8
-                            filename = file.encode('cp437').decode('utf-8')
-                        except:
-                            filename = file
-
-                    if filename.endswith('/'):
-                        os.makedirs(os.path.join(temp_dir, filename), exist_ok=True)
-                        continue
-
-                    temp_path = os.path.join(temp_dir, 'temp_' + os.path.basename(file))
-                    with zip_ref.open(file) as source, open(temp_path, 'wb') as target:
-                        shutil.copyfileobj(source, target)
-
-                    final_path = os.path.join(temp_dir, filename)
-                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
-
-                    if os.path.exists(final_path):
-                        os.remove(final_path)
-                    shutil.move(temp_path, final_path)
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(
+                loop.run_in_executor(_extract_executor, FileService.extract_members, full_path, members)
+                for members in buckets
+            ))
 
             return True
         except Exception as e:
-            logger.error(f"Error extracting zip file: {str(e)}")
+            logger.error("Error extracting zip file: %s", e)
             raise
 
+    @staticmethod
+    def scan_directory(base_dir):
+        """扫描目录结构，按深度优先顺序返回目录列表和图片列表"""
+        directories = []
+        pages = []
+
+        def scan(dir_path, parent=None, level=0):
+            for entry in sorted(os.listdir(dir_path)):
+                full_path = os.path.join(dir_path, entry)
+
+                if os.path.isdir(full_path):
+                    directory = SourceDirectory(
+                        path=os.path.relpath(full_path, base_dir),
+                        name=entry,
+                        level=level,
+                        parent=parent
+                    )
+                    directories.append(directory)
+                    scan(full_path, directory, level + 1)
+
+                elif os.path.isfile(full_path) and ImageService.is_supported_image(full_path):
+                    pages.append(SourcePage(path=full_path, file_name=entry, directory=parent))
+
+        scan(base_dir)
+        return directories, pages
+
+    @staticmethod
+    def scan_zip(file_path):
+        """读取ZIP中央目录重建目录结构，不解压文件，顺序与解压后扫描目录一致"""
+        full_path = FILE_PATH_PREFIX + file_path
+        tree = {}  # 名称 -> 子树(目录) 或 ZipMember(文件)
+
+        with zipfile.ZipFile(full_path, 'r') as zip_ref:
+            for file, filename in FileService.decode_zip_names(zip_ref):
+                parts = [part for part in filename.split('/') if part not in ('', '.', '..')]
+                if not parts:
+                    continue
+
+                is_dir = filename.endswith('/')
+                node = tree
+                for part in parts if is_dir else parts[:-1]:
+                    child = node.get(part)
+                    if not isinstance(child, dict):
+                        child = node[part] = {}
+                    node = child
+
+                if not is_dir:
+                    # 同名成员以后出现的为准，与解压时覆盖的行为一致
+                    node[parts[-1]] = ZipMember(archive=full_path, name=file)
+
+        directories = []
+        pages = []
+
+        def walk(node, prefix='', parent=None, level=0):
+            for entry in sorted(node):
+                child = node[entry]
+                path = prefix + entry
+
+                if isinstance(child, dict):
+                    directory = SourceDirectory(path=path, name=entry, level=level, parent=parent)
+                    directories.append(directory)
+                    walk(child, path + '/', directory, level + 1)
+
+                elif ImageService.is_supported_image(entry):
+                    pages.append(SourcePage(path=path, file_name=entry, directory=parent, member=child))
+
+        walk(tree)
+        return directories, pages
+
     @staticmethod
     def cleanup_temp_dir(temp_dir):
         """清理临时目录"""
@@ -53,26 +207,272 @@ class FileService:
             if os.path.exists(temp_dir):
                 shutil.rmtree(temp_dir)
         except Exception as e:
-            logger.error(f"Error cleaning up temp directory: {str(e)}")
+            logger.error("Error cleaning up temp directory: %s", e)
+
+    @staticmethod
+    def cleanup_temp_dir_later(temp_dir):
+        """把目录改名后在后台线程中删除，不阻塞事件循环，原目录名可以立即重新使用"""
+        deleting_dir = f"{temp_dir.rstrip('/')}{_DELETING_SUFFIX}{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(temp_dir, deleting_dir)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.error("Error cleaning up temp directory: %s", e)
+            return
+
+        task = asyncio.get_running_loop().create_task(asyncio.to_thread(FileService.cleanup_temp_dir, deleting_dir))
+        _background_cleanups.add(task)
+        task.add_done_callback(_background_cleanups.discard)
+
+    @staticmethod
+    def sweep_deleting_dirs(base_dir):
+        """后台删除上次退出时未删除完的目录"""
+        try:
+            entries = os.listdir(base_dir)
+        except FileNotFoundError:
+            return
+
+        for entry in entries:
+            if _DELETING_SUFFIX in entry:
+                FileService.cleanup_temp_dir_later(os.path.join(base_dir, entry))
+
+    @staticmethod
+    async def wait_cleanups():
+        """等待后台删除完成，退出前调用"""
+        if _background_cleanups:
+            await asyncio.gather(*_background_cleanups, return_exceptions=True)
+
+    @staticmethod
+    def _run_poppler(*args):
+        """运行 poppler 命令行工具并返回标准输出"""
+        return subprocess.run(args, check=True, capture_output=True).stdout.decode('utf-8', 'replace')
+
+    @staticmethod
+    def find_passthrough_pages(full_path, last_page, first_page=1):
+        """找出页码区间内仅由一张铺满页面的JPEG构成的页面，这些页面可以直接提取原始JPEG数据"""
+        pages = ('-f', str(first_page), '-l', str(last_page))
+        try:
+            image_list = FileService._run_poppler('pdfimages', '-list', *pages, full_path)
+            page_info = FileService._run_poppler('pdfinfo', *pages, full_path)
+            page_text = FileService._run_poppler('pdftotext', *pages, full_path, '-')
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning("无法分析PDF内嵌图片，全部页面按渲染处理: %s", e)
+            return set()
+
+        images = {}
+        columns = None
+        for line in image_list.splitlines():
+            fields = line.split()
+            if fields[:2] == ['page', 'num']:
+                # 按表头定位各列，表头中的 "object ID" 对应数据中的两列
+                columns = {name: index for index, name in enumerate(fields)}
+                continue
+            if columns is None or len(fields) != len(columns) or not fields[0].isdigit():
+                continue
+            images.setdefault(int(fields[0]), []).append({name: fields[index] for name, index in columns.items()})
+
+        if columns is None or not _PDFIMAGES_COLUMNS <= set(columns):
+            logger.warning("无法识别 pdfimages 的输出格式，全部页面按渲染处理")
+            return set()
+
+        sizes = {}
+        rotations = {}
+        for match in re.finditer(r'^Page\s+(\d+)\s+size:\s+([\d.]+)\s+x\s+([\d.]+)', page_info, re.M):
+            sizes[int(match.group(1))] = (float(match.group(2)), float(match.group(3)))
+        for match in re.finditer(r'^Page\s+(\d+)\s+rot:\s+(\d+)', page_info, re.M):
+            rotations[int(match.group(1))] = int(match.group(2))
+
+        # pdftotext 以换页符分隔各页，有文字的页面可能叠加了矢量内容，需要渲染
+        texts = page_text.split('\f')
+
+        passthrough = set()
+        for page_number, rows in images.items():
+            if len(rows) != 1 or page_number not in sizes:
+                continue
+
+            image = rows[0]
+            if image['type'] != 'image' or image['enc'] != 'jpeg' or image['bpc'] != '8':
+                continue
+            if image['color'] not in ('rgb', 'gray', 'icc') or image['comp'] not in ('1', '3'):
+                continue
+            if rotations.get(page_number, 0) % 360 != 0:
+                continue
+            if page_number - first_page < len(texts) and texts[page_number - first_page].strip():
+                continue
+
+            # 图片按其分辨率换算的尺寸需与页面尺寸一致，即图片铺满整页
+            try:
+                image_width = int(image['width']) / float(image['x-ppi']) * 72
+                image_height = int(image['height']) / float(image['y-ppi']) * 72
+            except (ValueError, ZeroDivisionError):
+                continue
+            page_width, page_height = sizes[page_number]
+            if abs(image_width - page_width) > page_width * 0.02 or abs(image_height - page_height) > page_height * 0.02:
+                continue
+
+            passthrough.add(page_number)
+
+        return passthrough
+
+    @staticmethod
+    def _render_pdf_range(full_path, output_dir, first_page, last_page, dpi, thread_count):
+        """渲染页码区间，由 poppler 直接编码为JPEG写入磁盘，返回 {页码: 图片路径}"""
+        paths = convert_from_path(
+            full_path,
+            dpi=dpi,
+            first_page=first_page,
+            last_page=last_page,
+            fmt='jpeg',
+            output_folder=output_dir,
+            output_file=uuid.uuid4().hex[:8],
+            paths_only=True,
+            thread_count=max(1, min(thread_count, last_page - first_page + 1))
+        )
+        return dict(zip(range(first_page, last_page + 1), paths))
+
+    @staticmethod
+    def _extract_pdf_images(full_path, output_dir, first_page, last_page):
+        """用 pdfimages 无损提取页码区间内的原始JPEG，返回 {页码: 图片路径}"""
+        prefix = os.path.join(output_dir, uuid.uuid4().hex[:8])
+        FileService._run_poppler('pdfimages', '-j', '-p', '-f', str(first_page), '-l', str(last_page), full_path, prefix)
+
+        extracted = {}
+        for entry in os.listdir(output_dir):
+            match = re.match(re.escape(os.path.basename(prefix)) + r'-(\d+)-\d+\.(\w+)$', entry)
+            if not match:
+                continue
+            image_path = os.path.join(output_dir, entry)
+            if match.group(2) == 'jpg':
+                extracted[int(match.group(1))] = image_path
+            else:
+                os.remove(image_path)
+        return extracted
+
+    @staticmethod
+    def iter_pdf_pages(pdf_path, output_dir, dpi=PDF_DPI, chunk_size=PDF_CHUNK_SIZE, thread_count=PDF_THREAD_COUNT,
+                       passthrough=PDF_PASSTHROUGH, skip_pages=(), first_page=1, last_page=None):
+        """按页码区间分块处理PDF，逐页返回 (页码, JPG图片路径)
+
+        扫描件中由单张JPEG构成的页面直接提取原始数据，其余页面按区间渲染。
+        skip_pages 中的页面不做处理，图片路径为 None。
+        first_page、last_page 限定处理的页码区间，last_page 为空时处理到最后一页。
+        """
+        full_path = FILE_PATH_PREFIX + pdf_path
+        page_count = pdfinfo_from_path(full_path)['Pages']
+        last_page = min(last_page or page_count, page_count)
+        chunk_size = max(chunk_size, 1)
+        passthrough_pages = (
+            FileService.find_passthrough_pages(full_path, last_page, first_page) if passthrough else set()
+        )
+        if passthrough_pages:
+            logger.info("%s/%s 页直接提取内嵌JPEG", len(passthrough_pages), last_page - first_page + 1)
+
+        for chunk_first in range(first_page, last_page + 1, chunk_size):
+            chunk_last = min(chunk_first + chunk_size - 1, last_page)
+            chunk_pages = range(chunk_first, chunk_last + 1)
+
+            images = {page_number: None for page_number in chunk_pages if page_number in skip_pages}
+            if any(page_number in passthrough_pages and page_number not in images for page_number in chunk_pages):
+                extracted = FileService._extract_pdf_images(full_path, output_dir, chunk_first, chunk_last)
+                for page_number, image_path in extracted.items():
+                    if page_number in passthrough_pages and page_number not in images:
+                        images[page_number] = image_path
+                    else:
+                        os.remove(image_path)
+
+            # 其余页面按连续区间渲染
+            missing = [page_number for page_number in chunk_pages if page_number not in images]
+            while missing:
+                run_end = 0
+                while run_end + 1 < len(missing) and missing[run_end + 1] == missing[run_end] + 1:
+                    run_end += 1
+                images.update(FileService._render_pdf_range(
+                    full_path, output_dir, missing[0], missing[run_end], dpi, thread_count
+                ))
+                missing = missing[run_end + 1:]
+
+            for page_number in chunk_pages:
+                yield page_number, images[page_number]
+
+    @staticmethod
+    def render_pdf_pages(pdf_path, output_dir, done_keys=(), first_page=1, last_page=None):
+        """渲染PDF的全部页面或页码区间，逐页返回已编码为JPG的待导入图片，done_keys 中已转换的页面不再渲染
+
+        按块渲染，取完一块的页面后才渲染下一块，临时目录中只保留一块和尚未取走的页面
+        """
+        logger.info("PDF文件路径：%s", FILE_PATH_PREFIX + pdf_path)
+        logger.info("图片文件保存路径：%s", output_dir)
+        try:
+            skip_pages = {
+                int(key[len('page_'):-len('.jpg')]) for key in done_keys
+                if re.match(r'^page_\d+\.jpg$', key)
+            }
+            for page_number, image_path in FileService.iter_pdf_pages(
+                pdf_path, output_dir, skip_pages=skip_pages, first_page=first_page, last_page=last_page
+            ):
+                yield SourcePage(path=image_path, file_name=f"page_{page_number}.jpg", encoded=True)
+        except Exception as e:
+            logger.error("Error converting PDF to images: %s", e)
+            raise
+
+    @staticmethod
+    def pdf_page_count(pdf_path):
+        """读取PDF的总页数"""
+        return pdfinfo_from_path(FILE_PATH_PREFIX + pdf_path)['Pages']
+
+    @staticmethod
+    def shard_ranges(page_count, shard_pages):
+        """把页码 1..page_count 按每片 shard_pages 页划分为 [(起始页, 结束页), ...]"""
+        return [
+            (first_page, min(first_page + shard_pages - 1, page_count))
+            for first_page in range(1, page_count + 1, shard_pages)
+        ]
+
+    @staticmethod
+    def shard_dir(parent_task_id):
+        """分片渲染结果的暂存目录(相对 FILE_PATH_PREFIX)，同一PDF的全部分片共用"""
+        return f"{PDF_SHARD_DIR}/{parent_task_id}"
+
+    @staticmethod
+    def shard_pages(parent_task_id, shards):
+        """收集全部分片的渲染结果，按页码顺序返回已编码为JPG的待导入图片
+
+        页面标识与整本渲染时相同，合并中断后重试可复用进度日志；
+        暂存的图片在合并提交后才删除，合并时以硬链接放到最终位置
+        """
+        pages = []
+        for shard in sorted(shards, key=lambda shard: shard['first_page']):
+            if shard['status'] != '已完成':
+                raise Exception(f"分片任务 {shard['id']} 尚未完成: {shard['status']}")
+
+            for page_number in range(shard['first_page'], shard['last_page'] + 1):
+                file_name = f"page_{page_number}.jpg"
+                pages.append(SourcePage(
+                    path=FILE_PATH_PREFIX + f"{FileService.shard_dir(parent_task_id)}/{file_name}",
+                    file_name=file_name,
+                    encoded=True,
+                    keep_source=True
+                ))
+        return pages
 
     @staticmethod
     def convert_pdf_to_images(pdf_path, output_dir):
         """将PDF文件转换为图片"""
-        logger.info(f"PDF文件路径：{FILE_PATH_PREFIX + pdf_path}")
-        logger.info(f"图片文件保存路径：{output_dir}")
+        logger.info("PDF文件路径：%s", FILE_PATH_PREFIX + pdf_path)
+        logger.info("图片文件保存路径：%s", output_dir)
         try:
-            images = convert_from_path(FILE_PATH_PREFIX + pdf_path)
-            for i, image in enumerate(images):
+            for page_number, rendered_path in FileService.iter_pdf_pages(pdf_path, output_dir):
                 # 生成一个随机字符串
                 random_string = str(uuid.uuid4().hex)[:8]  # 取前8个字符作为随机字符串
-                image_path = os.path.join(output_dir, f"{random_string}-page_{i + 1}.jpg")
+                image_path = os.path.join(output_dir, f"{random_string}-page_{page_number}.jpg")
 
                 # 打印日志
-                logger.info(f"第{i+1}页图片路径为：{image_path}")
+                log_page("第%s页图片路径为：%s", page_number, image_path)
 
-                # 保存图片
-                image.save(image_path, "JPEG")
+                # 重命名为带页码的文件名
+                os.replace(rendered_path, image_path)
             return True
         except Exception as e:
-            logger.error(f"Error converting PDF to images: {str(e)}")
+            logger.error("Error converting PDF to images: %s", e)
             raise
@@ -1,25 +1,467 @@
 # -*- coding: utf-8 -*-
 from PIL import Image
+import io
+import math
 import os
-from config.settings import FILE_PATH_PREFIX, SUPPORTED_IMAGE_FORMATS
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from config.settings import (
+    FILE_PATH_PREFIX, SUPPORTED_IMAGE_FORMATS, JPEG_PASSTHROUGH, JPEG_STRIP_METADATA, PAGE_DERIVATIVES,
+    DERIVATIVE_QUALITY, LARGE_IMAGE_PIXELS, MAX_OUTPUT_PIXELS, MAX_INPUT_PIXELS
+)
+from models.source import ZipMember
 from utils.logger import logger
 
+class _ArchiveCache:
+    """进程内打开的ZIP包，每个进程只解析一次中央目录，文件变化后重新打开
+
+    按最近使用淘汰，淘汰、文件变化、空闲超过 idle_timeout 秒或调用 close 时关闭ZIP包，
+    不长期占用文件描述符和已删除文件的磁盘空间。已打开的成员持有文件引用，关闭ZIP包不影响其读取。
+    缓存按进程区分：fork 出的进程继承父进程已打开的文件描述符，共用文件偏移，不能与父进程并发读取
+    """
+
+    def __init__(self, maxsize=4, idle_timeout=30):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.archives = OrderedDict()  # 路径 -> (修改时间, 大小, ZipFile, 最后使用时间)
+        self.pid = None
+        self.sweeper = None
+
+    def open(self, archive_path, name):
+        with self.lock:
+            return self._get(archive_path).open(name)
+
+    def getinfo(self, archive_path, name):
+        with self.lock:
+            return self._get(archive_path).getinfo(name)
+
+    def _get(self, archive_path):
+        if self.pid != os.getpid():
+            # 不使用也不关闭从父进程继承的ZIP包
+            self.pid = os.getpid()
+            self.archives = OrderedDict()
+            self.sweeper = None
+
+        stat = os.stat(archive_path)
+        entry = self.archives.pop(archive_path, None)
+        if entry and entry[:2] != (stat.st_mtime_ns, stat.st_size):
+            entry[2].close()
+            entry = None
+        archive = entry[2] if entry else zipfile.ZipFile(archive_path, 'r')
+        self.archives[archive_path] = (stat.st_mtime_ns, stat.st_size, archive, time.monotonic())
+
+        while len(self.archives) > self.maxsize:
+            _, evicted = self.archives.popitem(last=False)
+            evicted[2].close()
+
+        if self.sweeper is None and self.idle_timeout:
+            # 转换进程空闲时也能关闭不再使用的ZIP包
+            self.sweeper = threading.Thread(target=self._sweep, name='zip-archive-sweeper', daemon=True)
+            self.sweeper.start()
+        return archive
+
+    def _sweep(self):
+        while True:
+            time.sleep(self.idle_timeout)
+            self.close_idle()
+
+    def close_idle(self):
+        """关闭空闲超过 idle_timeout 秒的ZIP包"""
+        deadline = time.monotonic() - self.idle_timeout
+        with self.lock:
+            for archive_path, entry in list(self.archives.items()):
+                if entry[3] < deadline:
+                    del self.archives[archive_path]
+                    entry[2].close()
+
+    def close(self, archive_path=None):
+        """关闭指定的ZIP包，未指定时关闭全部"""
+        with self.lock:
+            if self.pid != os.getpid():
+                return
+            archive_paths = list(self.archives) if archive_path is None else [archive_path]
+            for path in archive_paths:
+                entry = self.archives.pop(path, None)
+                if entry:
+                    entry[2].close()
+
+_archives = _ArchiveCache()
+
+# 去除元数据时保留的段：APP0(JFIF)、APP14(Adobe颜色变换)
+# ICC(APP2)与重新编码的输出保持一致，一并去除
+_KEEP_APP_MARKERS = {0xE0, 0xEE}
+
+# 超过 MAX_IMAGE_PIXELS 时 Pillow 发出警告，超过两倍时拒绝打开
+Image.MAX_IMAGE_PIXELS = MAX_INPUT_PIXELS or None
+
+# 条带解码时每个条带的像素数
+_BAND_PIXELS = 8 * 1024 * 1024
+
+# ZIP成员解压到临时文件以支持随机访问，不超过该大小时保留在内存中
+_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# 分块读取源数据时每块的字节数
+_READ_CHUNK = 1024 * 1024
+
+# 可按条带读取的未压缩TIFF原始格式 -> 每像素位数
+_RAW_BITS = {'1': 1, '1;I': 1, 'L': 8, 'L;I': 8, 'LA': 16, 'RGB': 24, 'RGBA': 32, 'RGBX': 32, 'CMYK': 32}
+
+# TIFF 标签：方向、平面配置
+_TIFF_ORIENTATION = 274
+_TIFF_PLANAR_CONFIGURATION = 284
+
+def _pixel_bytes(mode):
+    """Pillow 在内存中每像素占用的字节数(RGB 按4字节对齐存储)"""
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
 class ImageService:
     @staticmethod
-    def convert_to_jpg(source_path, target_path):
-        """将图片转换为JPG格式"""
+    def open_source(source):
+        """打开图片数据来源，支持磁盘文件路径、ZIP成员、内存数据和已打开的文件"""
+        if isinstance(source, bytes):
+            return io.BytesIO(source)
+        if isinstance(source, ZipMember):
+            # 分块解压到可随机访问的临时文件，避免压缩流反复回退重读；小成员保留在内存中
+            spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE)
+            with _archives.open(source.archive, source.name) as member:
+                shutil.copyfileobj(member, spool, _READ_CHUNK)
+            spool.seek(0)
+            return spool
+        if isinstance(source, str):
+            return open(source, 'rb')
+        return source
+
+    @staticmethod
+    def source_size(source):
+        """图片源数据的字节数，ZIP成员为解压后的大小"""
+        if isinstance(source, bytes):
+            return len(source)
+        if isinstance(source, ZipMember):
+            return _archives.getinfo(source.archive, source.name).file_size
+        return os.path.getsize(source)
+
+    @staticmethod
+    def is_passthrough_jpeg(img):
+        """检查图片是否为可直接使用的RGB/灰度基线JPEG"""
+        return (
+            img.format == 'JPEG'
+            and img.mode in ('RGB', 'L')
+            and 'progressive' not in img.info
+            and 'progression' not in img.info
+        )
+
+    @staticmethod
+    def strip_jpeg_metadata(data):
+        """无损去除JPEG中的EXIF/XMP/IPTC/ICC及注释段，图像数据保持不变"""
+        if data[:2] != b'\xff\xd8':
+            return data
+
+        output = [data[:2]]
+        pos = 2
+        while pos + 4 <= len(data):
+            if data[pos] != 0xFF:
+                return data
+            marker = data[pos + 1]
+            if marker == 0xFF:
+                pos += 1
+                continue
+            if marker == 0xDA:
+                # 扫描数据开始，其余部分原样保留
+                output.append(data[pos:])
+                return b''.join(output)
+
+            length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+            segment = data[pos:pos + 2 + length]
+            is_app = 0xE0 <= marker <= 0xEF
+            if not (marker == 0xFE or (is_app and marker not in _KEEP_APP_MARKERS)):
+                output.append(segment)
+            pos += 2 + length
+
+        return data
+
+    @staticmethod
+    def copy_jpg(source, source_file, full_target_path, strip_metadata=JPEG_STRIP_METADATA):
+        """不解码直接复制JPEG数据到目标位置，磁盘文件且无需改写时使用硬链接"""
+        if not strip_metadata and isinstance(source, str):
+            try:
+                if os.path.exists(full_target_path):
+                    os.remove(full_target_path)
+                os.link(source, full_target_path)
+                return
+            except OSError:
+                pass
+
+        source_file.seek(0)
+        with open(full_target_path, 'wb') as target:
+            if strip_metadata:
+                target.write(ImageService.strip_jpeg_metadata(source_file.read()))
+            else:
+                shutil.copyfileobj(source_file, target, _READ_CHUNK)
+
+    @staticmethod
+    def derivative_path(target_path, name):
+        """派生图路径：在主图文件名后加上派生图名称"""
+        base, ext = os.path.splitext(target_path)
+        return f"{base}_{name}{ext}"
+
+    @staticmethod
+    def derivative_paths(target_path, derivatives=PAGE_DERIVATIVES):
+        """按配置顺序返回全部派生图路径"""
+        return [ImageService.derivative_path(target_path, name) for name in derivatives]
+
+    @staticmethod
+    def draft_for_derivatives(img, derivatives=PAGE_DERIVATIVES):
+        """只需要派生图时，让JPEG解码器按 1/2、1/4、1/8 直接缩小解码"""
+        if derivatives:
+            largest = max(derivatives.values())
+            img.draft(img.mode if img.mode in ('RGB', 'L') else 'RGB', (largest, largest))
+
+    @staticmethod
+    def save_derivatives(img, target_path, derivatives=PAGE_DERIVATIVES, quality=DERIVATIVE_QUALITY):
+        """由已解码的图片生成派生图，从大到小依次在上一级结果上缩小"""
+        current = img
+        for name, size in sorted(derivatives.items(), key=lambda item: item[1], reverse=True):
+            ratio = size / max(current.size)
+            if ratio < 1:
+                new_size = (max(1, round(current.width * ratio)), max(1, round(current.height * ratio)))
+                # reducing_gap 先用 reduce 做整数倍缩小，再做高质量重采样
+                current = current.resize(new_size, Image.LANCZOS, reducing_gap=2.0)
+            if current.mode not in ('RGB', 'L'):
+                current = current.convert('RGB')
+            current.save(FILE_PATH_PREFIX + ImageService.derivative_path(target_path, name), 'JPEG', quality=quality)
+
+    @staticmethod
+    def derive_from_jpg(full_path, target_path, derivatives=PAGE_DERIVATIVES):
+        """由已写入的JPG生成派生图"""
+        with Image.open(full_path) as img:
+            ImageService.draft_for_derivatives(img, derivatives)
+            ImageService.save_derivatives(img, target_path, derivatives)
+
+    @staticmethod
+    def open_header(source):
+        """打开图片数据来源用于读取文件头，ZIP成员以流方式读取，不载入整个成员"""
+        if isinstance(source, ZipMember):
+            return _archives.open(source.archive, source.name)
+        return ImageService.open_source(source)
+
+    @staticmethod
+    def close_archive(archive_path=None):
+        """关闭当前进程中缓存的ZIP包，任务结束后调用，未指定时关闭全部"""
+        _archives.close(archive_path)
+
+    @staticmethod
+    def reduce_factor(size, max_pixels=MAX_OUTPUT_PIXELS):
+        """输出不超过 max_pixels 所需的整数缩小倍数"""
+        width, height = size
+        factor = 1
+        if max_pixels:
+            factor = max(1, math.ceil(math.sqrt(width * height / max_pixels)))
+            while math.ceil(width / factor) * math.ceil(height / factor) > max_pixels:
+                factor += 1
+        return factor
+
+    @staticmethod
+    def draft_scale(factor):
+        """JPEG解码时可直接使用的缩小倍数：能整除 factor 的最大的 2 的幂，不超过 8"""
+        scale = 1
+        while scale < 8 and factor % (scale * 2) == 0:
+            scale *= 2
+        return scale
+
+    @staticmethod
+    def raw_tiles(img):
+        """返回未压缩TIFF的原始数据块 [(x0, y0, x1, y1, offset, rawmode, stride)]，不能按行读取时返回 None"""
+        if (
+            img.format != 'TIFF'
+            or img.mode not in ('1', 'L', 'LA', 'RGB', 'RGBA', 'CMYK')
+            or img.tag_v2.get(_TIFF_ORIENTATION, 1) != 1
+            or img.tag_v2.get(_TIFF_PLANAR_CONFIGURATION, 1) != 1
+        ):
+            return None
+
+        tiles = []
+        for codec, (x0, y0, x1, y1), offset, args in img.tile:
+            rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else tuple(args)[:3]
+            if codec != 'raw' or orientation != 1 or rawmode not in _RAW_BITS:
+                return None
+            stride = stride or ((x1 - x0) * _RAW_BITS[rawmode] + 7) // 8
+            tiles.append((x0, y0, x1, y1, offset, rawmode, stride))
+        return tiles
+
+    @staticmethod
+    def estimate_memory(img, max_output_pixels=MAX_OUTPUT_PIXELS, large_pixels=LARGE_IMAGE_PIXELS):
+        """根据文件头估算转换所需的内存(字节)，不解码像素"""
+        width, height = img.size
+        factor = ImageService.reduce_factor(img.size, max_output_pixels)
+        output = math.ceil(width / factor) * math.ceil(height / factor) * 4
+
+        if width * height > large_pixels and ImageService.raw_tiles(img) is not None:
+            # 输出图片 + 一个条带及其RGB副本
+            return output + min(width * height, _BAND_PIXELS) * (_pixel_bytes(img.mode) + 4)
+
+        scale = ImageService.draft_scale(factor) if img.format == 'JPEG' else 1
+        if scale > 1:
+            # 解码时按 1/2、1/4、1/8 缩小
+            width, height = math.ceil(width / scale), math.ceil(height / scale)
+            factor //= scale
+
+        decoded = width * height * _pixel_bytes(img.mode)
+        if img.mode in ('RGB', 'L'):
+            # 先缩小再转换为RGB，RGB且不缩小时直接使用解码结果
+            return decoded + (output if factor > 1 or img.mode == 'L' else 0)
+        # 先转换为整幅RGB再缩小
+        return decoded + width * height * 4 + (output if factor > 1 else 0)
+
+    @staticmethod
+    def measure(source):
+        """读取文件头估算转换所需的内存，计入源数据本身(直接复制并去除元数据时整体读入内存)"""
+        with ImageService.open_header(source) as f, Image.open(f) as img:
+            return ImageService.estimate_memory(img) + ImageService.source_size(source)
+
+    @staticmethod
+    def decode_rgb(img, source, max_output_pixels=MAX_OUTPUT_PIXELS, large_pixels=LARGE_IMAGE_PIXELS):
+        """解码为RGB图片，输出超过 max_output_pixels 时缩小，避免多余的整幅副本"""
+        factor = ImageService.reduce_factor(img.size, max_output_pixels)
+
+        if img.width * img.height > large_pixels:
+            tiles = ImageService.raw_tiles(img)
+            if tiles is not None:
+                return ImageService.decode_bands(img, source, tiles, factor)
+
+        scale = ImageService.draft_scale(factor) if img.format == 'JPEG' else 1
+        if scale > 1:
+            # JPEG 在解码时直接按 1/scale 缩小，其余倍数由 reduce 完成
+            img.draft(img.mode if img.mode in ('RGB', 'L') else 'RGB', (img.width // scale, img.height // scale))
+            factor //= scale
+
+        result = img
+        if factor > 1 and result.mode in ('RGB', 'L'):
+            # 先缩小再转换，转换只作用于缩小后的图片
+            result = result.reduce(factor)
+        if result.mode != 'RGB':
+            result = result.convert('RGB')
+        if factor > 1 and result.size == img.size:
+            result = result.reduce(factor)
+
+        if result is not img:
+            # 释放原始解码数据
+            img.close()
+        return result
+
+    @staticmethod
+    def decode_bands(img, source, tiles, factor):
+        """按行条带读取未压缩TIFF，逐条转换为RGB并缩小后拼接，内存中只保留输出图片和一个条带
+
+        条带行数是缩小倍数的整数倍，各条带单独缩小的结果与整幅缩小一致
+        """
+        width, height = img.size
+        output = Image.new('RGB', (math.ceil(width / factor), math.ceil(height / factor)))
+        band_rows = max(factor, _BAND_PIXELS // width // factor * factor)
+
+        for top in range(0, height, band_rows):
+            bottom = min(top + band_rows, height)
+            band = None
+            for x0, y0, x1, y1, offset, rawmode, stride in tiles:
+                first, last = max(top, y0), min(bottom, y1)
+                if first >= last:
+                    continue
+                source.seek(offset + (first - y0) * stride)
+                data = source.read((last - first) * stride)
+                piece = Image.frombytes(img.mode, (x1 - x0, last - first), data, 'raw', rawmode, stride)
+                del data
+
+                if band is None and piece.size == (width, bottom - top):
+                    # 整行的条带直接使用，不再复制
+                    band = piece
+                    continue
+                if band is None:
+                    band = Image.new(img.mode, (width, bottom - top))
+                band.paste(piece, (x0, first - top))
+
+            if band.mode != 'RGB':
+                band = band.convert('RGB')
+            if factor > 1:
+                band = band.reduce(factor)
+            output.paste(band, (0, top // factor))
+
+        return output
+
+    @staticmethod
+    def convert_to_jpg(source_path, target_path, passthrough=JPEG_PASSTHROUGH, derivatives=PAGE_DERIVATIVES):
+        """将图片转换为JPG格式，符合要求的JPEG直接复制不重新编码，派生图在同一次解码中生成"""
         try:
             full_target_path = FILE_PATH_PREFIX + target_path
             os.makedirs(os.path.dirname(full_target_path), exist_ok=True)
-            
-            with Image.open(source_path) as img:
-                img.convert('RGB').save(full_target_path, 'JPEG')
+
+            with ImageService.open_source(source_path) as source, Image.open(source) as img:
+                # Image.open 只解析文件头，判断可直接复制时不会解码像素
+                if (passthrough and ImageService.is_passthrough_jpeg(img)
+                        and ImageService.reduce_factor(img.size) == 1):
+                    ImageService.copy_jpg(source_path, source, full_target_path)
+                    if derivatives:
+                        # 主图未解码，派生图按缩小后的尺寸解码
+                        ImageService.draft_for_derivatives(img, derivatives)
+                        ImageService.save_derivatives(img, target_path, derivatives)
+                else:
+                    rgb = ImageService.decode_rgb(img, source)
+                    rgb.save(full_target_path, 'JPEG')
+                    ImageService.save_derivatives(rgb, target_path, derivatives)
             return True
         except Exception as e:
-            logger.error(f"Error converting image to JPG: {str(e)}")
+            logger.error("Error converting image to JPG: %s", e)
             raise
 
+    @staticmethod
+    def move_jpg(source_path, target_path, derivatives=PAGE_DERIVATIVES, keep_source=False):
+        """将已编码的JPG文件及其派生图移动到目标位置，缺少的派生图由JPG缩小解码生成
+
+        keep_source 为真时保留源文件，以硬链接(跨文件系统时复制)代替移动
+        """
+        place = ImageService._link_file if keep_source else shutil.move
+        try:
+            full_target_path = FILE_PATH_PREFIX + target_path
+            os.makedirs(os.path.dirname(full_target_path), exist_ok=True)
+            place(source_path, full_target_path)
+
+            missing = {}
+            for name, size in derivatives.items():
+                derivative_source = ImageService.derivative_path(source_path, name)
+                if os.path.exists(derivative_source):
+                    place(derivative_source, FILE_PATH_PREFIX + ImageService.derivative_path(target_path, name))
+                else:
+                    missing[name] = size
+
+            if missing:
+                ImageService.derive_from_jpg(full_target_path, target_path, missing)
+            return True
+        except Exception as e:
+            logger.error("Error moving JPG: %s", e)
+            raise
+
+    @staticmethod
+    def link_jpg(source_path, target_path, derivatives=PAGE_DERIVATIVES):
+        """将已编码的JPG文件及其派生图放到目标位置并保留源文件，中断后可以重新放置"""
+        return ImageService.move_jpg(source_path, target_path, derivatives, keep_source=True)
+
+    @staticmethod
+    def _link_file(source_path, target_path):
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        try:
+            os.link(source_path, target_path)
+        except OSError:
+            shutil.copyfile(source_path, target_path)
+
     @staticmethod
     def is_supported_image(file_path):
         """检查是否为支持的图片格式"""
-        return file_path.lower().endswith(SUPPORTED_IMAGE_FORMATS)
\ No newline at end of file
+        return file_path.lower().endswith(SUPPORTED_IMAGE_FORMATS)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from datetime import datetime
+from config.settings import HEARTBEAT_INTERVAL, FILE_PATH_PREFIX
+from services.file_service import FileService
+from utils.logger import logger
+from utils.metrics import LEASES_RECLAIMED, LEASES_LOST
+
+class LeaseKeeper:
+    """定时为本节点领取的任务续约，同时回收其他节点遗留的过期任务"""
+
+    def __init__(self, db_service, interval=HEARTBEAT_INTERVAL):
+        self.db_service = db_service
+        self.interval = interval
+        self.held = set()  # 本节点持有租约的任务ID
+        self.lost = set()  # 租约已被回收的任务ID
+        self.stopped = asyncio.Event()
+
+    def acquire(self, task_id):
+        """开始为任务续约，任务领取后立即调用，排队等待的任务也需要续约"""
+        self.held.add(task_id)
+
+    def release(self, task_id):
+        """停止为任务续约"""
+        self.held.discard(task_id)
+        self.lost.discard(task_id)
+
+    def is_lost(self, task_id):
+        return task_id in self.lost
+
+    def mark_lost(self, task_id):
+        """租约已过期并被回收，任务交由其他节点处理，本节点不再提交其结果"""
+        if task_id in self.held and task_id not in self.lost:
+            logger.warning("任务 %s 的租约已失效", task_id)
+            self.lost.add(task_id)
+            LEASES_LOST.inc()
+
+    async def run(self):
+        """按心跳间隔续约和回收，直到调用 stop"""
+        while not self.stopped.is_set():
+            await self.heartbeat()
+            try:
+                await asyncio.wait_for(self.stopped.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        self.stopped.set()
+
+    async def heartbeat(self):
+        try:
+            held = set(self.held)
+            renewed = await self.db_service.renew_leases(held)
+            for task_id in held - renewed:
+                self.mark_lost(task_id)
+
+            reclaimed, failed_parents = await self.db_service.reclaim_expired_tasks()
+            LEASES_RECLAIMED.inc(reclaimed)
+            for parent_task_id in failed_parents:
+                # 父任务不会再合并，删除已完成分片的渲染结果
+                FileService.cleanup_temp_dir_later(FILE_PATH_PREFIX + FileService.shard_dir(parent_task_id))
+        except Exception as e:
+            logger.error("任务续约失败 - %s: %s", datetime.now(), e)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import itertools
+import signal
+from datetime import datetime
+from config.settings import MAX_WORKERS, TASK_PREFETCH, IDLE_INTERVAL, IDLE_MIN_INTERVAL, IDLE_BACKOFF
+from utils.logger import logger
+from utils.metrics import FETCH_TASKS_SECONDS, QUEUE_DEPTH, ACTIVE_WORKERS, WAKEUPS_TOTAL
+
+class TaskScheduler:
+    """持续调度任务：常驻工作协程逐个处理任务，空出的槽位立即由预取队列补上
+
+    priority 为可选的排序函数，预取队列中排序键较小的任务先处理，相同时按领取顺序
+    """
+
+    def __init__(self, fetch_tasks, process_task, workers=MAX_WORKERS, prefetch=TASK_PREFETCH,
+                 idle_interval=IDLE_INTERVAL, idle_min_interval=IDLE_MIN_INTERVAL, idle_backoff=IDLE_BACKOFF,
+                 priority=None):
+        self.fetch_tasks = fetch_tasks
+        self.process_task = process_task
+        self.priority = priority
+        self.workers = max(workers, 1)
+        self.prefetch = max(prefetch, 0)
+        self.idle_interval = idle_interval
+        self.idle_min_interval = min(idle_min_interval, idle_interval)
+        self.idle_backoff = max(idle_backoff, 1)
+
+        # 已领取的任务总数(处理中 + 排队中)不超过 workers + prefetch
+        self.capacity = self.workers + self.prefetch
+        self.queue = asyncio.PriorityQueue(maxsize=self.capacity)
+        self.sequence = itertools.count()
+        self.active = 0
+        self.running = True
+        self.slot_freed = asyncio.Event()
+        self.stopped = asyncio.Event()
+        self.woken = asyncio.Event()
+
+    async def run(self):
+        """启动工作协程并持续领取任务，直到调用 stop"""
+        workers = [asyncio.create_task(self._work(i)) for i in range(self.workers)]
+        logger.info("任务调度器启动: workers=%s, prefetch=%s", self.workers, self.prefetch)
+
+        try:
+            await self._produce()
+        finally:
+            # 已领取的任务处理完后再退出
+            for _ in workers:
+                await self.queue.put((float('inf'), next(self.sequence), None))
+            await asyncio.gather(*workers, return_exceptions=True)
+            logger.info("任务调度器已停止")
+
+    def stop(self):
+        """停止领取新任务"""
+        self.running = False
+        self.stopped.set()
+        self.slot_freed.set()
+        self.woken.set()
+
+    def wake(self):
+        """有新任务时立即领取，不再等待轮询间隔"""
+        WAKEUPS_TOTAL.inc()
+        self.woken.set()
+
+    async def _sleep(self, seconds):
+        """等待指定时间，调用 stop 或 wake 时提前结束"""
+        try:
+            await asyncio.wait_for(self.woken.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _produce(self):
+        # 刚处理完任务时很快再次查询，持续空闲时逐步拉长间隔
+        delay = self.idle_min_interval
+        while self.running:
+            self.slot_freed.clear()
+            limit = self.capacity - self.active - self.queue.qsize()
+            if limit <= 0:
+                await self.slot_freed.wait()
+                continue
+
+            self.woken.clear()
+            try:
+                logger.debug("获取任务 - %s", datetime.now())
+                with FETCH_TASKS_SECONDS.time():
+                    tasks = await self.fetch_tasks(limit)
+            except Exception as e:
+                logger.error("获取任务失败 - %s: %s", datetime.now(), e)
+                await self._sleep(self.idle_interval)
+                continue
+
+            if not tasks:
+                logger.debug("没有可处理的任务，%.1f 秒后重试 - %s", delay, datetime.now())
+                await self._sleep(delay)
+                # 被唤醒时回到最小间隔，否则按倍数增长
+                delay = self.idle_min_interval if self.woken.is_set() else min(delay * self.idle_backoff, self.idle_interval)
+                continue
+
+            delay = self.idle_min_interval
+            for task in tasks:
+                self.queue.put_nowait((self.priority(task) if self.priority else 0, next(self.sequence), task))
+            self._update_gauges()
+
+    def _update_gauges(self):
+        QUEUE_DEPTH.set(self.queue.qsize())
+        ACTIVE_WORKERS.set(self.active)
+
+    async def _work(self, index):
+        while True:
+            _, _, task = await self.queue.get()
+            if task is None:
+                break
+
+            self.active += 1
+            self._update_gauges()
+            try:
+                await self.process_task(task)
+            except Exception as e:
+                logger.error("工作协程 %s 处理任务失败 - %s: %s", index, datetime.now(), e)
+            finally:
+                self.active -= 1
+                self._update_gauges()
+                self.slot_freed.set()
+                # 任务结束后释放了准入预算，立即重新领取
+                self.woken.set()
+
+class _WakeProtocol(asyncio.DatagramProtocol):
+    def __init__(self, callback):
+        self.callback = callback
+
+    def datagram_received(self, data, addr):
+        self.callback()
+
+class WakeListener:
+    """监听唤醒通知：收到任意UDP报文或 SIGUSR1 信号时调用回调"""
+
+    def __init__(self, callback, host, port):
+        self.callback = callback
+        self.host = host
+        self.port = port
+        self.transport = None
+        self.signal_installed = False
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, self.callback)
+            self.signal_installed = True
+        except (NotImplementedError, AttributeError, RuntimeError):
+            # Windows 或非主线程中不支持信号处理
+            pass
+
+        if self.port:
+            self.transport, _ = await loop.create_datagram_endpoint(
+                lambda: _WakeProtocol(self.callback), local_addr=(self.host, self.port)
+            )
+            logger.info("唤醒通知已启动: udp://%s:%s", self.host, self.port)
+
+    def stop(self):
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+
+        if self.signal_installed:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR1)
+            self.signal_installed = False
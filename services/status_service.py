@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from datetime import datetime
+from config.settings import STATUS_FLUSH_INTERVAL
+from utils.logger import logger
+from utils.metrics import STATUS_WRITES
+
+class StatusWriter:
+    """合并处理中任务的状态和进度写入
+
+    开始时间和进度在内存中按任务合并，按间隔用一条 UPDATE 批量写入；
+    任务结束时由 take 取出尚未写入的字段，随终态一起立即写入
+    """
+
+    def __init__(self, db_service, interval=STATUS_FLUSH_INTERVAL):
+        self.db_service = db_service
+        self.interval = interval
+        self.pending = {}  # 任务ID -> {列名: 值}
+        self.active = set()  # 已开始、尚未结束的任务ID
+        self.stopped = asyncio.Event()
+
+    def started(self, task_id):
+        """记录任务开始处理的时间，领取时状态已是处理中"""
+        self.active.add(task_id)
+        self.pending.setdefault(task_id, {})['started_at'] = datetime.now()
+
+    def progress(self, task_id, done, total):
+        """记录任务进度，同一任务只保留最新的值"""
+        if task_id not in self.active:
+            return
+        fields = self.pending.setdefault(task_id, {})
+        fields['progress_done'] = done
+        fields['progress_total'] = total
+
+    def take(self, task_id):
+        """取出任务尚未写入的字段，之后不再批量写入"""
+        self.active.discard(task_id)
+        return self.pending.pop(task_id, {})
+
+    async def run(self):
+        """按间隔批量写入，直到调用 stop，退出前写入剩余的字段"""
+        while not self.stopped.is_set():
+            try:
+                await asyncio.wait_for(self.stopped.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def stop(self):
+        self.stopped.set()
+
+    async def flush(self):
+        if not self.pending:
+            return
+
+        updates, self.pending = self.pending, {}
+        try:
+            await self.db_service.flush_task_updates(updates)
+            STATUS_WRITES.inc(len(updates), mode='batched')
+        except Exception as e:
+            logger.error("批量写入任务状态失败 - %s: %s", datetime.now(), e)
+            # 放回仍在处理的任务未写入的字段，写入期间产生的新值优先
+            for task_id, fields in updates.items():
+                if task_id in self.active:
+                    self.pending[task_id] = {**fields, **self.pending.get(task_id, {})}
@@ -0,0 +1,4 @@
+-- 记录领取任务的工作节点，多个副本同时运行时用于追踪任务归属
+ALTER TABLE ww_document_file_tasks
+    ADD COLUMN worker_id VARCHAR(128) NULL DEFAULT NULL AFTER status,
+    ADD INDEX idx_status_created_at (status, created_at);
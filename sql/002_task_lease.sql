@@ -0,0 +1,7 @@
+-- 任务租约：工作节点定时心跳续约并上报进度，租约过期的处理中任务重新排队
+ALTER TABLE ww_document_file_tasks
+    ADD COLUMN lease_expires_at DATETIME NULL DEFAULT NULL AFTER worker_id,
+    ADD COLUMN heartbeat_at DATETIME NULL DEFAULT NULL AFTER lease_expires_at,
+    ADD COLUMN progress_done INT NOT NULL DEFAULT 0 AFTER heartbeat_at,
+    ADD COLUMN progress_total INT NOT NULL DEFAULT 0 AFTER progress_done,
+    ADD INDEX idx_status_lease_expires_at (status, lease_expires_at);
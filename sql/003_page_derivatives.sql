@@ -0,0 +1,4 @@
+-- 与主图同一次解码生成的派生图路径，列名为 {PAGE_DERIVATIVES 中的名称}_path
+ALTER TABLE ww_document_pages
+    ADD COLUMN thumb_path VARCHAR(255) NULL DEFAULT NULL AFTER image_path,
+    ADD COLUMN preview_path VARCHAR(255) NULL DEFAULT NULL AFTER thumb_path;
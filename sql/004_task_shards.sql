@@ -0,0 +1,8 @@
+-- PDF分片：大PDF拆分为按页码区间的子任务(file_type = 'PDF分片')，全部完成后父任务合并
+-- page_count 在父任务上记录PDF总页数并标记其已拆分，在分片上用于按页数估算分片大小
+ALTER TABLE ww_document_file_tasks
+    ADD COLUMN parent_task_id BIGINT NULL DEFAULT NULL AFTER document_directory_id,
+    ADD COLUMN first_page INT NULL DEFAULT NULL AFTER parent_task_id,
+    ADD COLUMN last_page INT NULL DEFAULT NULL AFTER first_page,
+    ADD COLUMN page_count INT NULL DEFAULT NULL AFTER last_page,
+    ADD INDEX idx_parent_task_id (parent_task_id);
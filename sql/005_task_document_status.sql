@@ -0,0 +1,3 @@
+-- 领取任务时跳过同一文档已有任务在处理中的候选任务，按文档和状态查询
+ALTER TABLE ww_document_file_tasks
+    ADD INDEX idx_document_id_status (document_id, status);
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 配置在导入时读取，测试使用示例配置，不需要数据库
+os.environ.setdefault('CONFIG_PATH', os.path.join(ROOT_DIR, 'config.example.yaml'))
+
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
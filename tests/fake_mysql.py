@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""记录执行的SQL的 aiomysql 连接池替身，查询结果按查询文本预先设定"""
+import asyncio
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def execute(self, query, args=None):
+        query = ' '.join(query.split())
+        self.conn.executed.append((query, list(args or ())))
+        self.rowcount = 1
+        self.rows = next((rows for text, rows in self.conn.results if text in query), [])
+
+    async def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    async def fetchall(self):
+        return list(self.rows)
+
+    async def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self, results=()):
+        self.executed = []
+        self.commits = 0
+        self.results = list(results)  # (查询中包含的文本, 返回的行)
+
+    async def begin(self):
+        pass
+
+    def cursor(self, *args):
+        return _CursorContext(FakeCursor(self))
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        pass
+
+class _CursorContext:
+    """与 aiomysql 的 conn.cursor() 用法相同，既可以 await 也可以用于 async with"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __await__(self):
+        async def cursor():
+            return self.cursor
+        return cursor().__await__()
+
+    async def __aenter__(self):
+        return self.cursor
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+class FakePool:
+    def __init__(self, results=()):
+        self.conn = FakeConnection(results)
+
+    async def acquire(self):
+        return self.conn
+
+    def release(self, conn):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import os
+import zipfile
+
+import pytest
+
+from services import admission_service
+from services.admission_service import TaskCost, estimate_cost, _TASK_BASE_MEMORY
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(admission_service, 'FILE_PATH_PREFIX', str(tmp_path))
+    monkeypatch.setattr(admission_service, 'ZIP_MODE', 'extract')
+    admission_service._probe_cost.cache_clear()
+    yield tmp_path
+    admission_service._probe_cost.cache_clear()
+
+def write_zip(path, sizes):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for index, size in enumerate(sizes):
+            archive.writestr(f"1-目录-1/{index + 1}.jpg", b'x' * size)
+
+def test_fallback_estimate_not_cached(storage):
+    # 文件尚未上传完成时按数据库中的文件大小估算
+    assert estimate_cost('/a.zip', 1000) == TaskCost(memory=_TASK_BASE_MEMORY + 1000, disk=2000)
+
+    write_zip(storage / 'a.zip', [300, 500])
+    assert estimate_cost('/a.zip', 1000) == TaskCost(memory=_TASK_BASE_MEMORY + 1000, disk=800)
+
+def test_estimate_refreshed_when_file_changes(storage):
+    path = storage / 'a.zip'
+    write_zip(path, [300])
+    assert estimate_cost('/a.zip', 0).disk == 300
+
+    write_zip(path, [300, 400, 500])
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1))
+    assert estimate_cost('/a.zip', 0).disk == 1200
+
+def test_successful_probe_cached(storage, monkeypatch):
+    write_zip(storage / 'a.zip', [300])
+    estimate_cost('/a.zip', 0)
+    monkeypatch.setattr(admission_service.zipfile, 'ZipFile', None)
+    assert estimate_cost('/a.zip', 0).disk == 300
+
+def test_pdf_disk_cost_counts_one_render_chunk(storage, monkeypatch):
+    (storage / 'a.pdf').write_bytes(b'%PDF-1.4')
+    monkeypatch.setattr(admission_service, 'PDF_DPI', 72)
+    monkeypatch.setattr(admission_service, 'PDF_CHUNK_SIZE', 10)
+    monkeypatch.setattr(admission_service, 'pdfinfo_from_path', lambda path: {
+        'Pages': 500, 'Page size': '600 x 800 pts',
+    })
+
+    page_bytes = 600 * 800 * admission_service._JPEG_BYTES_PER_PIXEL
+    assert estimate_cost('/a.pdf', 0).disk == int(10 * page_bytes)
+    # 页数少于一块时按实际页数
+    assert estimate_cost('/a.pdf', 0, first_page=1, last_page=4).disk == int(4 * page_bytes)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import os
+import zipfile
+
+import pytest
+
+from services import image_service
+from services.image_service import ImageService, _ArchiveCache
+from models.source import ZipMember
+
+@pytest.fixture
+def archives(monkeypatch):
+    """不启动空闲回收线程的独立缓存"""
+    cache = _ArchiveCache(maxsize=2, idle_timeout=0)
+    monkeypatch.setattr(image_service, '_archives', cache)
+    yield cache
+    cache.close()
+
+def write_zip(path, members):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return str(path)
+
+def test_archive_opened_once(tmp_path, archives):
+    path = write_zip(tmp_path / 'a.zip', {'1.jpg': b'one', '2.jpg': b'two'})
+    assert archives.getinfo(path, '1.jpg').file_size == 3
+    archive = archives.archives[path][2]
+    with archives.open(path, '2.jpg') as member:
+        assert member.read() == b'two'
+    assert archives.archives[path][2] is archive
+
+def test_evicted_archive_closed(tmp_path, archives):
+    paths = [write_zip(tmp_path / f"{index}.zip", {'1.jpg': b'x'}) for index in range(3)]
+    archives.getinfo(paths[0], '1.jpg')
+    first = archives.archives[paths[0]][2]
+    archives.getinfo(paths[1], '1.jpg')
+    archives.getinfo(paths[0], '1.jpg')  # 最近使用，不被淘汰
+    second = archives.archives[paths[1]][2]
+    archives.getinfo(paths[2], '1.jpg')
+
+    assert list(archives.archives) == [paths[0], paths[2]]
+    assert second.fp is None
+    assert first.fp is not None
+
+def test_changed_archive_reopened(tmp_path, archives):
+    path = write_zip(tmp_path / 'a.zip', {'1.jpg': b'one'})
+    archives.getinfo(path, '1.jpg')
+    old = archives.archives[path][2]
+
+    write_zip(tmp_path / 'a.zip', {'1.jpg': b'one', '2.jpg': b'two'})
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1))
+    assert archives.getinfo(path, '2.jpg').file_size == 3
+    assert old.fp is None
+
+def test_close_archive_after_task(tmp_path, archives):
+    path = write_zip(tmp_path / 'a.zip', {'1.jpg': b'one'})
+    other = write_zip(tmp_path / 'b.zip', {'1.jpg': b'other'})
+    header = ImageService.open_header(ZipMember(path, '1.jpg'))
+    ImageService.source_size(ZipMember(other, '1.jpg'))
+    archive = archives.archives[path][2]
+
+    ImageService.close_archive(path)
+    assert list(archives.archives) == [other]
+    assert archive.fp is None
+    # 已打开的成员仍可读取
+    with header:
+        assert header.read() == b'one'
+
+    ImageService.close_archive()
+    assert archives.archives == {}
+
+def test_idle_archive_closed(tmp_path, archives):
+    path = write_zip(tmp_path / 'a.zip', {'1.jpg': b'one'})
+    recent = write_zip(tmp_path / 'b.zip', {'1.jpg': b'two'})
+    archives.getinfo(path, '1.jpg')
+    archives.getinfo(recent, '1.jpg')
+    archive = archives.archives[path][2]
+    # 第一个ZIP包已空闲超过 idle_timeout
+    mtime_ns, size, _, last_used = archives.archives[path]
+    archives.archives[path] = (mtime_ns, size, archive, last_used - 60)
+    archives.idle_timeout = 30
+
+    archives.close_idle()
+    assert list(archives.archives) == [recent]
+    assert archive.fp is None
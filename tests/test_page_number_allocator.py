@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from utils.helpers import PageNumberAllocator
+
+def test_free_page_number_is_kept():
+    allocator = PageNumberAllocator([1, 2])
+    assert allocator.allocate(5) == 5
+    assert allocator.max_page_number == 5
+
+def test_taken_page_number_moves_after_max():
+    allocator = PageNumberAllocator([1, 2, 3])
+    assert allocator.allocate(2) == 4
+    assert allocator.allocate(3) == 5
+
+def test_same_original_page_number_maps_to_same_page():
+    allocator = PageNumberAllocator([1])
+    assert allocator.allocate(1) == 2
+    assert allocator.allocate(1) == 2
+
+def test_allocated_page_numbers_are_unique():
+    allocator = PageNumberAllocator([2, 4])
+    allocated = [allocator.allocate(number) for number in (1, 2, 3, 4, 5, 6)]
+    assert allocated == [1, 5, 3, 6, 7, 8]
+    assert len(set(allocated) | {2, 4}) == len(allocated) + 2
+
+def test_empty_document():
+    allocator = PageNumberAllocator()
+    assert [allocator.allocate(number) for number in (3, 1, 2)] == [3, 1, 2]
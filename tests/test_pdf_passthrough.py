@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import subprocess
+
+import pytest
+
+from services.file_service import FileService
+
+IMAGES_HEADER = """page   num  type   width height color comp bpc  enc interp  object ID x-ppi y-ppi size ratio
+--------------------------------------------------------------------------------------------
+"""
+
+# A4 页面按 300dpi 扫描的整页JPEG
+FULL_PAGE_JPEG = "   {page}     {num} image    2480  3508  {color}     {comp}   8  {enc}   no        {obj}  0   300   300  653K 2.6%\n"
+
+def image_row(page, num=0, color='rgb', comp=3, enc='jpeg'):
+    return FULL_PAGE_JPEG.format(page=page, num=num, color=color, comp=comp, enc=enc, obj=10 + page * 10 + num)
+
+def page_info(pages, sizes=None, rotations=None):
+    lines = [f"Pages:          {pages}"]
+    for page in range(1, pages + 1):
+        width, height = (sizes or {}).get(page, (595.276, 841.89))
+        lines.append(f"Page {page:>4} size: {width} x {height} pts (A4)")
+        lines.append(f"Page {page:>4} rot:  {(rotations or {}).get(page, 0)}")
+    return '\n'.join(lines) + '\n'
+
+def page_text(pages, texts=None):
+    return ''.join((texts or {}).get(page, '') + '\f' for page in range(1, pages + 1))
+
+@pytest.fixture
+def poppler(monkeypatch):
+    """以预设的输出代替 poppler 命令行工具"""
+    outputs = {}
+
+    def run_poppler(command, *args):
+        if isinstance(outputs.get(command), Exception):
+            raise outputs[command]
+        return outputs[command]
+
+    monkeypatch.setattr(FileService, '_run_poppler', staticmethod(run_poppler))
+    return outputs
+
+def set_outputs(poppler, rows, pages, sizes=None, rotations=None, texts=None):
+    poppler['pdfimages'] = IMAGES_HEADER + ''.join(rows)
+    poppler['pdfinfo'] = page_info(pages, sizes, rotations)
+    poppler['pdftotext'] = page_text(pages, texts)
+
+def test_single_full_page_jpeg_accepted(poppler):
+    set_outputs(poppler, [image_row(1), image_row(2, color='gray', comp=1)], 2)
+    assert FileService.find_passthrough_pages('scan.pdf', 2) == {1, 2}
+
+def test_page_with_text_rejected(poppler):
+    set_outputs(poppler, [image_row(1), image_row(2)], 2, texts={2: '第二章 概述\n'})
+    assert FileService.find_passthrough_pages('scan.pdf', 2) == {1}
+
+def test_rotated_page_rejected(poppler):
+    set_outputs(poppler, [image_row(1), image_row(2)], 2, rotations={1: 90})
+    assert FileService.find_passthrough_pages('scan.pdf', 2) == {2}
+
+def test_page_with_several_images_rejected(poppler):
+    set_outputs(poppler, [image_row(1), image_row(1, num=1), image_row(2)], 2)
+    assert FileService.find_passthrough_pages('scan.pdf', 2) == {2}
+
+@pytest.mark.parametrize('enc', ['image', 'jpx', 'ccitt', 'jbig2'])
+def test_non_jpeg_encoding_rejected(poppler, enc):
+    set_outputs(poppler, [image_row(1, enc=enc)], 1)
+    assert FileService.find_passthrough_pages('scan.pdf', 1) == set()
+
+def test_cmyk_jpeg_rejected(poppler):
+    set_outputs(poppler, [image_row(1, color='cmyk', comp=4)], 1)
+    assert FileService.find_passthrough_pages('scan.pdf', 1) == set()
+
+def test_soft_mask_rejected(poppler):
+    row = image_row(1).replace(' image ', ' smask ')
+    set_outputs(poppler, [row], 1)
+    assert FileService.find_passthrough_pages('scan.pdf', 1) == set()
+
+def test_page_size_tolerance(poppler):
+    # 图片换算为 595.2 x 841.92 pts：偏差在 2% 以内接受，超过时拒绝
+    sizes = {1: (595.276, 841.89), 2: (601.0, 849.0), 3: (612.0, 792.0), 4: (595.276, 870.0)}
+    set_outputs(poppler, [image_row(page) for page in range(1, 5)], 4, sizes=sizes)
+    assert FileService.find_passthrough_pages('scan.pdf', 4) == {1, 2}
+
+def test_page_range_offsets_text(poppler):
+    # 只分析第 3-4 页时，pdftotext 的第一段对应第 3 页
+    set_outputs(poppler, [image_row(3), image_row(4)], 4)
+    poppler['pdftotext'] = 'OCR层文字\f\f'
+    assert FileService.find_passthrough_pages('scan.pdf', 4, first_page=3) == {4}
+
+def test_unknown_output_format_rejected(poppler):
+    set_outputs(poppler, [image_row(1)], 1)
+    poppler['pdfimages'] = poppler['pdfimages'].split('\n', 2)[2]
+    assert FileService.find_passthrough_pages('scan.pdf', 1) == set()
+
+def test_poppler_unavailable(poppler):
+    set_outputs(poppler, [image_row(1)], 1)
+    poppler['pdfimages'] = subprocess.CalledProcessError(1, 'pdfimages')
+    assert FileService.find_passthrough_pages('scan.pdf', 1) == set()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from config.settings import FILE_PATH_PREFIX, WORKER_ID
+from services.db_service import DatabaseService
+from services.file_service import FileService
+from tests.fake_mysql import FakePool
+
+def shard(shard_id, first_page, last_page, status='已完成'):
+    return {'id': shard_id, 'status': status, 'first_page': first_page, 'last_page': last_page}
+
+def test_shard_ranges_cover_every_page():
+    assert FileService.shard_ranges(250, 100) == [(1, 100), (101, 200), (201, 250)]
+
+def test_shard_ranges_exact_multiple():
+    assert FileService.shard_ranges(200, 100) == [(1, 100), (101, 200)]
+
+def test_shard_ranges_smaller_than_one_shard():
+    assert FileService.shard_ranges(7, 100) == [(1, 7)]
+    assert FileService.shard_ranges(1, 1) == [(1, 1)]
+
+def test_shard_ranges_empty_document():
+    assert FileService.shard_ranges(0, 100) == []
+
+def test_shard_pages_in_page_order():
+    shards = [shard(12, 4, 5), shard(10, 1, 3), shard(13, 6, 6)]
+    pages = FileService.shard_pages(9, shards)
+    assert [page.file_name for page in pages] == [f"page_{number}.jpg" for number in range(1, 7)]
+    assert pages[0].path == FILE_PATH_PREFIX + f"{FileService.shard_dir(9)}/page_1.jpg"
+    assert all(page.encoded and page.keep_source for page in pages)
+
+def test_shard_pages_rejects_unfinished_shard():
+    shards = [shard(10, 1, 3), shard(11, 4, 6, status='处理中')]
+    with pytest.raises(Exception, match='11'):
+        FileService.shard_pages(9, shards)
+
+def test_reclaim_locks_parents_before_shards():
+    pool = FakePool([('SELECT DISTINCT parent_task_id', [(10,), (7,)])])
+    _, failed = asyncio.run(DatabaseService(pool).reclaim_expired_tasks(lease_duration=60, max_retry=3))
+
+    queries = [query for query, _ in pool.conn.executed]
+    lock = next(index for index, query in enumerate(queries) if query.endswith('ORDER BY id FOR UPDATE'))
+    update = next(index for index, query in enumerate(queries) if query.startswith('UPDATE'))
+    assert lock < update
+    assert pool.conn.executed[lock][1] == [7, 10]
+    # 只回收已锁定父任务的分片
+    assert '(parent_task_id IS NULL OR parent_task_id IN (%s,%s))' in queries[update]
+    assert pool.conn.executed[update][1] == [3, 60, 7, 10]
+    assert failed == []
+
+def test_reclaim_without_expired_shards_skips_parent_lock():
+    pool = FakePool()
+    asyncio.run(DatabaseService(pool).reclaim_expired_tasks(lease_duration=60, max_retry=3))
+
+    queries = [query for query, _ in pool.conn.executed]
+    assert not any('FOR UPDATE' in query for query in queries)
+    assert any(query.startswith('UPDATE') and query.endswith('AND parent_task_id IS NULL') for query in queries)
+
+def test_complete_shard_locks_parent_first():
+    pool = FakePool([
+        ('SELECT status FROM', [('分片处理中',)]),
+        ('SELECT worker_id, status FROM', [(WORKER_ID, '处理中')]),
+        ('SELECT COUNT(*)', [(0,)]),
+    ])
+    assert asyncio.run(DatabaseService(pool).complete_shard(11, 10)) == '待合并'
+
+    queries = [query for query, _ in pool.conn.executed]
+    assert queries[0].startswith('SELECT status FROM') and queries[0].endswith('FOR UPDATE')
+    assert pool.conn.executed[0][1] == [10]
+    assert queries[1].startswith('SELECT worker_id, status FROM')
+    assert pool.conn.executed[1][1] == [11]
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from services.db_service import DatabaseService, TaskSession
+from services.status_service import StatusWriter
+from tests.fake_mysql import FakePool
+
+def test_flush_task_updates_single_statement():
+    pool = FakePool()
+    db = DatabaseService(pool)
+    updates = {
+        1: {'progress_done': 3, 'progress_total': 10},
+        2: {'started_at': 'now', 'progress_done': 1, 'progress_total': 5},
+    }
+
+    assert asyncio.run(db.flush_task_updates(updates, worker_id='w1')) == 1
+    assert len(pool.conn.executed) == 1
+    assert pool.conn.commits == 1
+
+    query, args = pool.conn.executed[0]
+    assert query.startswith('UPDATE ww_document_file_tasks SET progress_done = CASE id WHEN %s THEN %s WHEN %s THEN %s')
+    assert "started_at = CASE id WHEN %s THEN %s ELSE started_at END" in query
+    assert "WHERE id IN (%s,%s) AND worker_id = %s AND status = '处理中'" in query
+    # 列按名称排序：progress_done, progress_total, started_at
+    assert args == [1, 3, 2, 1, 1, 10, 2, 5, 2, 'now', 1, 2, 'w1']
+
+def test_flush_task_updates_nothing_pending():
+    pool = FakePool()
+    assert asyncio.run(DatabaseService(pool).flush_task_updates({})) == 0
+    assert pool.conn.executed == []
+
+def test_progress_coalesced_per_task():
+    pool = FakePool()
+    writer = StatusWriter(DatabaseService(pool))
+    writer.started(1)
+    for done in range(1, 6):
+        writer.progress(1, done, 5)
+    writer.progress(2, 1, 5)  # 未开始的任务不记录
+
+    assert set(writer.pending) == {1}
+    assert writer.pending[1]['progress_done'] == 5
+
+    asyncio.run(writer.flush())
+    assert len(pool.conn.executed) == 1
+    assert writer.pending == {}
+
+def test_terminal_status_written_immediately_with_pending_fields():
+    pool = FakePool()
+    db = DatabaseService(pool)
+    writer = StatusWriter(db)
+
+    async def run():
+        async with TaskSession(db, writer) as session:
+            await session.update_task_status(1, '处理中')
+            writer.progress(1, 4, 8)
+            assert pool.conn.executed == []
+
+            await session.update_task_status(1, '已失败', failure_reason='boom')
+            assert len(pool.conn.executed) == 1
+
+        # 终态写入后不再批量写入
+        writer.progress(1, 8, 8)
+        await writer.flush()
+
+    asyncio.run(run())
+    assert len(pool.conn.executed) == 1
+    query, args = pool.conn.executed[0]
+    assert 'status = %s' in query and 'failed_at = %s' in query
+    assert 'progress_done = %s' in query and 'started_at = %s' in query
+    assert args[0] == '已失败'
+    assert 'boom' in args and 4 in args and 8 in args
+    assert args[-1] == 1
+    assert writer.pending == {}
+
+def test_closed_session_drops_pending_fields():
+    pool = FakePool()
+    db = DatabaseService(pool)
+    writer = StatusWriter(db)
+
+    async def run():
+        async with TaskSession(db, writer) as session:
+            await session.update_task_status(1, '处理中')
+            writer.progress(1, 2, 8)
+        await writer.flush()
+
+    asyncio.run(run())
+    assert pool.conn.executed == []
+    assert writer.active == set()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import io
+
+from PIL import Image, ImageCms
+
+from services.image_service import ImageService
+
+def make_jpeg():
+    img = Image.new('RGB', (32, 16), (200, 30, 60))
+    exif = Image.Exif()
+    exif[274] = 6  # Orientation: 顺时针旋转90度
+    icc = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+    output = io.BytesIO()
+    img.save(output, 'JPEG', exif=exif.tobytes(), icc_profile=icc, comment=b'scanner')
+    return output.getvalue()
+
+def app_markers(data):
+    markers = []
+    pos = 2
+    while data[pos + 1] != 0xDA:
+        markers.append(data[pos + 1])
+        pos += 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+    return markers
+
+def test_exif_icc_and_comment_removed():
+    data = make_jpeg()
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.getexif().get(274) == 6
+        assert img.info.get('icc_profile')
+
+    stripped = ImageService.strip_jpeg_metadata(data)
+    markers = app_markers(stripped)
+    assert 0xE1 not in markers
+    assert 0xE2 not in markers
+    assert 0xFE not in markers
+    with Image.open(io.BytesIO(stripped)) as img:
+        assert 274 not in img.getexif()
+        assert 'icc_profile' not in img.info
+
+def test_stripped_output_still_decodes():
+    data = make_jpeg()
+    stripped = ImageService.strip_jpeg_metadata(data)
+    assert len(stripped) < len(data)
+    with Image.open(io.BytesIO(data)) as original, Image.open(io.BytesIO(stripped)) as img:
+        assert img.size == original.size
+        assert img.tobytes() == original.tobytes()
+
+def test_scan_data_kept_verbatim():
+    data = make_jpeg()
+    stripped = ImageService.strip_jpeg_metadata(data)
+    assert stripped.endswith(data[data.index(b'\xff\xda'):])
+
+def test_non_jpeg_returned_unchanged():
+    data = b'\x89PNG\r\n\x1a\n'
+    assert ImageService.strip_jpeg_metadata(data) is data
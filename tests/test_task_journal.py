@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import pytest
+
+from services import checkpoint_service
+from services.checkpoint_service import TaskJournal
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """输出文件写入临时目录"""
+    monkeypatch.setattr(checkpoint_service, 'FILE_PATH_PREFIX', str(tmp_path))
+    return tmp_path
+
+def write_output(storage, target):
+    path = str(storage) + target
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'jpg')
+
+def test_load_resumes_checkpointed_pages(storage):
+    journal_dir = str(storage / 'journals')
+    journal = TaskJournal(7, journal_dir=journal_dir, interval=2)
+    journal.load()
+    for page_number in range(1, 5):
+        target = f"/pages/{page_number}.jpg"
+        journal.start(f"p{page_number}", page_number, target)
+        write_output(storage, target)
+        if journal.done(f"p{page_number}"):
+            journal.flush()
+
+    # 第 5、6 页同时在转换，第 5 页完成后尚未到达检查点，第 6 页未完成
+    for page_number in (5, 6):
+        journal.start(f"p{page_number}", page_number, f"/pages/{page_number}.jpg")
+        write_output(storage, f"/pages/{page_number}.jpg")
+    assert not journal.done('p5')
+
+    # 模拟进程中断：只保留已写入操作系统的内容，丢弃缓冲区中第 5 页的 done 记录
+    with open(journal.path, 'r', encoding='utf-8') as f:
+        persisted = f.read()
+    journal.file.close()
+    with open(journal.path, 'w', encoding='utf-8') as f:
+        f.write(persisted)
+
+    assert '"op": "done", "key": "p4"' in persisted
+    assert '"op": "done", "key": "p5"' not in persisted
+
+    resumed = TaskJournal(7, journal_dir=journal_dir, interval=2)
+    unfinished = resumed.load()
+    resumed.close()
+
+    assert set(resumed.entries) == {'p1', 'p2', 'p3', 'p4'}
+    assert resumed.entries['p3'] == {'op': 'start', 'key': 'p3', 'page_number': 3, 'target': '/pages/3.jpg'}
+    # 只有 start 记录的页面输出不完整，需要回收
+    assert sorted(unfinished) == ['/pages/5.jpg', '/pages/6.jpg']
+    assert resumed.targets == {f"/pages/{page_number}.jpg" for page_number in range(1, 7)}
+
+def test_load_drops_done_pages_without_output(storage):
+    journal_dir = str(storage / 'journals')
+    journal = TaskJournal(8, journal_dir=journal_dir, interval=1)
+    journal.load()
+    for page_number in (1, 2):
+        target = f"/pages/{page_number}.jpg"
+        journal.start(f"p{page_number}", page_number, target)
+        write_output(storage, target)
+        journal.done(f"p{page_number}")
+    journal.close()
+    os.remove(str(storage) + '/pages/2.jpg')
+
+    resumed = TaskJournal(8, journal_dir=journal_dir)
+    unfinished = resumed.load()
+    resumed.close()
+
+    assert set(resumed.entries) == {'p1'}
+    assert unfinished == []
+
+def test_load_skips_truncated_last_line(storage):
+    journal_dir = storage / 'journals'
+    journal_dir.mkdir()
+    write_output(storage, '/pages/1.jpg')
+    write_output(storage, '/pages/2.jpg')
+    records = [
+        {'op': 'start', 'key': 'p1', 'page_number': 1, 'target': '/pages/1.jpg'},
+        {'op': 'done', 'key': 'p1'},
+        {'op': 'start', 'key': 'p2', 'page_number': 2, 'target': '/pages/2.jpg'},
+    ]
+    with open(journal_dir / '9.jsonl', 'w', encoding='utf-8') as f:
+        f.write(''.join(json.dumps(record) + '\n' for record in records))
+        f.write('{"op": "done", "ke')
+
+    resumed = TaskJournal(9, journal_dir=str(journal_dir))
+    unfinished = resumed.load()
+
+    assert set(resumed.entries) == {'p1'}
+    assert unfinished == ['/pages/2.jpg']
+
+    # 继续追加的记录另起一行，不与截断的行拼接
+    resumed.start('p3', 3, '/pages/3.jpg')
+    resumed.close()
+    assert TaskJournal.read_targets(resumed.path) == {'/pages/1.jpg', '/pages/2.jpg', '/pages/3.jpg'}
+
+def test_reused_page_start_record_is_not_reclaimed(storage):
+    journal_dir = str(storage / 'journals')
+    journal = TaskJournal(10, journal_dir=journal_dir, interval=1)
+    journal.load()
+    journal.start('p1', 1, '/pages/1.jpg')
+    write_output(storage, '/pages/1.jpg')
+    journal.done('p1')
+    # 重试时复用第 1 页，再次写入 start 记录后中断
+    journal.start('p1', 1, '/pages/1.jpg')
+    journal.close()
+
+    resumed = TaskJournal(10, journal_dir=journal_dir)
+    unfinished = resumed.load()
+    resumed.close()
+
+    assert unfinished == []
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import os
+import zipfile
+
+from services.file_service import FileService
+
+class RawNameInfo(zipfile.ZipInfo):
+    """名称按原始字节写入且不标记UTF-8的成员，模拟 Windows 压缩工具生成的ZIP包"""
+
+    def __init__(self, raw_name):
+        super().__init__(raw_name.decode('cp437'))
+
+    def _encodeFilenameFlags(self):
+        return self.filename.encode('cp437'), self.flag_bits
+
+def write_zip(path, members):
+    """members: [(名称或原始字节, 数据)]，字符串名称由 zipfile 按UTF-8写入并标记"""
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, data in members:
+            archive.writestr(RawNameInfo(name) if isinstance(name, bytes) else name, data)
+    return str(path)
+
+def decoded_names(path):
+    with zipfile.ZipFile(path, 'r') as zip_ref:
+        return [filename for _, filename in FileService.decode_zip_names(zip_ref)]
+
+def test_gbk_names_decoded(tmp_path):
+    path = write_zip(tmp_path / 'a.zip', [
+        ('1-目录-1/'.encode('gbk'), b''), ('1-目录-1/1-封面.jpg'.encode('gbk'), b'x'),
+    ])
+    assert decoded_names(path) == ['1-目录-1/', '1-目录-1/1-封面.jpg']
+
+def test_mixed_flagged_and_gbk_names(tmp_path):
+    # 标记UTF-8的名称保持不变，未标记的名称按GBK解码
+    path = write_zip(tmp_path / 'a.zip', [
+        ('1-目录-1/1-封面.jpg', b'x'),
+        ('2-附件-1/2-说明.jpg'.encode('gbk'), b'x'),
+    ])
+    assert decoded_names(path) == ['1-目录-1/1-封面.jpg', '2-附件-1/2-说明.jpg']
+
+def test_unflagged_names_decoded_per_member(tmp_path):
+    # 未标记的名称中既有UTF-8又有GBK，整个ZIP包没有通用编码时各成员分别检测
+    path = write_zip(tmp_path / 'a.zip', [
+        ('1-目录-1/1-封面.jpg'.encode('utf-8'), b'x'),
+        ('2-附件-1/2-说明.jpg'.encode('gbk'), b'x'),
+        (b'3-\xff\xfe.jpg', b'x'),
+    ])
+    assert decoded_names(path) == ['1-目录-1/1-封面.jpg', '2-附件-1/2-说明.jpg', b'3-\xff\xfe.jpg'.decode('cp437')]
+
+def test_plan_strips_parent_references(tmp_path):
+    path = write_zip(tmp_path / 'a.zip', [
+        ('../../etc/1.jpg', b'x'), ('./目录/../2.jpg', b'y'), ('/3.jpg', b'z'), ('../', b''),
+    ])
+    temp_dir = str(tmp_path / 'out')
+    buckets = FileService.plan_zip_extraction(path, temp_dir, thread_count=1)
+
+    targets = sorted(target_path for bucket in buckets for _, target_path in bucket)
+    assert targets == sorted(os.path.join(temp_dir, *parts) for parts in (('etc', '1.jpg'), ('目录', '2.jpg'), ('3.jpg',)))
+    assert all(target_path.startswith(temp_dir + os.sep) for target_path in targets)
+    assert not os.path.exists(tmp_path / 'etc')
+
+def test_plan_balances_buckets_by_size(tmp_path):
+    sizes = [900, 500, 400, 300, 200, 100]
+    path = write_zip(tmp_path / 'a.zip', [(f"{index}.jpg", b'x' * size) for index, size in enumerate(sizes)])
+    buckets = FileService.plan_zip_extraction(path, str(tmp_path / 'out'), thread_count=2)
+
+    loads = sorted(sum(sizes[int(file.split('.')[0])] for file, _ in bucket) for bucket in buckets)
+    assert loads == [1200, 1200]
+    assert sorted(file for bucket in buckets for file, _ in bucket) == [f"{index}.jpg" for index in range(6)]
+
+def test_plan_never_creates_empty_buckets(tmp_path):
+    path = write_zip(tmp_path / 'a.zip', [('1.jpg', b'x'), ('目录/', b'')])
+    buckets = FileService.plan_zip_extraction(path, str(tmp_path / 'out'), thread_count=4)
+    assert [[file for file, _ in bucket] for bucket in buckets] == [['1.jpg']]
+    assert os.path.isdir(tmp_path / 'out' / '目录')
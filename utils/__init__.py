@@ -1,3 +1,3 @@
 # -*- coding: utf-8 -*-
 from .logger import logger
-from .helpers import parse_directory_name, extract_page_number, parse_file_name
\ No newline at end of file
+from .helpers import parse_directory_name, extract_page_number, parse_file_name, PageNumberAllocator
\ No newline at end of file
@@ -3,6 +3,17 @@ import os
 import re
 from utils.logger import logger
 
+def as_async_iterable(iterable):
+    """把同步可迭代对象包装为异步迭代器，已是异步迭代器时原样返回"""
+    if hasattr(iterable, '__aiter__'):
+        return iterable
+
+    async def iterate():
+        for item in iterable:
+            yield item
+
+    return iterate()
+
 def parse_directory_name(dir_name):
     """解析目录名称，提起始页/名称/序列号"""
     dir_parts = dir_name.split('-')
@@ -16,13 +27,13 @@ def parse_directory_name(dir_name):
             number = dir_parts[-1].strip()
             name = '-'.join(dir_parts[1:-1]).strip()
         except ValueError:
-            logger.warning(f"Invalid directory format: {dir_name}, using defaults")
+            logger.warning("Invalid directory format: %s, using defaults", dir_name)
     elif len(dir_parts) == 2:
         try:
             start_page = dir_parts[0].strip()
             name = dir_parts[1].strip()
         except ValueError:
-            logger.warning(f"Invalid directory format: {dir_name}, using defaults")
+            logger.warning("Invalid directory format: %s, using defaults", dir_name)
         
     return number, name, start_page
 
@@ -38,3 +49,28 @@ def parse_file_name(file_name):
         page_number = int(match.group(1))
         return page_number, match.group(1)
     return 0, file_name
+
+class PageNumberAllocator:
+    """基于文档已有页码集合在内存中分配页码"""
+
+    def __init__(self, existing_page_numbers=()):
+        self.used = set(existing_page_numbers)
+        self.max_page_number = max(self.used, default=0)
+        self.mapping = {}  # 原始页码 -> 实际页码
+
+    def allocate(self, original_page_number):
+        """分配页码，原始页码已被占用时顺延到当前最大页码之后"""
+        if original_page_number in self.mapping:
+            return self.mapping[original_page_number]
+
+        if original_page_number in self.used:
+            self.max_page_number += 1
+            actual_page_number = self.max_page_number
+        else:
+            actual_page_number = original_page_number
+            if actual_page_number > self.max_page_number:
+                self.max_page_number = actual_page_number
+
+        self.used.add(actual_page_number)
+        self.mapping[original_page_number] = actual_page_number
+        return actual_page_number
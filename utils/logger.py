@@ -1,11 +1,81 @@
 # -*- coding: utf-8 -*-
+import atexit
+import copy
+import json
 import logging
+import multiprocessing
+import queue
+import random
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from config.settings import LOG_LEVEL, LOG_FORMAT, LOG_PAGE_SAMPLE
+
+# LogRecord 的标准属性，其余属性为通过 extra 传入的结构化字段
+_RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime', 'taskName'}
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，extra 中的字段原样输出"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class LazyQueueHandler(QueueHandler):
+    """入队时只生成消息文本的快照，时间、级别等格式化和输出在监听线程中进行
+
+    与 QueueHandler.prepare 一样先合并参数、把异常转为文本，
+    避免参数或异常对象在入队后被修改；extra 中的字段保留给格式化器输出
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
 def setup_logger():
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s'
-    )
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+
+    if multiprocessing.current_process().name != 'MainProcess':
+        # 转换进程退出时不执行 atexit，不使用监听线程，直接输出(转换进程没有事件循环，不会被阻塞)
+        root.handlers[:] = [handler]
+        return logging.getLogger(__name__)
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    # 退出时输出队列中剩余的日志
+    atexit.register(listener.stop)
+
+    root.handlers[:] = [LazyQueueHandler(log_queue)]
     return logging.getLogger(__name__)
 
-logger = setup_logger()
\ No newline at end of file
+logger = setup_logger()
+
+def log_page(message, *args, **fields):
+    """按 LOG_PAGE_SAMPLE 采样记录单个页面的调试事件，未启用 DEBUG 时不做任何格式化"""
+    if LOG_PAGE_SAMPLE > 0 and logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_PAGE_SAMPLE:
+        logger.debug(message, *args, extra=fields)
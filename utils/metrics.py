@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from utils.logger import logger
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """指标基类，按标签值分别记录"""
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    """只增不减的计数器"""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """可增可减的当前值"""
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    """按区间统计观测值分布"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """记录代码块的执行耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total) in self.values.items():
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key + (('le', _format_value(bound)),), count))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, counts[-1]))
+        return samples
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            return self.metrics[metric.name]
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """以 Prometheus 文本格式输出全部指标"""
+        return '\n'.join(metric.render() for metric in self.metrics.values()) + '\n'
+
+class MetricsServer:
+    """内置的轻量HTTP服务，在 /metrics 输出 Prometheus 文本格式的指标"""
+
+    def __init__(self, registry, host, port):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info("指标服务已启动: http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+            while True:
+                header = await asyncio.wait_for(reader.readline(), timeout=10)
+                if header in (b'\r\n', b'\n', b''):
+                    break
+
+            parts = request_line.decode('latin-1').split()
+            path = parts[1].split('?')[0] if len(parts) >= 2 else ''
+
+            if path == '/metrics':
+                status = '200 OK'
+                body = self.registry.render().encode('utf-8')
+            else:
+                status = '404 Not Found'
+                body = b'not found\n'
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+# 全局指标注册表
+registry = Registry()
+
+FETCH_TASKS_SECONDS = registry.histogram('edoc_fetch_tasks_seconds', '获取任务耗时')
+TASK_SECONDS = registry.histogram('edoc_task_seconds', '单个任务处理总耗时', ['status'])
+TASKS_TOTAL = registry.counter('edoc_tasks_total', '处理结束的任务数', ['status'])
+EXTRACT_SECONDS = registry.histogram('edoc_extract_seconds', '解压/渲染/扫描源文件耗时', ['kind'])
+PAGE_CONVERT_SECONDS = registry.histogram('edoc_page_convert_seconds', '单页转换耗时(含等待执行器)', ['kind'])
+PAGE_ENCODE_SECONDS = registry.histogram('edoc_page_encode_seconds', '单页在执行器中解码/编码的耗时')
+PAGES_TOTAL = registry.counter('edoc_pages_total', '写入数据库的页面数')
+DB_INSERT_SECONDS = registry.histogram('edoc_db_insert_seconds', '批量插入耗时', ['table'])
+DB_COMMIT_SECONDS = registry.histogram('edoc_db_commit_seconds', '事务提交耗时')
+DB_POOL_WAIT_SECONDS = registry.histogram('edoc_db_pool_wait_seconds', '从连接池获取连接的等待耗时')
+DB_POOL_IN_USE = registry.gauge('edoc_db_pool_in_use', '已借出的数据库连接数')
+PAGE_CACHE_REQUESTS = registry.counter('edoc_page_cache_requests_total', '页面缓存查询次数', ['result'])
+QUEUE_DEPTH = registry.gauge('edoc_queue_depth', '已领取等待处理的任务数')
+ACTIVE_WORKERS = registry.gauge('edoc_active_workers', '正在处理任务的工作协程数')
+LEASES_RECLAIMED = registry.counter('edoc_leases_reclaimed_total', '租约过期后重新排队的任务数')
+LEASES_LOST = registry.counter('edoc_leases_lost_total', '本节点处理中被回收租约的任务数')
+STATUS_WRITES = registry.counter('edoc_status_writes_total', '写入数据库的任务状态/进度行数', ['mode'])
+WAKEUPS_TOTAL = registry.counter('edoc_wakeups_total', '收到的唤醒通知数')
+DECODE_MEMORY_BYTES = registry.gauge('edoc_decode_memory_bytes', '正在解码的图片按文件头估算的内存总量')
+ADMITTED_MEMORY_BYTES = registry.gauge('edoc_admitted_memory_bytes', '已领取任务的估算内存总量')
+ADMITTED_DISK_BYTES = registry.gauge('edoc_admitted_disk_bytes', '已领取任务的估算临时目录占用总量')